@@ -0,0 +1,97 @@
+"""
+Local stand-in for the Dianping site serving the captured pages in
+tests/fixtures (point DIANPING_ORIGIN at it).
+
+- /shop/<id>       the shop detail fixture
+- anything else    the list fixture (city homepages and category rankings),
+                   padded to a full page of shops with ids unique per URL
+
+Every page carries the fake logged-in `.userinfo-container .username`, so
+session revalidation succeeds. --delay-ms adds simulated upstream latency.
+
+Usage:
+
+python -m bench.fixture_server [--port 8800] [--delay-ms 0]
+"""
+
+import argparse
+import hashlib
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+FIXTURES = Path(__file__).resolve().parent.parent / "tests" / "fixtures"
+SHOPS_PER_PAGE = 15
+
+_SHOP_ITEM = re.compile(r"\s*<li>.*?</li>", re.S)
+_SHOP_ID = re.compile(r"/shop/([A-Za-z0-9]+)")
+
+
+def render_list_page(template: str, path: str) -> str:
+    """Repeat the fixture's shops to a full page, with shop ids derived from path"""
+    items = _SHOP_ITEM.findall(template)
+    if not items:
+        return template
+    salt = hashlib.md5(path.encode("utf-8")).hexdigest()[:6]
+    shops = []
+    for i in range(SHOPS_PER_PAGE):
+        item = items[i % len(items)]
+        shops.append(_SHOP_ID.sub(lambda m: f"/shop/{m.group(1)}{salt}{i}", item))
+    start = template.index(items[0])
+    end = template.index(items[-1]) + len(items[-1])
+    return template[:start] + "".join(shops) + template[end:]
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    list_template = ""
+    detail_page = b""
+    delay = 0.0
+
+    def do_GET(self):
+        if self.delay:
+            time.sleep(self.delay)
+        path = self.path.split("?")[0]
+        if path.startswith("/shop/"):
+            body = self.detail_page
+        elif path == "/favicon.ico":
+            self.send_error(404)
+            return
+        else:
+            body = render_list_page(self.list_template, path).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fixture_server(port: int = 0, delay: float = 0.0) -> ThreadingHTTPServer:
+    """Serve the fixtures on 127.0.0.1:port in a daemon thread (port 0 picks a free one)"""
+    handler = type("Handler", (FixtureHandler,), {
+        "list_template": (FIXTURES / "shop_list.html").read_text(encoding="utf-8"),
+        "detail_page": (FIXTURES / "shop_detail.html").read_bytes(),
+        "delay": delay,
+    })
+    httpd = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the Dianping page fixtures locally")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--delay-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    httpd = start_fixture_server(args.port, args.delay_ms / 1000)
+    print(f"Serving fixtures on http://127.0.0.1:{httpd.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        httpd.shutdown()
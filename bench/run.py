@@ -0,0 +1,213 @@
+"""
+Offline benchmark of the Dianping tools against bench/fixture_server.py.
+
+Drives the real tool paths (context pool, page loads, extraction, caching) in
+headless Chromium, with the upstream origin pointed at the local fixture
+server and every other host aborted, so no network access or login is
+needed: a throwaway auth.json with a fake session cookie is used.
+Requires the Playwright Chromium build (`playwright install chromium`).
+
+Usage:
+
+python -m bench.run [--tool detail|rank|mixed] [--requests 200] [--concurrency 4]
+                    [--keys 0] [--delay-ms 0] [--json]
+
+--keys N cycles through N distinct shops / rankings, so repeats are served
+from the result cache (default 0: every request is a distinct cache miss).
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import resource
+import tempfile
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import server
+from browser_pool import ContextPool, ResourceBlocker
+from cache import ResultCache
+from catalog import get_catalog
+from session import SESSION_COOKIE
+from throttle import Throttle
+from bench.fixture_server import start_fixture_server
+
+RSS_INTERVAL = 0.5  # Seconds between RSS samples
+
+
+class OfflineBlocker(ResourceBlocker):
+    """Abort every request that is not for the local fixture server"""
+
+    def __init__(self, origin: str):
+        super().__init__()
+        self.host = urlsplit(origin).hostname
+
+    @property
+    def enabled(self) -> bool:
+        return True
+
+    def should_block(self, resource_type: str, url: str) -> bool:
+        return urlsplit(url).hostname != self.host or super().should_block(resource_type, url)
+
+
+def write_fake_auth(path: Path):
+    """Storage state with a session cookie, enough for detect_auth_failure"""
+    cookie = {"name": SESSION_COOKIE, "value": "bench", "domain": ".dianping.com", "path": "/",
+              "expires": -1, "httpOnly": False, "secure": False, "sameSite": "Lax"}
+    path.write_text(json.dumps({"cookies": [cookie], "origins": []}))
+
+
+def rss_bytes() -> int:
+    """Resident memory of this process plus its children (Chromium)
+
+    Read from /proc; elsewhere falls back to this process's peak RSS.
+    """
+    proc = Path("/proc")
+    if not proc.is_dir():
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    processes = {}
+    for entry in proc.iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            fields = (entry / "stat").read_text().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        processes[int(entry.name)] = (int(fields[1]), int(fields[21]))  # ppid, rss pages
+    tree = {os.getpid()}
+    grown = True
+    while grown:
+        children = {pid for pid, (ppid, _) in processes.items() if ppid in tree} - tree
+        tree |= children
+        grown = bool(children)
+    return sum(processes[pid][1] for pid in tree if pid in processes) * os.sysconf("SC_PAGE_SIZE")
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(q * len(sorted_values)) - 1)]
+
+
+def make_calls(tool: str, requests: int, keys: int) -> list:
+    """The tool calls to issue, as coroutine factories"""
+    rankings = [(category, sort) for category in get_catalog().categories.names for sort in server.SORT_CODES]
+    calls = []
+    for n in range(requests):
+        key = n % keys if keys else n
+        kind = tool if tool != "mixed" else ("rank" if n % 2 else "detail")
+        if kind == "detail":
+            calls.append(lambda key=key: server.dianping_shop_detail(f"bench{key}"))
+        else:
+            category, sort = rankings[key % len(rankings)]
+            calls.append(lambda category=category, sort=sort: server.dianping_category_rank(
+                "beijing", category, sort=sort))
+    return calls
+
+
+async def sample_rss(samples: list, started: float):
+    while True:
+        samples.append((time.perf_counter() - started, rss_bytes()))
+        await asyncio.sleep(RSS_INTERVAL)
+
+
+async def run(args) -> dict:
+    httpd = start_fixture_server(delay=args.delay_ms / 1000)
+    origin = f"http://127.0.0.1:{httpd.server_address[1]}"
+    cwd = os.getcwd()
+    workdir = tempfile.TemporaryDirectory()
+    write_fake_auth(Path(workdir.name) / "auth.json")
+    # server.py reads ./auth.json
+    os.chdir(workdir.name)
+    server.ORIGIN = origin
+    server._pool = ContextPool(server.get_browser, blocker=OfflineBlocker(origin))
+    server._cache = ResultCache(db_path="")
+    # The stand-in has no anti-bot limits to respect
+    server._throttle = Throttle(rate=0)
+
+    try:
+        if not await server.initialize_browser():
+            raise SystemExit("Chromium failed to start (run `playwright install chromium`)")
+
+        calls = make_calls(args.tool, args.requests, args.keys)
+        latencies = []
+        errors = 0
+        slots = asyncio.Semaphore(args.concurrency)
+
+        async def issue(call):
+            nonlocal errors
+            async with slots:
+                call_started = time.perf_counter()
+                try:
+                    result = await call()
+                except Exception:
+                    result = {}
+                latencies.append(time.perf_counter() - call_started)
+                if not result.get("success"):
+                    errors += 1
+
+        rss_samples = []
+        started = time.perf_counter()
+        sampler = asyncio.create_task(sample_rss(rss_samples, started))
+        await asyncio.gather(*[issue(call) for call in calls])
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+        rss_samples.append((elapsed, rss_bytes()))
+        phases = server._timings.summary()
+    finally:
+        await server.shutdown_browser()
+        httpd.shutdown()
+        os.chdir(cwd)
+        workdir.cleanup()
+
+    latencies.sort()
+    return {
+        "tool": args.tool,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "keys": args.keys,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            f"p{int(q * 100)}": round(percentile(latencies, q) * 1000, 1) for q in (0.5, 0.95, 0.99)
+        },
+        "rss_mb": [(round(t, 1), round(rss / 2**20, 1)) for t, rss in rss_samples],
+        "phases": phases,
+    }
+
+
+def print_report(report: dict):
+    rss = [mb for _, mb in report["rss_mb"]]
+    latency = report["latency_ms"]
+    print(f"{report['tool']}: {report['requests']} requests at concurrency {report['concurrency']} "
+          f"({report['keys'] or 'all'} distinct keys)")
+    print(f"  elapsed     {report['elapsed_s']}s, {report['errors']} errors")
+    print(f"  throughput  {report['throughput_rps']} req/s")
+    print(f"  latency     p50 {latency['p50']}ms  p95 {latency['p95']}ms  p99 {latency['p99']}ms")
+    print(f"  rss         start {rss[0]}MB  peak {max(rss)}MB  end {rss[-1]}MB")
+    print(f"  phases      {report['phases']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Dianping tools against local fixtures")
+    parser.add_argument("--tool", choices=["detail", "rank", "mixed"], default="detail")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--keys", type=int, default=0)
+    parser.add_argument("--delay-ms", type=float, default=0, help="simulated upstream latency")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="keep the server's INFO logging")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
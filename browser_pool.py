@@ -0,0 +1,306 @@
+"""
+Pool of authenticated Playwright BrowserContexts shared across tool calls.
+
+A context is keyed by its auth identity (the storage state file and its mtime),
+so re-running get_auth.py transparently rolls the pool over to fresh contexts.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Pool settings (overridable through the environment)
+MAX_CONTEXTS = int(os.environ.get("DIANPING_POOL_MAX_CONTEXTS", "2"))
+MAX_PAGES_PER_CONTEXT = int(os.environ.get("DIANPING_POOL_MAX_PAGES_PER_CONTEXT", "50"))
+IDLE_TIMEOUT = float(os.environ.get("DIANPING_POOL_IDLE_TIMEOUT", "300"))
+
+# Navigation profile: resource types and tracker hosts aborted in every pooled
+# context (set either variable to an empty string to disable that part)
+BLOCK_RESOURCE_TYPES = os.environ.get("DIANPING_BLOCK_RESOURCES", "image,media,font")
+BLOCK_HOSTS = os.environ.get(
+    "DIANPING_BLOCK_HOSTS",
+    "hm.baidu.com,google-analytics.com,googletagmanager.com,"
+    "lx.meituan.net,lx1.meituan.net,plx.meituan.com,catfront.dianping.com,report.meituan.com"
+)
+
+# Rough transfer size of a blocked request by resource type (bytes), for the
+# bytes-saved estimate; anything else (beacons, pings, xhr) counts as the default
+ESTIMATED_BYTES = {"image": 30_000, "media": 500_000, "font": 50_000, "script": 30_000, "stylesheet": 20_000}
+DEFAULT_ESTIMATED_BYTES = 1_000
+
+# HAR archives of upstream traffic: "record" saves what pooled contexts load,
+# "replay" serves it back without touching the network ("" = off)
+HAR_MODE = os.environ.get("DIANPING_HAR_MODE", "")
+HAR_DIR = os.environ.get("DIANPING_HAR_DIR", "har")
+
+
+def _split_setting(value: str) -> frozenset:
+    return frozenset(v.strip().lower() for v in value.split(",") if v.strip())
+
+
+class ResourceBlocker:
+    """context.route handler that aborts requests we never read from
+
+    Scraping only reads text nodes, so images, media, fonts and analytics
+    beacons are pure overhead. Aborted requests never get a response, so the
+    bytes they would have cost are estimated from ESTIMATED_BYTES.
+    """
+
+    def __init__(self, resource_types=None, hosts=None):
+        self.resource_types = _split_setting(BLOCK_RESOURCE_TYPES if resource_types is None else resource_types)
+        self.hosts = _split_setting(BLOCK_HOSTS if hosts is None else hosts)
+        self.blocked = 0
+        self.allowed = 0
+        self.blocked_by_type = {}
+        self.bytes_saved = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.resource_types or self.hosts)
+
+    def should_block(self, resource_type: str, url: str) -> bool:
+        if resource_type in self.resource_types:
+            return True
+        host = (urlsplit(url).hostname or "").lower()
+        return any(host == h or host.endswith("." + h) for h in self.hosts)
+
+    async def handle(self, route):
+        request = route.request
+        resource_type = request.resource_type
+        if self.should_block(resource_type, request.url):
+            self.blocked += 1
+            self.blocked_by_type[resource_type] = self.blocked_by_type.get(resource_type, 0) + 1
+            self.bytes_saved += ESTIMATED_BYTES.get(resource_type, DEFAULT_ESTIMATED_BYTES)
+            await route.abort()
+        else:
+            self.allowed += 1
+            # Let an earlier handler (HAR replay) answer, else the network
+            await route.fallback()
+
+    async def install(self, context):
+        """Route every request of `context` through this blocker"""
+        if self.enabled:
+            await context.route("**/*", self.handle)
+
+
+async def _abort(route):
+    await route.abort()
+
+
+class HarArchive:
+    """Records upstream responses into HAR files, or serves them back
+
+    - record: every pooled context writes <dir>/<time>-<pid>-<n>.har when it
+      closes (contexts close on recycle, eviction and shutdown)
+    - replay: every .har in the directory is served, newest first; requests
+      no archive has are aborted, so a replay run never reaches the site
+
+    Only URLs matching `url` (the upstream origin) are recorded or replayed.
+    """
+
+    def __init__(self, mode=None, directory=None, url="**/*"):
+        self.mode = HAR_MODE if mode is None else mode
+        if self.mode not in ("", "record", "replay"):
+            raise ValueError(f"Unknown HAR mode '{self.mode}' (expected record or replay)")
+        self.directory = Path(HAR_DIR if directory is None else directory)
+        self.url = url
+        self._recorded = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.mode)
+
+    async def install(self, context):
+        """Route `context` through the archive (a no-op when disabled)"""
+        if self.mode == "record":
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._recorded += 1
+            path = self.directory / f"{int(time.time())}-{os.getpid()}-{self._recorded}.har"
+            await context.route_from_har(path, url=self.url, update=True,
+                                         update_content="embed", update_mode="minimal")
+            logger.info(f"Recording upstream traffic to {path}")
+        elif self.mode == "replay":
+            archives = sorted(self.directory.glob("*.har"))
+            if not archives:
+                logger.warning(f"No HAR archives in {self.directory}; every request will be aborted")
+            # Routes registered last run first: archives newest first, then abort
+            await context.route("**/*", _abort)
+            for archive in archives:
+                await context.route_from_har(archive, url=self.url, not_found="fallback")
+
+
+def auth_identity(auth_file) -> tuple:
+    """Identity of a storage state file: (resolved path, mtime)"""
+    path = Path(auth_file)
+    return (str(path.resolve()), path.stat().st_mtime)
+
+
+class PooledContext:
+    """A BrowserContext plus the bookkeeping the pool needs"""
+
+    def __init__(self, key, context):
+        self.key = key
+        self.context = context
+        self.open_pages = 0
+        self.pages_served = 0
+        self.last_used = time.monotonic()
+        self.retired = False
+
+
+class ContextPool:
+    """Bounded pool of authenticated contexts
+
+    - Contexts are reused until they have served MAX_PAGES_PER_CONTEXT pages,
+      then retired and closed once their last page is closed.
+    - Contexts without open pages are evicted after IDLE_TIMEOUT seconds by a
+      background reaper, so memory is given back while no calls come in.
+    - At most MAX_CONTEXTS live contexts exist; when the cap is reached the
+      least loaded one is shared.
+
+    browser_factory is an async callable returning the shared Browser.
+    """
+
+    def __init__(self, browser_factory, max_contexts=None, max_pages_per_context=None, idle_timeout=None,
+                 blocker=None, har=None):
+        self._browser_factory = browser_factory
+        self.blocker = blocker
+        self.har = har
+        self.max_contexts = max_contexts or MAX_CONTEXTS
+        self.max_pages_per_context = max_pages_per_context or MAX_PAGES_PER_CONTEXT
+        self.idle_timeout = IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+        self._entries = []
+        self._lock = asyncio.Lock()
+        self._closing = set()
+        self._reaper = None
+
+    @property
+    def reap_interval(self) -> float:
+        return max(0.01, min(60.0, self.idle_timeout / 2))
+
+    async def _create(self, key, auth_file) -> PooledContext:
+        browser = await self._browser_factory()
+        context = await browser.new_context(storage_state=str(auth_file))
+        # The blocker is installed last so it sees requests before the archive
+        if self.har is not None:
+            await self.har.install(context)
+        if self.blocker is not None:
+            await self.blocker.install(context)
+        entry = PooledContext(key, context)
+        self._entries.append(entry)
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.get_running_loop().create_task(self._reap())
+        logger.info(f"Created pooled context ({len(self._entries)}/{self.max_contexts})")
+        return entry
+
+    async def _close_entry(self, entry: PooledContext, reason: str):
+        if entry in self._entries:
+            self._entries.remove(entry)
+        try:
+            await entry.context.close()
+        except Exception as e:
+            logger.debug(f"Error closing context: {e}")
+        logger.info(f"Closed pooled context ({reason})")
+
+    def release(self, entry: PooledContext):
+        """Return a slot reserved by acquire(); called automatically when a pooled page closes"""
+        entry.open_pages = max(0, entry.open_pages - 1)
+        entry.last_used = time.monotonic()
+        if entry.retired and entry.open_pages == 0 and entry in self._entries:
+            # Page close events are delivered synchronously; close in the background
+            self._entries.remove(entry)
+            task = asyncio.get_running_loop().create_task(self._close_entry(entry, "recycled"))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    async def evict_idle(self):
+        """Close contexts that have been idle longer than idle_timeout"""
+        now = time.monotonic()
+        for entry in list(self._entries):
+            if entry.open_pages == 0 and now - entry.last_used > self.idle_timeout:
+                await self._close_entry(entry, "idle")
+
+    async def _reap(self):
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            try:
+                async with self._lock:
+                    await self.evict_idle()
+            except Exception as e:
+                logger.warning(f"Idle context eviction failed: {e}")
+
+    async def acquire(self, auth_file="auth.json") -> PooledContext:
+        """Get a live context for auth_file, creating one if needed"""
+        async with self._lock:
+            key = auth_identity(auth_file)
+
+            # Retire contexts from a stale auth file or that hit the page budget
+            for entry in list(self._entries):
+                if entry.key != key or entry.pages_served >= self.max_pages_per_context:
+                    entry.retired = True
+                    if entry.open_pages == 0:
+                        await self._close_entry(entry, "recycled")
+
+            live = [e for e in self._entries if not e.retired]
+            if live and (len(self._entries) >= self.max_contexts or any(e.open_pages == 0 for e in live)):
+                entry = min(live, key=lambda e: e.open_pages)
+            else:
+                entry = await self._create(key, auth_file)
+            # Reserve the slot before releasing the lock so concurrent callers spread out
+            entry.open_pages += 1
+            entry.pages_served += 1
+            return entry
+
+    async def new_page(self, auth_file="auth.json"):
+        """Open a page in a pooled context
+
+        Returns:
+            tuple: (context, page); closing the page returns it to the pool
+        """
+        entry = await self.acquire(auth_file)
+        try:
+            page = await entry.context.new_page()
+        except Exception:
+            self.release(entry)
+            raise
+        entry.last_used = time.monotonic()
+        page.once("close", lambda _: self.release(entry))
+        return entry.context, page
+
+    async def warm_up(self, auth_file="auth.json", count=1):
+        """Pre-create up to `count` contexts so the first tool calls skip context setup"""
+        async with self._lock:
+            key = auth_identity(auth_file)
+            while len([e for e in self._entries if e.key == key and not e.retired]) < min(count, self.max_contexts):
+                await self._create(key, auth_file)
+
+    def stats(self) -> dict:
+        stats = {
+            "contexts": len(self._entries),
+            "open_pages": sum(e.open_pages for e in self._entries),
+            "pages_served": sum(e.pages_served for e in self._entries),
+        }
+        if self.blocker is not None:
+            stats["requests_blocked"] = self.blocker.blocked
+            stats["requests_allowed"] = self.blocker.allowed
+            stats["blocked_by_type"] = dict(self.blocker.blocked_by_type)
+            stats["estimated_bytes_saved"] = self.blocker.bytes_saved
+        return stats
+
+    async def close(self):
+        """Stop the reaper and close every pooled context"""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            try:
+                await self._reaper
+            except asyncio.CancelledError:
+                pass
+            self._reaper = None
+        for entry in list(self._entries):
+            await self._close_entry(entry, "shutdown")
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
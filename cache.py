@@ -0,0 +1,204 @@
+"""
+Result cache for scraped rankings and shop details.
+
+Entries live in an in-memory LRU with per-entry expiry. When DIANPING_CACHE_DB
+is set, entries are also written through to SQLite so the cache survives
+restarts and is shared by every server process on the host. The database runs
+in WAL mode with a busy timeout; if it still can't be read or written, the
+error is logged and the call goes on with the in-memory cache alone.
+
+With a max-stale window set for a tool, expired entries are kept that much
+longer and can be served flagged as stale while the caller refreshes them.
+
+SingleFlight covers the gap before an entry exists: concurrent identical
+scrapes share one in-flight page load.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+# Per-tool TTLs in seconds
+RANK_TTL = float(os.environ.get("DIANPING_CACHE_TTL_RANK", "600"))
+DETAIL_TTL = float(os.environ.get("DIANPING_CACHE_TTL_DETAIL", "3600"))
+# Per-tool stale-while-revalidate window: how long past its TTL an entry is
+# still served (flagged stale) while a refresh runs behind it; 0 disables
+RANK_MAX_STALE = float(os.environ.get("DIANPING_CACHE_MAX_STALE_RANK", "0"))
+DETAIL_MAX_STALE = float(os.environ.get("DIANPING_CACHE_MAX_STALE_DETAIL", "0"))
+MAX_ENTRIES = int(os.environ.get("DIANPING_CACHE_MAX_ENTRIES", "1000"))
+CACHE_DB = os.environ.get("DIANPING_CACHE_DB", "")
+# Seconds to wait for another process's write lock on the database
+DB_BUSY_TIMEOUT = 5.0
+
+
+class CacheEntry(NamedTuple):
+    value: object
+    stored_at: float
+    expires_at: float
+
+    @property
+    def stale(self) -> bool:
+        return self.expires_at <= time.time()
+
+
+class ResultCache:
+    """LRU + TTL cache of JSON-serializable results, keyed by (namespace, key)
+
+    Expired entries are kept for `retention` seconds (the longest max-stale
+    window) so lookup() can still serve them as stale.
+    """
+
+    def __init__(self, max_entries=None, db_path=None, retention=None):
+        self.max_entries = max_entries or MAX_ENTRIES
+        self.retention = max(RANK_MAX_STALE, DETAIL_MAX_STALE) if retention is None else retention
+        self._entries = OrderedDict()
+        self.hits = {}
+        self.stale_hits = {}
+        self.misses = {}
+        self._db = None
+        db_path = CACHE_DB if db_path is None else db_path
+        if db_path:
+            self._db = sqlite3.connect(db_path, timeout=DB_BUSY_TIMEOUT)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL,"
+                " value TEXT NOT NULL, expires_at REAL NOT NULL,"
+                " stored_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            self._db.commit()
+            logger.info(f"Result cache backed by {db_path}")
+
+    def _count(self, counter: dict, namespace: str):
+        counter[namespace] = counter.get(namespace, 0) + 1
+
+    def _remember(self, namespace: str, key: str, entry: CacheEntry):
+        self._entries[(namespace, key)] = entry
+        self._entries.move_to_end((namespace, key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _find(self, namespace: str, key: str, now: float):
+        """The entry for key if it is not past retention, from memory or SQLite"""
+        entry = self._entries.get((namespace, key))
+        if entry is not None:
+            if entry.expires_at + self.retention > now:
+                return entry
+            del self._entries[(namespace, key)]
+
+        if self._db is not None:
+            try:
+                row = self._db.execute(
+                    "SELECT value, expires_at, stored_at FROM results WHERE namespace = ? AND key = ?",
+                    (namespace, key)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"Cache DB read failed for {namespace}:{key}: {e}")
+                return None
+            if row and row[1] + self.retention > now:
+                entry = CacheEntry(json.loads(row[0]), row[2], row[1])
+                self._remember(namespace, key, entry)
+                return entry
+        return None
+
+    def lookup(self, namespace: str, key: str, max_stale: float = 0):
+        """Return the CacheEntry, or None on a miss
+
+        An entry that expired less than max_stale seconds ago is still
+        returned; its `stale` flag is set.
+        """
+        now = time.time()
+        entry = self._find(namespace, key, now)
+        if entry is not None:
+            if entry.expires_at > now:
+                self._entries.move_to_end((namespace, key))
+                self._count(self.hits, namespace)
+                return entry
+            if entry.expires_at + max_stale > now:
+                self._count(self.stale_hits, namespace)
+                return entry
+        self._count(self.misses, namespace)
+        return None
+
+    def get(self, namespace: str, key: str):
+        """Return the cached value, or None on a miss or expired entry"""
+        entry = self.lookup(namespace, key)
+        return None if entry is None else entry.value
+
+    def expiry(self, namespace: str, key: str):
+        """When the entry expires (epoch seconds), or None if there is none; not counted as a hit or miss"""
+        entry = self._find(namespace, key, time.time())
+        return None if entry is None else entry.expires_at
+
+    def set(self, namespace: str, key: str, value, ttl: float):
+        """Store value for ttl seconds"""
+        now = time.time()
+        entry = CacheEntry(value, now, now + ttl)
+        self._remember(namespace, key, entry)
+        if self._db is not None:
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (namespace, key, value, expires_at, stored_at) VALUES (?, ?, ?, ?, ?)",
+                    (namespace, key, json.dumps(value, ensure_ascii=False), entry.expires_at, now)
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                # The scrape succeeded; it stays cached in memory
+                logger.warning(f"Cache DB write failed for {namespace}:{key}: {e}")
+                self._db.rollback()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": dict(self.hits),
+            "stale_hits": dict(self.stale_hits),
+            "misses": dict(self.misses),
+        }
+
+    def close(self):
+        if self._db is not None:
+            try:
+                self._db.execute("DELETE FROM results WHERE expires_at <= ?", (time.time() - self.retention,))
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Cache DB cleanup failed: {e}")
+            self._db.close()
+            self._db = None
+
+
+class SingleFlight:
+    """Deduplicate concurrent calls that share a key
+
+    The first caller for a key runs the coroutine; callers arriving while it
+    is in flight await the same task and get the same result (or exception).
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.leaders = 0
+        self.shared = 0
+
+    async def do(self, key: str, fn):
+        """Run fn() for key, or join the call already in flight"""
+        task = self._inflight.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.get_running_loop().create_task(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.shared += 1
+            logger.debug(f"Joined in-flight request for {key}")
+        # Shield so one caller being cancelled doesn't cancel the shared load
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._inflight), "leaders": self.leaders, "shared": self.shared}
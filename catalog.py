@@ -0,0 +1,137 @@
+"""
+Category and region tables (dianping-menu.txt, dianping-region.txt) and their
+lookup indexes.
+
+The tables are loaded lazily on first use and kept as a compiled pickle
+snapshot, so workers and restarts skip both the text parsing and the index
+build. The snapshot is rebuilt when a source file's mtime or size changes,
+when SNAPSHOT_VERSION is bumped, or when pinyin support changes. Snapshots
+are written atomically, so workers sharing one can never read a partial file.
+"""
+
+import logging
+import os
+import pickle
+import re
+from pathlib import Path
+
+import lookup
+from lookup import NameIndex
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path(__file__).resolve().parent
+MENU_FILE = DATA_DIR / "dianping-menu.txt"
+REGION_FILE = DATA_DIR / "dianping-region.txt"
+# Where snapshots are kept (defaults to __pycache__ next to the data files)
+SNAPSHOT_DIR = Path(os.environ.get("DIANPING_CATALOG_CACHE", DATA_DIR / "__pycache__"))
+# Bump when the Catalog or NameIndex layout changes
+SNAPSHOT_VERSION = 1
+
+# Menu entries with a ranking list page; keyword searches and editorial pages aren't categories
+RANKABLE_CODE = re.compile(r"^/[a-z]+\d*(/g\w+)?$")
+
+# 加载分类菜单（dianping-menu.txt），返回dict: {分类名: url}
+def load_menu(filepath=MENU_FILE):
+    menu = {}
+
+    with open(filepath, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("//") or line.startswith("#"):
+                continue
+
+            parts = line.split("\t")
+            if len(parts) == 2:
+                name, url = parts
+                menu[name] = url
+    return menu
+
+def load_regions(filepath=REGION_FILE):
+    """
+    Load region information from file, organized by city
+    Returns: dict {city: {region_name: region_code}}
+    Format example:
+    beijing 国贸/建外 r2578
+    beijing 三里屯/工体 r2580
+    """
+    regions = {}
+
+    with open(filepath, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            # Skip empty lines, comments and headers
+            if not line or line.startswith("#") or line.startswith("//"):
+                continue
+
+            # Parse region line
+            parts = line.split()
+            if len(parts) == 3:
+                city, name, code = parts
+                city = city.lower()
+                if city not in regions:
+                    regions[city] = {}
+                regions[city][name] = code
+
+    return regions
+
+
+class Catalog:
+    """Parsed tables plus their lookup indexes"""
+
+    def __init__(self, menu: dict, regions: dict):
+        self.menu = menu
+        self.regions = regions
+        self.categories = NameIndex({name: code for name, code in menu.items() if RANKABLE_CODE.match(code)})
+        self.cities = NameIndex({city: city for city in regions})
+        self.city_regions = {city: NameIndex(names) for city, names in regions.items()}
+
+
+def _source_key(menu_file, region_file) -> tuple:
+    """Everything a snapshot depends on"""
+    sources = []
+    for path in (menu_file, region_file):
+        stat = os.stat(path)
+        sources.append((str(Path(path).resolve()), stat.st_mtime_ns, stat.st_size))
+    return (SNAPSHOT_VERSION, lookup.lazy_pinyin is not None, tuple(sources))
+
+
+def load_catalog(menu_file=MENU_FILE, region_file=REGION_FILE, snapshot_dir=None) -> Catalog:
+    """Load the catalog from its snapshot, rebuilding the snapshot if it is stale"""
+    key = _source_key(menu_file, region_file)
+    snapshot_dir = Path(SNAPSHOT_DIR if snapshot_dir is None else snapshot_dir)
+    snapshot = snapshot_dir / f"catalog.v{SNAPSHOT_VERSION}.pickle"
+    try:
+        with open(snapshot, "rb") as f:
+            stored_key, catalog = pickle.load(f)
+        if stored_key == key:
+            return catalog
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable catalog snapshot {snapshot}: {e}")
+
+    catalog = Catalog(load_menu(menu_file), load_regions(region_file))
+    try:
+        snapshot_dir.mkdir(parents=True, exist_ok=True)
+        tmp = snapshot.with_name(f"{snapshot.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump((key, catalog), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, snapshot)
+        logger.info(f"Rebuilt catalog snapshot {snapshot}")
+    except OSError as e:
+        logger.warning(f"Could not write catalog snapshot {snapshot}: {e}")
+    return catalog
+
+
+_catalog = None
+_catalog_key = None
+
+def get_catalog() -> Catalog:
+    """The shared catalog, loaded on first use and reloaded when a source file changes"""
+    global _catalog, _catalog_key
+    key = _source_key(MENU_FILE, REGION_FILE)
+    if _catalog is None or key != _catalog_key:
+        _catalog = load_catalog()
+        _catalog_key = key
+    return _catalog
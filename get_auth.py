@@ -1,6 +1,7 @@
 from playwright.sync_api import sync_playwright
 import json
 from pathlib import Path
+from session import ORIGIN
 
 def get_auth():
     """Get authentication state from dianping.com and save to auth.json"""
@@ -18,7 +19,7 @@ def get_auth():
         })
         
         # Navigate to homepage
-        page.goto('https://www.dianping.com/beijing', wait_until='domcontentloaded')
+        page.goto(f'{ORIGIN}/beijing', wait_until='domcontentloaded')
         page.wait_for_selector('.top-nav', state='visible', timeout=30000)
         
         # Check login status
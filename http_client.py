@@ -0,0 +1,170 @@
+"""
+Browserless fetches of server-rendered Dianping pages.
+
+Category list pages are plain HTML, so they can be fetched with an HTTP client
+carrying the cookies from the auth.json storage state instead of a Chromium
+navigation. One keep-alive client (HTTP/2 when the optional h2 package is
+installed) is shared by all calls and rebuilt when auth.json changes.
+
+Responses that are not a usable page (login redirect, error status, or
+nothing parseable: a captcha or a JS-rendered page) raise NeedsBrowser so the
+caller can fall back to the browser path.
+"""
+
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import httpx
+
+from browser_pool import auth_identity
+from session import LOGIN_HOSTS
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+logger = logging.getLogger(__name__)
+
+HTTP_TIMEOUT = float(os.environ.get("DIANPING_HTTP_TIMEOUT", "10"))
+HTTP_MAX_CONNECTIONS = int(os.environ.get("DIANPING_HTTP_MAX_CONNECTIONS", "10"))
+USER_AGENT = os.environ.get(
+    "DIANPING_USER_AGENT",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/124.0.0.0 Safari/537.36"
+)
+# Body markers of a verification page served in place of the content
+CAPTCHA_MARKERS = ("verify.meituan.com", "yoda-verify", "captcha")
+
+
+class NeedsBrowser(Exception):
+    """The HTTP response can't be used; load the page in the browser instead
+
+    kind is one of "auth", "login", "status", "captcha", "error" or "empty".
+    """
+
+    def __init__(self, kind: str, reason: str, status: int = 0):
+        super().__init__(reason)
+        self.kind = kind
+        self.status = status
+
+    @property
+    def pushback(self) -> bool:
+        """Whether the site is refusing us, as opposed to a local problem or a JS-only page"""
+        if self.kind == "status":
+            return self.status in (403, 429) or self.status >= 500
+        return self.kind in ("login", "captcha", "error")
+
+
+def storage_state_cookies(auth_file) -> httpx.Cookies:
+    """Unexpired cookies of a Playwright storage state file"""
+    state = json.loads(Path(auth_file).read_text(encoding="utf-8"))
+    cookies = httpx.Cookies()
+    now = time.time()
+    for cookie in state.get("cookies", []):
+        expires = cookie.get("expires", -1)
+        if expires is not None and 0 <= expires < now:
+            continue
+        cookies.set(cookie["name"], cookie["value"],
+                    domain=cookie.get("domain", ""), path=cookie.get("path", "/"))
+    return cookies
+
+
+def check_response(url: str, status: int):
+    """Raise NeedsBrowser if a response is a login redirect or an error"""
+    host = urlsplit(url).hostname or ""
+    if any(login_host in host for login_host in LOGIN_HOSTS):
+        raise NeedsBrowser("login", f"redirected to {url}")
+    if status >= 400:
+        raise NeedsBrowser("status", f"HTTP {status}", status)
+
+
+def captcha_marker(html: str) -> str:
+    """The first captcha marker found in html, or """""
+    lowered = html.lower()
+    return next((marker for marker in CAPTCHA_MARKERS if marker in lowered), "")
+
+
+def unusable_page(html: str) -> NeedsBrowser:
+    """Why a page with nothing to parse can't be used: a captcha or a JS-rendered page"""
+    marker = captcha_marker(html)
+    if marker:
+        return NeedsBrowser("captcha", f"captcha page ({marker})")
+    return NeedsBrowser("empty", "no server-rendered content")
+
+
+def pushback_sign(url: str, html: str = "") -> str:
+    """"login" or "captcha" if a loaded page is a login or verification page, else ""
+
+    A page without results and without these signs is a real empty result
+    (or a removed shop), not the site refusing us.
+    """
+    host = urlsplit(url).hostname or ""
+    if any(login_host in host for login_host in LOGIN_HOSTS):
+        return "login"
+    return "captcha" if captcha_marker(html) else ""
+
+
+class HttpFetcher:
+    """Shared keep-alive HTTP client authenticated with auth.json cookies"""
+
+    def __init__(self, auth_file="auth.json", transport=None):
+        self.auth_file = Path(auth_file)
+        self.transport = transport
+        self._client = None
+        self._identity = None
+        self.fetched = 0
+        self.fallbacks = {}
+
+    def count_fallback(self, kind: str):
+        self.fallbacks[kind] = self.fallbacks.get(kind, 0) + 1
+
+    async def get_client(self) -> httpx.AsyncClient:
+        """The shared client, rebuilt when auth.json is replaced"""
+        if not self.auth_file.exists():
+            raise NeedsBrowser("auth", "auth.json not found")
+        identity = auth_identity(self.auth_file)
+        if self._client is None or identity != self._identity:
+            if self._client is not None:
+                await self._client.aclose()
+            self._client = httpx.AsyncClient(
+                http2=HTTP2,
+                cookies=storage_state_cookies(self.auth_file),
+                headers={"User-Agent": USER_AGENT, "Accept-Language": "zh-CN,zh;q=0.9"},
+                limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                                    max_keepalive_connections=HTTP_MAX_CONNECTIONS),
+                timeout=HTTP_TIMEOUT,
+                follow_redirects=True,
+                transport=self.transport,
+            )
+            self._identity = identity
+            logger.info(f"HTTP client ready (HTTP/2: {HTTP2})")
+        return self._client
+
+    async def fetch_html(self, url: str) -> str:
+        """GET url and return its HTML, or raise NeedsBrowser"""
+        try:
+            client = await self.get_client()
+            try:
+                response = await client.get(url)
+            except httpx.HTTPError as e:
+                raise NeedsBrowser("error", f"request failed: {e!r}") from e
+            check_response(str(response.url), response.status_code)
+        except NeedsBrowser as e:
+            self.count_fallback(e.kind)
+            raise
+        self.fetched += 1
+        return response.text
+
+    def stats(self) -> dict:
+        return {"fetched": self.fetched, "fallbacks": dict(self.fallbacks)}
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,146 @@
+"""
+Name lookup for categories, cities and regions.
+
+Each NameIndex is built once from a {name: value} mapping and resolves user
+input to one canonical name through, in order:
+
+1. exact keys (O(1)): the name, its "/"-separated parts ('三里屯/工体' ->
+   '三里屯', '工体'), the name without separators, and the full and initial
+   pinyin of each ('sanlitun', 'slt')
+2. prefix search over the sorted keys (O(log n))
+3. character n-gram similarity, for misspellings
+
+Ambiguous input resolves to nothing and returns suggestions instead.
+Pinyin keys need the optional pypinyin package.
+"""
+
+import bisect
+import re
+import unicodedata
+
+try:
+    from pypinyin import lazy_pinyin, Style
+except ImportError:  # Pinyin keys are skipped
+    lazy_pinyin = None
+
+# Minimum n-gram (Dice) similarity for a fuzzy match to resolve on its own
+FUZZY_THRESHOLD = 0.6
+MAX_SUGGESTIONS = 5
+
+_SEPARATORS = re.compile(r"[\s/·・,，、()（）\-_]+")
+
+
+def normalize(text: str) -> str:
+    """Case-fold, unify full-width forms and drop separators"""
+    return _SEPARATORS.sub("", unicodedata.normalize("NFKC", text or "").lower())
+
+
+def aliases(name: str) -> set:
+    """Every exact key a name is known by"""
+    forms = {name} | {part for part in re.split(r"[/／]", name) if part.strip()}
+    keys = {normalize(form) for form in forms}
+    if lazy_pinyin is not None:
+        for form in forms:
+            keys.add(normalize("".join(lazy_pinyin(form))))
+            keys.add(normalize("".join(lazy_pinyin(form, style=Style.FIRST_LETTER))))
+    keys.discard("")
+    return keys
+
+
+def ngrams(key: str) -> set:
+    """Bigrams of latin/pinyin keys; single characters of Chinese keys
+
+    Chinese names are two to four characters, too short for bigrams to
+    survive a one-character typo.
+    """
+    if not key.isascii() or len(key) < 2:
+        return set(key)
+    return {key[i:i + 2] for i in range(len(key) - 1)}
+
+
+class NameIndex:
+    """Resolve user input to the canonical names of a {name: value} mapping"""
+
+    def __init__(self, entries: dict):
+        self.entries = dict(entries)
+        self.names = sorted(self.entries)
+        keys = {}
+        for n, name in enumerate(self.names):
+            for key in aliases(name):
+                keys.setdefault(key, set()).add(n)
+        # key -> indexes into self.names
+        self._keys = {key: tuple(sorted(ids)) for key, ids in keys.items()}
+        self._sorted_keys = sorted(self._keys)
+        grams = {}
+        for key in self._sorted_keys:
+            for gram in ngrams(key):
+                grams.setdefault(gram, []).append(key)
+        self._grams = {gram: tuple(keys) for gram, keys in grams.items()}
+
+    def __contains__(self, name) -> bool:
+        return name in self.entries
+
+    def __getitem__(self, name):
+        return self.entries[name]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _names(self, ids) -> list:
+        return [self.names[n] for n in ids]
+
+    def prefix(self, query: str) -> list:
+        """Names with a key starting with query"""
+        key = normalize(query)
+        if not key:
+            return []
+        ids = set()
+        start = bisect.bisect_left(self._sorted_keys, key)
+        for candidate in self._sorted_keys[start:]:
+            if not candidate.startswith(key):
+                break
+            ids.update(self._keys[candidate])
+        return self._names(sorted(ids))
+
+    def similar(self, query: str) -> list:
+        """(score, name) pairs by n-gram similarity, best first"""
+        grams = ngrams(normalize(query))
+        shared = {}
+        for gram in grams:
+            for key in self._grams.get(gram, ()):
+                shared[key] = shared.get(key, 0) + 1
+        scores = {}
+        for key, common in shared.items():
+            score = 2 * common / (len(grams) + len(ngrams(key)))
+            for n in self._keys[key]:
+                scores[n] = max(scores.get(n, 0.0), score)
+        return sorted(((score, self.names[n]) for n, score in scores.items()), key=lambda s: (-s[0], s[1]))
+
+    def resolve(self, query: str) -> tuple:
+        """Resolve query to one canonical name
+
+        Returns:
+            tuple: (name, []) on a match, (None, suggestions) otherwise
+        """
+        if query in self.entries:
+            return query, []
+        key = normalize(query)
+        if not key:
+            return None, []
+
+        ids = self._keys.get(key)
+        if ids is not None:
+            if len(ids) == 1:
+                return self.names[ids[0]], []
+            return None, self._names(ids)[:MAX_SUGGESTIONS]
+
+        prefixed = self.prefix(key)
+        if len(prefixed) == 1:
+            return prefixed[0], []
+        if prefixed:
+            return None, prefixed[:MAX_SUGGESTIONS]
+
+        similar = self.similar(key)
+        if similar and similar[0][0] >= FUZZY_THRESHOLD and (len(similar) == 1 or similar[1][0] < similar[0][0]):
+            return similar[0][1], []
+        return None, [name for _, name in similar[:MAX_SUGGESTIONS]]
@@ -7,17 +7,36 @@ Usage:
 export MCP_ENDPOINT=<mcp_endpoint>
 python mcp_pipe.py <mcp_script>
 
+Optional settings:
+
+MCP_WORKERS=<n>          number of `mcp_script` worker processes (default 1);
+                         workers get MCP_PIPE_WORKERS=<n> to split per-process
+                         budgets such as DIANPING_RATE, and MCP_PIPE_WORKER=<i>
+                         (their index) for work only one of them should do
+MCP_ROUTING=<strategy>   least_outstanding (default) or round_robin
+MCP_PIPE_COMPRESSION=<c> deflate (default, permessage-deflate) or none
+MCP_PIPE_BATCH_MS=<ms>   coalesce worker output produced within this window
+                         into one JSON-RPC batch frame (default 0 = off)
+MCP_PIPE_METRICS_PORT=<p>      serve per-method latency/error/size metrics in
+                               Prometheus text format on
+                               http://127.0.0.1:<p>/metrics (default 0 = off)
+MCP_PIPE_METRICS_INTERVAL=<s>  log a metrics summary every <s> seconds
+                               (default 0 = off)
+
 """
 
 import asyncio
 import websockets
-import subprocess
 import logging
 import os
 import signal
 import sys
+import json
+import time
 import random
+import itertools
 from dotenv import load_dotenv
+from metrics import PipeMetrics, serve_metrics
 
 # Load environment variables from .env file
 load_dotenv()
@@ -35,6 +54,26 @@ MAX_BACKOFF = 600  # Maximum wait time in seconds
 reconnect_attempt = 0
 backoff = INITIAL_BACKOFF
 
+# Worker settings
+WORKERS = max(1, int(os.environ.get('MCP_WORKERS', '1')))
+ROUTING = os.environ.get('MCP_ROUTING', 'least_outstanding')
+RESPAWN_DELAY = 1  # Wait time in seconds before respawning a crashed worker
+INIT_REPLAY_ID = '__mcp_pipe_init__'  # Request id used to re-initialize respawned workers
+
+# WebSocket link settings
+COMPRESSION = os.environ.get('MCP_PIPE_COMPRESSION', 'deflate')
+BATCH_WINDOW = float(os.environ.get('MCP_PIPE_BATCH_MS', '0')) / 1000
+BATCH_MAX_BYTES = 256 * 1024  # Flush a batch early once it grows past this
+
+# Subprocess pipe settings
+STREAM_LIMIT = 1024 * 1024  # StreamReader buffer; longer lines are read in chunks
+STOP_TIMEOUT = 5  # Seconds to wait for a terminated worker before killing it
+OUTBOX_LIMIT = 1000  # Messages queued for a worker's stdin before its requests are failed
+
+# Metrics settings
+METRICS_PORT = int(os.environ.get('MCP_PIPE_METRICS_PORT', '0'))
+METRICS_INTERVAL = float(os.environ.get('MCP_PIPE_METRICS_INTERVAL', '0'))
+
 async def connect_with_retry(uri):
     """Connect to WebSocket server with retry mechanism"""
     global reconnect_attempt, backoff
@@ -54,35 +93,475 @@ async def connect_with_retry(uri):
             # Calculate wait time for next reconnection (exponential backoff)
             backoff = min(backoff * 2, MAX_BACKOFF)
 
+class LinkStats:
+    """Message, frame and byte counters for one WebSocket connection
+
+    bytes_* count JSON payloads; wire_bytes_* count what the socket actually
+    carried (after permessage-deflate, plus framing and control frames), so
+    the two show what compression saves.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.messages_out = 0
+        self.frames_out = 0
+        self.bytes_out = 0
+        self.wire_bytes_out = 0
+        self.messages_in = 0
+        self.frames_in = 0
+        self.bytes_in = 0
+        self.wire_bytes_in = 0
+
+    def count_wire_bytes(self, websocket):
+        """Count the bytes passing through the connection's transport"""
+        transport = getattr(websocket, 'transport', None)
+        if transport is None:
+            return
+        write = transport.write
+        data_received = websocket.data_received
+
+        def counting_write(data):
+            self.wire_bytes_out += len(data)
+            write(data)
+
+        def counting_data_received(data):
+            self.wire_bytes_in += len(data)
+            data_received(data)
+
+        transport.write = counting_write
+        websocket.data_received = counting_data_received
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started
+        return (f"sent {self.messages_out} messages in {self.frames_out} frames "
+                f"({self.bytes_out} bytes, {self.wire_bytes_out} on the wire), "
+                f"received {self.messages_in} messages in {self.frames_in} frames "
+                f"({self.bytes_in} bytes, {self.wire_bytes_in} on the wire) "
+                f"over {elapsed:.0f}s")
+
+class ServerProcess:
+    """One long-lived `mcp_script` worker process
+
+    Workers are started once and outlive WebSocket connections, so a
+    reconnect costs a socket handshake instead of a Python import, data
+    loading and a Chromium launch.
+
+    Pipes are asyncio streams carrying newline-delimited byte frames. Writes
+    go through a bounded per-worker queue drained by its own task, so a
+    worker that stops reading stdin only stalls itself, not the router; once
+    the queue is full, requests to it fail instead of piling up.
+    """
+
+    def __init__(self, script, index, router):
+        self.script = script
+        self.index = index
+        self.router = router
+        self.process = None
+        self.outstanding = 0
+        self._outbox = None
+        self._tasks = []
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self):
+        """Start the process and its pipe tasks"""
+        # Tasks of a previous process; the stdout reader calling this on respawn ends by itself
+        current = asyncio.current_task()
+        for task in self._tasks:
+            if task is not current:
+                task.cancel()
+        self.process = await asyncio.create_subprocess_exec(
+            'python', self.script,
+            # Workers split per-process budgets (e.g. DIANPING_RATE) between them
+            env=dict(os.environ, MCP_PIPE_WORKERS=str(len(self.router.workers)),
+                     MCP_PIPE_WORKER=str(self.index)),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=STREAM_LIMIT
+        )
+        self.outstanding = 0
+        self._outbox = asyncio.Queue(OUTBOX_LIMIT)
+        logger.info(f"Started {self.script} worker {self.index} (pid {self.process.pid})")
+        self._tasks = [
+            asyncio.create_task(pipe_process_to_router(self)),
+            asyncio.create_task(pipe_process_stderr_to_terminal(self.process)),
+            asyncio.create_task(pipe_outbox_to_process(self.process, self._outbox)),
+        ]
+
+    def send(self, message):
+        """Queue one message for the process stdin; False if the queue is full"""
+        if isinstance(message, str):
+            message = message.encode('utf-8')
+        try:
+            self._outbox.put_nowait(message + b'\n')
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    async def stop(self):
+        """Terminate the process"""
+        if self.process is None:
+            return
+        logger.info(f"Terminating {self.script} worker {self.index}")
+        for task in self._tasks:
+            task.cancel()
+        if self.process.returncode is None:
+            self.process.terminate()
+            try:
+                await asyncio.wait_for(self.process.wait(), STOP_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+        logger.info(f"{self.script} worker {self.index} terminated")
+        self.process = None
+
+class Router:
+    """Routes JSON-RPC messages between one WebSocket and N worker processes
+
+    - Requests go to one worker (least outstanding or round robin) and the
+      response is sent back by id. Client ids are swapped for pipe ids
+      ("<connection>.<n>") on the way in and restored on the way out, so a
+      late reply to an earlier connection can't match a new client's
+      request with the same id; it is dropped instead.
+    - `initialize` and notifications are broadcast; only the first
+      initialize response is forwarded.
+    - Requests from a worker get their id prefixed with the worker index so
+      the client's reply finds its way back.
+    - A crashed worker is respawned and re-initialized; its in-flight
+      requests are answered with an error so the socket stays up.
+
+    Requests in both directions are matched to their responses by id and
+    recorded in `metrics` (latency, errors, sizes per method or tool).
+    """
+
+    def __init__(self, script, workers=WORKERS, routing=ROUTING):
+        self.workers = [ServerProcess(script, i, self) for i in range(workers)]
+        self.routing = routing
+        self.websocket = None
+        self._round_robin = itertools.cycle(self.workers)
+        self._pending = {}  # pipe id -> (worker or None for broadcasts, client id)
+        self._client_ids = {}  # client id -> pipe id of its in-flight request
+        self._broadcast_waiting = {}  # pipe id -> responses still expected
+        self._connection = 0  # Bumped on every attach
+        self._pipe_ids = itertools.count(1)
+        self._server_requests = {}  # prefixed id -> (worker, original id)
+        self._initialize = None  # Last initialize request, replayed to respawned workers
+        self._initialized = None
+        self.link_stats = LinkStats()
+        self._batch = []
+        self._batch_bytes = 0
+        self._flush_task = None
+        self.metrics = PipeMetrics()  # Cumulative over every connection
+        self._metrics_server = None
+        self._metrics_task = None
+
+    async def start(self):
+        for worker in self.workers:
+            if not worker.alive:
+                await worker.start()
+        if METRICS_PORT and self._metrics_server is None:
+            self._metrics_server = await serve_metrics(self.metrics.render_prometheus, METRICS_PORT)
+        if METRICS_INTERVAL > 0 and self._metrics_task is None:
+            self._metrics_task = asyncio.create_task(self._log_metrics())
+
+    async def stop(self):
+        if self._metrics_task is not None:
+            self._metrics_task.cancel()
+            self._metrics_task = None
+        if self._metrics_server is not None:
+            self._metrics_server.close()
+            await self._metrics_server.wait_closed()
+            self._metrics_server = None
+        logger.info(f"Request metrics: {self.metrics.summary()}")
+        await asyncio.gather(*[worker.stop() for worker in self.workers])
+
+    async def _log_metrics(self):
+        while True:
+            await asyncio.sleep(METRICS_INTERVAL)
+            logger.info(f"Request metrics: {self.metrics.summary()}")
+
+    def attach(self, websocket):
+        self.websocket = websocket
+        self._connection += 1
+        self.link_stats = LinkStats()
+        self.link_stats.count_wire_bytes(websocket)
+        logger.info(f"Attached {len(self.workers)} worker(s) to WebSocket")
+
+    def detach(self):
+        # Replies to a connection that is gone are dropped; the next one re-initializes
+        self.websocket = None
+        logger.info(f"Connection stats: {self.link_stats.summary()}")
+        self._batch = []
+        self._batch_bytes = 0
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        for worker in self.workers:
+            worker.outstanding = 0
+        self._pending.clear()
+        self._client_ids.clear()
+        self._broadcast_waiting.clear()
+        self._server_requests.clear()
+        self.metrics.abandon_in_flight()
+
+    def _to_pipe_id(self, client_id):
+        pipe_id = f"{self._connection}.{next(self._pipe_ids)}"
+        self._client_ids[client_id] = pipe_id
+        return pipe_id
+
+    def _is_current(self, pipe_id):
+        """Whether a pipe id was issued on the current connection"""
+        return isinstance(pipe_id, str) and pipe_id.partition('.')[0] == str(self._connection)
+
+    def pick_worker(self):
+        live = [w for w in self.workers if w.alive] or self.workers
+        if self.routing == 'round_robin':
+            while True:
+                worker = next(self._round_robin)
+                if worker in live:
+                    return worker
+        return min(live, key=lambda w: w.outstanding)
+
+    def _send_to_worker(self, worker, message):
+        """Queue a message for a worker; False if it was dropped"""
+        if not worker.alive:
+            logger.error(f"Worker {worker.index} not running, dropped: {message[:120]}...")
+            return False
+        if not worker.send(message):
+            logger.error(f"Worker {worker.index} is not reading its input, dropped: {message[:120]}...")
+            return False
+        return True
+
+    def _fail_request(self, pipe_id, reason):
+        """Take a client request off the books; returns the error reply for the client"""
+        owner, client_id = self._pending.pop(pipe_id)
+        if owner is not None:
+            owner.outstanding = max(0, owner.outstanding - 1)
+        if self._client_ids.get(client_id) == pipe_id:
+            del self._client_ids[client_id]
+        error = json.dumps({"jsonrpc": "2.0", "id": client_id, "error": {"code": -32603, "message": reason}}) + '\n'
+        self.metrics.request_finished('client', pipe_id, True, len(error))
+        return error
+
+    def _broadcast(self, message):
+        for worker in self.workers:
+            if worker.alive:
+                self._send_to_worker(worker, message)
+
+    async def send_to_client(self, message, batchable=True):
+        """Send one message to the client, coalescing it into a batch when enabled
+
+        Only JSON-RPC messages are batchable; anything else flushes the
+        pending batch and goes out in its own frame.
+        """
+        if isinstance(message, bytes):
+            message = message.decode('utf-8')
+        if self.websocket is None:
+            logger.debug(f"Dropped output while detached: {message[:120]}...")
+            return
+        if BATCH_WINDOW > 0 and batchable:
+            self._batch.append(message)
+            self._batch_bytes += len(message)
+            if self._batch_bytes >= BATCH_MAX_BYTES:
+                await self.flush()
+            elif self._flush_task is None:
+                self._flush_task = asyncio.create_task(self._flush_later())
+            return
+        await self.flush()
+        await self._send_frame(message, 1)
+
+    async def _flush_later(self):
+        await asyncio.sleep(BATCH_WINDOW)
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        """Send pending batched messages as one frame"""
+        if not self._batch:
+            return
+        batch, self._batch, self._batch_bytes = self._batch, [], 0
+        if len(batch) == 1:
+            frame = batch[0]
+        else:
+            frame = '[' + ','.join(m.strip() for m in batch) + ']\n'
+        await self._send_frame(frame, len(batch))
+
+    async def _send_frame(self, frame, messages):
+        websocket = self.websocket
+        if websocket is None:
+            return
+        logger.debug(f">> {frame[:120]}...")
+        try:
+            await websocket.send(frame)
+        except Exception as e:
+            logger.error(f"Error sending to WebSocket: {e}")
+            return
+        self.link_stats.messages_out += messages
+        self.link_stats.frames_out += 1
+        self.link_stats.bytes_out += len(frame.encode('utf-8'))
+
+    def handle_client_message(self, message):
+        """Route one message received from the WebSocket"""
+        self.link_stats.frames_in += 1
+        self.link_stats.bytes_in += len(message.encode('utf-8'))
+        try:
+            parsed = json.loads(message)
+        except ValueError:
+            self.link_stats.messages_in += 1
+            self._send_to_worker(self.pick_worker(), message)
+            return
+        self.link_stats.messages_in += len(parsed) if isinstance(parsed, list) else 1
+        # JSON-RPC batches are routed element by element
+        for msg in parsed if isinstance(parsed, list) else [parsed]:
+            self._route_client_message(msg, message if not isinstance(parsed, list) else json.dumps(msg))
+
+    def _route_client_message(self, msg, raw):
+        if not isinstance(msg, dict):
+            self._send_to_worker(self.pick_worker(), raw)
+            return
+        method = msg.get('method')
+        msg_id = msg.get('id')
+        size = len(raw.encode('utf-8'))
+
+        if method is None and msg_id in self._server_requests:
+            # Client reply to a request a worker sent
+            self.metrics.request_finished('worker', msg_id, PipeMetrics.failed(msg), size)
+            worker, original_id = self._server_requests.pop(msg_id)
+            msg['id'] = original_id
+            self._send_to_worker(worker, json.dumps(msg))
+        elif method is None:
+            # A reply nobody waits for: its worker crashed, or it answers a
+            # request sent to an earlier connection
+            logger.warning(f"Dropped client reply to an unknown request: {raw[:120]}...")
+        elif method == 'initialize':
+            self._initialize = msg
+            live = [w for w in self.workers if w.alive]
+            pipe_id = self._to_pipe_id(msg_id)
+            self._pending[pipe_id] = (None, msg_id)
+            self._broadcast_waiting[pipe_id] = len(live)
+            self.metrics.request_started('client', pipe_id, method, size)
+            self._broadcast(json.dumps(dict(msg, id=pipe_id), ensure_ascii=False))
+        elif msg_id is None:
+            # Notification
+            if method == 'notifications/initialized':
+                self._initialized = raw
+            params = msg.get('params') or {}
+            pipe_id = self._client_ids.get(params.get('requestId'))
+            owner, _ = self._pending.get(pipe_id, (None, None))
+            if method == 'notifications/cancelled' and owner is not None:
+                cancel = dict(msg, params=dict(params, requestId=pipe_id))
+                self._send_to_worker(owner, json.dumps(cancel, ensure_ascii=False))
+            else:
+                self._broadcast(raw)
+        else:
+            worker = self.pick_worker()
+            worker.outstanding += 1
+            pipe_id = self._to_pipe_id(msg_id)
+            self._pending[pipe_id] = (worker, msg_id)
+            self.metrics.request_started('client', pipe_id, PipeMetrics.method_label(msg), size)
+            if not self._send_to_worker(worker, json.dumps(dict(msg, id=pipe_id), ensure_ascii=False)):
+                error = self._fail_request(pipe_id, "MCP worker unavailable")
+                asyncio.get_running_loop().create_task(self.send_to_client(error))
+
+    async def handle_worker_message(self, worker, line):
+        """Route one line of worker output back to the client"""
+        try:
+            msg = json.loads(line)
+        except ValueError:
+            await self.send_to_client(line, batchable=False)
+            return
+        if not isinstance(msg, dict):
+            await self.send_to_client(line, batchable=False)
+            return
+
+        msg_id = msg.get('id')
+        if 'method' not in msg and msg_id is not None:
+            # Response to a client request
+            if msg_id == INIT_REPLAY_ID:
+                return
+            if not self._is_current(msg_id):
+                logger.debug(f"Dropped reply to an earlier connection: {line[:120]}...")
+                return
+            if msg_id in self._broadcast_waiting:
+                # Forward the first reply to a broadcast, swallow the rest
+                self._broadcast_waiting[msg_id] -= 1
+                if self._broadcast_waiting[msg_id] <= 0:
+                    del self._broadcast_waiting[msg_id]
+            entry = self._pending.pop(msg_id, None)
+            if entry is None:
+                return
+            owner, client_id = entry
+            if owner is worker:
+                worker.outstanding = max(0, worker.outstanding - 1)
+            if self._client_ids.get(client_id) == msg_id:
+                del self._client_ids[client_id]
+            self.metrics.request_finished('client', msg_id, PipeMetrics.failed(msg), len(line))
+            msg['id'] = client_id
+            await self.send_to_client(json.dumps(msg, ensure_ascii=False) + '\n')
+        elif msg_id is not None:
+            # Request from a worker to the client
+            prefixed = f"{worker.index}:{msg_id}"
+            self._server_requests[prefixed] = (worker, msg_id)
+            self.metrics.request_started('worker', prefixed, PipeMetrics.method_label(msg), len(line))
+            msg['id'] = prefixed
+            await self.send_to_client(json.dumps(msg, ensure_ascii=False) + '\n')
+        else:
+            await self.send_to_client(line)
+
+    async def worker_exited(self, worker):
+        """Fail the worker's in-flight requests, then respawn and re-initialize it"""
+        code = worker.process.returncode if worker.process else None
+        logger.error(f"Worker {worker.index} exited (code {code}), respawning")
+        for pipe_id, (owner, _) in list(self._pending.items()):
+            if owner is worker:
+                await self.send_to_client(self._fail_request(pipe_id, "MCP worker crashed"))
+        for prefixed, (owner, _) in list(self._server_requests.items()):
+            if owner is worker:
+                del self._server_requests[prefixed]
+                self.metrics.request_finished('worker', prefixed, True, 0)
+
+        await asyncio.sleep(RESPAWN_DELAY)
+        await worker.start()
+        if self._initialize is not None:
+            replay = dict(self._initialize, id=INIT_REPLAY_ID)
+            self._send_to_worker(worker, json.dumps(replay))
+            if self._initialized is not None:
+                self._send_to_worker(worker, self._initialized)
+
+router = None
+
+async def get_router():
+    """Get the worker router, starting its workers on first use"""
+    global router
+    if router is None:
+        router = Router(mcp_script)
+        await router.start()
+    else:
+        logger.info(f"Reusing running {mcp_script} worker(s)")
+    return router
+
 async def connect_to_server(uri):
     """Connect to WebSocket server and establish bidirectional communication with `mcp_script`"""
     global reconnect_attempt, backoff
+    server = None
     try:
         logger.info(f"Connecting to WebSocket server...")
-        async with websockets.connect(uri) as websocket:
-            logger.info(f"Successfully connected to WebSocket server")
+        compression = None if COMPRESSION == 'none' else COMPRESSION
+        async with websockets.connect(uri, compression=compression) as websocket:
+            extensions = ', '.join(e.name for e in websocket.extensions) or 'none'
+            logger.info(f"Successfully connected to WebSocket server (extensions: {extensions})")
             
             # Reset reconnection counter if connection closes normally
             reconnect_attempt = 0
             backoff = INITIAL_BACKOFF
             
-            # Start mcp_script process
-            process = subprocess.Popen(
-                ['python',mcp_script],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                encoding='utf-8',
-                text=True  # Use text mode
-            )
-            logger.info(f"Started {mcp_script} process")
-            
-            # Create two tasks: read from WebSocket and write to process, read from process and write to WebSocket
-            await asyncio.gather(
-                pipe_websocket_to_process(websocket, process),
-                pipe_process_to_websocket(process, websocket),
-                pipe_process_stderr_to_terminal(process)
-            )
+            # Attach the long-lived worker(s) (started on first connect)
+            server = await get_router()
+            server.attach(websocket)
+            await pipe_websocket_to_router(websocket, server)
     except websockets.exceptions.ConnectionClosed as e:
         logger.error(f"WebSocket connection closed: {e}")
         raise  # Re-throw exception to trigger reconnection
@@ -90,77 +569,94 @@ async def connect_to_server(uri):
         logger.error(f"Connection error: {e}")
         raise  # Re-throw exception
     finally:
-        # Ensure the child process is properly terminated
-        if 'process' in locals():
-            logger.info(f"Terminating {mcp_script} process")
-            try:
-                process.terminate()
-                process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                process.kill()
-            logger.info(f"{mcp_script} process terminated")
-
-async def pipe_websocket_to_process(websocket, process):
-    """Read data from WebSocket and write to process stdin"""
+        # Keep the workers running for the next connection
+        if server is not None:
+            server.detach()
+
+async def pipe_websocket_to_router(websocket, router):
+    """Read data from WebSocket and route it to the worker processes"""
     try:
         while True:
             # Read message from WebSocket
             message = await websocket.recv()
             logger.debug(f"<< {message[:120]}...")
             
-            # Write to process stdin (in text mode)
             if isinstance(message, bytes):
                 message = message.decode('utf-8')
-            process.stdin.write(message + '\n')
-            process.stdin.flush()
+            router.handle_client_message(message)
     except Exception as e:
         logger.error(f"Error in WebSocket to process pipe: {e}")
         raise  # Re-throw exception to trigger reconnection
-    finally:
-        # Close process stdin
-        if not process.stdin.closed:
-            process.stdin.close()
 
-async def pipe_process_to_websocket(process, websocket):
-    """Read data from process stdout and send to WebSocket"""
+async def read_frame(reader):
+    """Read one newline-delimited frame of any length (b'' at EOF)"""
+    chunks = []
+    while True:
+        try:
+            chunks.append(await reader.readuntil(b'\n'))
+            break
+        except asyncio.LimitOverrunError as e:
+            # Frame longer than the buffer: take what is there and keep reading
+            chunks.append(await reader.readexactly(e.consumed))
+        except asyncio.IncompleteReadError as e:
+            chunks.append(e.partial)
+            break
+    return b''.join(chunks)
+
+async def pipe_process_to_router(worker):
+    """Read frames from a worker's stdout and hand them to the router"""
+    process = worker.process
+    while True:
+        # Read data from process stdout
+        data = await read_frame(process.stdout)
+        
+        if not data:  # If no data, the process may have ended
+            logger.info(f"Worker {worker.index} has ended output")
+            break
+            
+        await worker.router.handle_worker_message(worker, data)
+        
+    # The exit status is only reported once every pipe is closed
+    process.stdin.close()
+    await process.wait()
+    if worker.process is process:
+        await worker.router.worker_exited(worker)
+
+async def pipe_outbox_to_process(process, outbox):
+    """Write queued frames to process stdin, waiting on the pipe's backpressure"""
     try:
         while True:
-            # Read data from process stdout
-            data = await asyncio.get_event_loop().run_in_executor(
-                None, process.stdout.readline
-            )
-            
-            if not data:  # If no data, the process may have ended
-                logger.info("Process has ended output")
-                break
-                
-            # Send data to WebSocket
-            logger.debug(f">> {data[:120]}...")
-            # In text mode, data is already a string, no need to decode
-            await websocket.send(data)
-    except Exception as e:
-        logger.error(f"Error in process to WebSocket pipe: {e}")
-        raise  # Re-throw exception to trigger reconnection
+            data = await outbox.get()
+            process.stdin.write(data)
+            await process.stdin.drain()
+    except (BrokenPipeError, ConnectionResetError) as e:
+        logger.error(f"Error in process stdin pipe: {e}")
 
 async def pipe_process_stderr_to_terminal(process):
     """Read data from process stderr and print to terminal"""
     try:
         while True:
             # Read data from process stderr
-            data = await asyncio.get_event_loop().run_in_executor(
-                None, process.stderr.readline
-            )
+            data = await read_frame(process.stderr)
             
             if not data:  # If no data, the process may have ended
                 logger.info("Process has ended stderr output")
                 break
                 
-            # Print stderr data to terminal (in text mode, data is already a string)
-            sys.stderr.write(data)
+            # Print stderr data to terminal
+            sys.stderr.buffer.write(data)
             sys.stderr.flush()
     except Exception as e:
         logger.error(f"Error in process stderr pipe: {e}")
-        raise  # Re-throw exception to trigger reconnection
+        raise
+
+async def main(uri):
+    """Run the reconnect loop and stop the worker processes on exit"""
+    try:
+        await connect_with_retry(uri)
+    finally:
+        if router is not None:
+            await router.stop()
 
 def signal_handler(sig, frame):
     """Handle interrupt signals"""
@@ -186,7 +682,7 @@ if __name__ == "__main__":
     
     # Start main loop
     try:
-        asyncio.run(connect_with_retry(endpoint_url))
+        asyncio.run(main(endpoint_url))
     except KeyboardInterrupt:
         logger.info("Program interrupted by user")
     except Exception as e:
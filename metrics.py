@@ -0,0 +1,277 @@
+"""
+Lightweight latency/size metrics with Prometheus text exposition.
+
+Histogram is shared by mcp_pipe.py (per JSON-RPC method / tool latency) and
+server.py (per-phase timings), so neither needs a metrics client library.
+"""
+
+import asyncio
+import json
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, size buckets in bytes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class Histogram:
+    """Fixed-bucket histogram (cumulative counts, like a Prometheus histogram)"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bucket bound containing the q-quantile (the largest bound for +Inf)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def render(self, name: str, labels: str) -> list:
+        """Prometheus text lines for this histogram"""
+        sep = "," if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum:.6f}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class PipeMetrics:
+    """Per-method JSON-RPC request metrics, matched by request id
+
+    Requests are keyed by the method, or "tools/call:<tool>" for tool calls,
+    and by the direction they travel ("client" requests go to a worker,
+    "worker" requests go to the client).
+    """
+
+    def __init__(self):
+        self._in_flight = {}  # (direction, id) -> ((direction, label), started)
+        self.latency = {}
+        self.response_size = {}
+        self.request_bytes = {}
+        self.requests = {}
+        self.errors = {}
+
+    @staticmethod
+    def method_label(msg: dict) -> str:
+        method = msg.get("method") or ""
+        if method == "tools/call":
+            name = (msg.get("params") or {}).get("name")
+            if name:
+                return f"tools/call:{name}"
+        return method
+
+    @staticmethod
+    def failed(msg: dict) -> bool:
+        """Whether a response reports a failure
+
+        Besides JSON-RPC errors, tool calls fail inside a result: FastMCP sets
+        `isError`, and the tools return `{"success": false, ...}` as
+        structured or JSON text content.
+        """
+        if "error" in msg:
+            return True
+        result = msg.get("result")
+        if not isinstance(result, dict):
+            return False
+        if result.get("isError"):
+            return True
+        structured = result.get("structuredContent")
+        if isinstance(structured, dict):
+            if "success" not in structured:
+                # Non-object tool outputs are wrapped as {"result": ...}
+                structured = structured.get("result")
+            return isinstance(structured, dict) and structured.get("success") is False
+        content = result.get("content")
+        if isinstance(content, list) and len(content) == 1 and isinstance(content[0], dict):
+            text = content[0].get("text") or ""
+            if text.startswith("{") and '"success"' in text:
+                try:
+                    return json.loads(text).get("success") is False
+                except ValueError:
+                    return False
+        return False
+
+    def request_started(self, direction: str, msg_id, label: str, size: int):
+        key = (direction, label)
+        self._in_flight[(direction, msg_id)] = (key, time.monotonic())
+        self.requests[key] = self.requests.get(key, 0) + 1
+        self.request_bytes[key] = self.request_bytes.get(key, 0) + size
+
+    def request_finished(self, direction: str, msg_id, error: bool, size: int):
+        entry = self._in_flight.pop((direction, msg_id), None)
+        if entry is None:
+            return
+        key, started = entry
+        self.latency.setdefault(key, Histogram()).observe(time.monotonic() - started)
+        self.response_size.setdefault(key, Histogram(SIZE_BUCKETS)).observe(size)
+        if error:
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def abandon_in_flight(self):
+        """Forget requests whose connection is gone"""
+        self._in_flight.clear()
+
+    def in_flight(self) -> dict:
+        counts = {}
+        for key, _ in self._in_flight.values():
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def render_prometheus(self) -> str:
+        lines = []
+        labels = lambda key: f'direction="{key[0]}",method="{_escape(key[1])}"'
+
+        lines.append("# TYPE mcp_pipe_requests_total counter")
+        lines += [f"mcp_pipe_requests_total{{{labels(k)}}} {v}" for k, v in sorted(self.requests.items())]
+        lines.append("# TYPE mcp_pipe_errors_total counter")
+        lines += [f"mcp_pipe_errors_total{{{labels(k)}}} {v}" for k, v in sorted(self.errors.items())]
+        lines.append("# TYPE mcp_pipe_request_bytes_total counter")
+        lines += [f"mcp_pipe_request_bytes_total{{{labels(k)}}} {v}" for k, v in sorted(self.request_bytes.items())]
+        lines.append("# TYPE mcp_pipe_in_flight gauge")
+        lines += [f"mcp_pipe_in_flight{{{labels(k)}}} {v}" for k, v in sorted(self.in_flight().items())]
+        lines.append("# TYPE mcp_pipe_request_duration_seconds histogram")
+        for key, histogram in sorted(self.latency.items()):
+            lines += histogram.render("mcp_pipe_request_duration_seconds", labels(key))
+        lines.append("# TYPE mcp_pipe_response_size_bytes histogram")
+        for key, histogram in sorted(self.response_size.items()):
+            lines += histogram.render("mcp_pipe_response_size_bytes", labels(key))
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """One line per method: count, errors, p50/p95/p99 latency bucket, in flight"""
+        in_flight = self.in_flight()
+        parts = []
+        for key, count in sorted(self.requests.items()):
+            histogram = self.latency.get(key, Histogram())
+            parts.append(
+                f"{key[0]} {key[1]}: n={count} err={self.errors.get(key, 0)} "
+                f"p50<={histogram.quantile(0.5)}s p95<={histogram.quantile(0.95)}s "
+                f"p99<={histogram.quantile(0.99)}s in_flight={in_flight.get(key, 0)}"
+            )
+        return "; ".join(parts) or "no requests"
+
+
+# (tool name, {phase: seconds}) of the tool call running in this task, if any
+_current_call = contextvars.ContextVar("current_call", default=None)
+
+
+class PhaseTimings:
+    """Per-phase timing spans for server tool calls
+
+    `call(tool)` scopes a tool call; every `span(phase)` entered inside it
+    (including in tasks it gathers) is added to that call's breakdown and
+    to a "<tool>.<phase>" histogram. Phases repeated within one call, such
+    as the goto of each page of a multi-page ranking, are summed.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+
+    def record(self, phase: str, seconds: float):
+        current = _current_call.get()
+        tool = current[0] if current else "background"
+        self.histograms.setdefault(f"{tool}.{phase}", Histogram()).observe(seconds)
+        if current:
+            current[1][phase] = current[1].get(phase, 0.0) + seconds
+
+    @contextmanager
+    def span(self, phase: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - started)
+
+    @contextmanager
+    def call(self, tool: str):
+        """Scope one tool call; yields its {phase: seconds} dict, completed with "total" on exit"""
+        timings = {}
+        token = _current_call.set((tool, timings))
+        started = time.perf_counter()
+        try:
+            yield timings
+        finally:
+            _current_call.reset(token)
+            timings["total"] = time.perf_counter() - started
+            self.histograms.setdefault(f"{tool}.total", Histogram()).observe(timings["total"])
+
+    @staticmethod
+    def detach():
+        """Stop attributing spans in the current task to the caller's tool call"""
+        _current_call.set(None)
+
+    @staticmethod
+    def as_ms(timings: dict) -> dict:
+        return {phase: round(seconds * 1000, 1) for phase, seconds in timings.items()}
+
+    def summary(self) -> str:
+        parts = []
+        for name, histogram in sorted(self.histograms.items()):
+            parts.append(
+                f"{name}: n={histogram.count} avg={histogram.sum / histogram.count * 1000:.0f}ms "
+                f"p50<={histogram.quantile(0.5)}s p99<={histogram.quantile(0.99)}s"
+            )
+        return "; ".join(parts) or "no calls"
+
+
+async def serve_metrics(render, port: int, host: str = "127.0.0.1"):
+    """Serve render() as Prometheus text on http://host:port/metrics"""
+    async def handle(reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            path = request_line.split()[1] if len(request_line.split()) > 1 else b"/"
+            if path == b"/metrics":
+                body = render().encode("utf-8")
+                status = b"200 OK"
+            else:
+                body = b"not found\n"
+                status = b"404 Not Found"
+            writer.write(
+                b"HTTP/1.1 " + status + b"\r\n"
+                b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                b"Connection: close\r\n\r\n" + body
+            )
+            await writer.drain()
+        except Exception as e:
+            logger.debug(f"Metrics request failed: {e}")
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,189 @@
+"""
+Offline parsers for Dianping list and detail pages.
+
+These work on raw HTML (page.content(), a plain HTTP fetch or a saved file)
+with the same selectors the Playwright extraction uses, so no DOM roundtrips
+are needed and the parsers can be tested and benchmarked without a browser.
+
+Usage:
+
+python parsers.py list saved/ch10.html [...]
+python parsers.py detail saved/shop.html [...]
+
+"""
+
+import json
+import sys
+from selectolax.lexbor import LexborHTMLParser
+
+
+def star_class_to_rating(star_classes: str) -> str:
+    """Convert star class string to numeric rating
+
+    Args:
+        star_classes: Class string like 'star star_40 star_sml'
+
+    Returns:
+        String rating like '4.0' or '4.5'
+    """
+    if not star_classes:
+        return "0"
+    try:
+        # Find the class that starts with 'star_' and contains numbers
+        classes = star_classes.split()
+        rating_class = next((c for c in classes if c.startswith('star_') and c[5:].isdigit()), None)
+        if rating_class:
+            num = int(rating_class.replace('star_', ''))
+            rating = num / 10
+            return str(rating)
+        return "0"
+    except:
+        return "0"
+
+def shop_id_from_href(href: str) -> str:
+    """Extract the shop id from a link like 'https://www.dianping.com/shop/H1a2b3'"""
+    if not href:
+        return ""
+    parts = href.split("/")
+    if "shop" in parts:
+        idx = parts.index("shop")
+        if idx + 1 < len(parts):
+            return parts[idx + 1]
+    return ""
+
+def build_shop_item(raw: dict) -> dict:
+    """Convert raw extracted list fields into a ranking result item"""
+    star_class = raw.get("star_class")
+    return {
+        "shop_id": shop_id_from_href(raw.get("href") or ""),
+        "name": raw.get("name", ""),
+        "rating": star_class_to_rating(star_class) if star_class is not None else "",  # Numeric rating like "4.5"
+        "review_count": raw.get("review_count", ""),
+        "address": raw.get("address", ""),
+        "price": raw.get("price", ""),
+        "recommend": raw.get("recommend", [])
+    }
+
+def build_shop_detail(shop_id: str, fields: dict) -> dict:
+    """Build the dianping_shop_detail result (including markdown) from extracted fields"""
+    get = lambda key: fields.get(key, "")
+    tags = fields.get("tags", [])
+    recommend_dishes = fields.get("recommend_dishes", [])
+
+    # 生成Markdown格式文本
+    md = f"""# {get('name')}
+
+**评分**: {get('rating')} ({get('review_count')})  
+**人均**: {get('price')}  
+**地区**: {get('region')}  
+**分类**: {get('category')}  
+**评分详情**: {get('score_text')}
+
+**地址**: {get('address')}  
+{get('address_desc')}
+
+**营业信息**: {get('biz_info')}  
+**特色**: {' '.join(tags)}
+
+**推荐菜**:
+{', '.join(recommend_dishes)}
+"""
+
+    return {
+        "success": True,
+        "shop_id": shop_id,
+        "name": get('name'),
+        "rating": get('rating'),
+        "review_count": get('review_count'),
+        "price": get('price'),
+        "address": get('address'),
+        "md": md
+    }
+
+def _text(node) -> str:
+    return node.text().strip() if node is not None else ""
+
+def _first_text(root, selector: str) -> str:
+    return _text(root.css_first(selector))
+
+def _first_attr(root, selector: str, name: str):
+    node = root.css_first(selector)
+    if node is None:
+        return None
+    return node.attributes.get(name) or ""
+
+def parse_shop_list(html: str) -> list:
+    """Parse a category list page into ranking result items"""
+    return _shop_items(LexborHTMLParser(html))
+
+def parse_list_page(html: str) -> tuple:
+    """Parse a category list page into (ranking result items, last page number)
+
+    The last page number comes from the pager and is None when the page has none.
+    """
+    tree = LexborHTMLParser(html)
+    return _shop_items(tree), _last_page(tree)
+
+def _last_page(tree):
+    numbers = [int(text) for text in (_text(a) for a in tree.css('.page a')) if text.isdigit()]
+    return max(numbers) if numbers else None
+
+def _shop_items(tree) -> list:
+    items = []
+    for shop in tree.css('.shop-all-list ul li'):
+        items.append(build_shop_item({
+            "name": _first_text(shop, '.tit a h4'),
+            "href": _first_attr(shop, '.tit a', 'href'),
+            "star_class": _first_attr(shop, '.nebula_star .star_icon span', 'class'),
+            "review_count": _first_text(shop, '.review-num b'),
+            "address": " ".join(_text(span) for span in shop.css('.tag-addr a span.tag')),
+            "price": _first_text(shop, '.mean-price b'),
+            "recommend": [_text(a) for a in shop.css('.recommend a.recommend-click')],
+        }))
+    return items
+
+def parse_shop_detail_fields(html: str) -> dict:
+    """Parse a shop detail page into the fields used by build_shop_detail
+
+    Returns:
+        dict of fields, or {} if the page has no '.shopName' (not a loaded detail page)
+    """
+    tree = LexborHTMLParser(html)
+    if tree.css_first('.shopName') is None:
+        return {}
+
+    biz_info = ""
+    biz_tag = tree.css_first('.biz-txt')
+    biz_time = tree.css_first('.biz-time')
+    if biz_tag is not None and biz_time is not None:
+        biz_info = f"{_text(biz_tag)} {_text(biz_time)}"
+
+    return {
+        "name": _first_text(tree, '.shopName'),
+        "rating": _first_text(tree, '.star-score'),
+        "review_count": _first_text(tree, '.reviews'),
+        "price": _first_text(tree, '.price'),
+        "region": _first_text(tree, '.region'),
+        "category": _first_text(tree, '.category'),
+        "score_text": _first_text(tree, '.scoreText'),
+        "address": _first_text(tree, '.addressText'),
+        "address_desc": _first_text(tree, '.desc-addr-txt'),
+        "biz_info": biz_info,
+        "tags": [_text(tag) for tag in tree.css('.feature-txt')],
+        "recommend_dishes": [_text(dish) for dish in tree.css('.food')],
+    }
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("list", "detail"):
+        print("Usage: parsers.py list|detail <file.html> [...]", file=sys.stderr)
+        sys.exit(1)
+
+    results = {}
+    for filepath in sys.argv[2:]:
+        with open(filepath, encoding="utf-8") as f:
+            html = f.read()
+        if sys.argv[1] == "list":
+            results[filepath] = parse_shop_list(html)
+        else:
+            results[filepath] = parse_shop_detail_fields(html)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
@@ -0,0 +1,128 @@
+"""
+Speculative prefetch of shop details.
+
+Clients usually follow a ranking with dianping_shop_detail calls on its first
+few shops. With DIANPING_PREFETCH_TOP_K set, the top K shop_ids of every
+fresh ranking are queued and loaded into the detail cache by one background
+worker, so those follow-up calls are cache hits.
+
+Prefetching only uses spare capacity: a queued shop is dropped, not delayed,
+when no page slot is free or the origin's rate budget has no token to spare.
+The hit ratio (prefetched details that were later requested) is tracked for
+tuning K.
+"""
+
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+
+from metrics import PhaseTimings
+
+logger = logging.getLogger(__name__)
+
+# Shops prefetched per ranking (0 disables prefetching)
+PREFETCH_TOP_K = int(os.environ.get("DIANPING_PREFETCH_TOP_K", "0"))
+PREFETCH_QUEUE = int(os.environ.get("DIANPING_PREFETCH_QUEUE", "100"))
+# Prefetched shops remembered for the hit ratio
+MAX_TRACKED = 1000
+
+
+class DetailPrefetcher:
+    """Load the top shops of rankings into the detail cache in the background"""
+
+    def __init__(self, load, is_cached, has_capacity, top_k=None, queue_size=None):
+        """
+        Args:
+            load: async function(shop_id) scraping a detail into the cache; returns a result dict
+            is_cached: function(shop_id) telling whether a fresh detail is cached
+            has_capacity: function() telling whether a load can start without holding up callers
+        """
+        self.load = load
+        self.is_cached = is_cached
+        self.has_capacity = has_capacity
+        self.top_k = PREFETCH_TOP_K if top_k is None else top_k
+        self.queue_size = queue_size or PREFETCH_QUEUE
+        self._queue = None
+        self._queued = set()
+        self._task = None
+        # Prefetched shop_ids not requested yet
+        self._unused = OrderedDict()
+        self.offered = 0
+        self.prefetched = 0
+        self.used = 0
+        self.skipped = 0
+        self.failed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.top_k > 0
+
+    def offer(self, shop_ids: list):
+        """Queue the top K of a ranking's shop_ids that aren't cached yet"""
+        if not self.enabled:
+            return
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue(self.queue_size)
+            self._queued.clear()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        for shop_id in shop_ids[:self.top_k]:
+            if not shop_id or shop_id in self._queued or self.is_cached(shop_id):
+                continue
+            try:
+                self._queue.put_nowait(shop_id)
+            except asyncio.QueueFull:
+                self.skipped += 1
+                continue
+            self._queued.add(shop_id)
+            self.offered += 1
+
+    def record(self, shop_id: str, hit: bool):
+        """Note a detail request; a cache hit on a prefetched shop counts toward the hit ratio"""
+        if self._unused.pop(shop_id, None) is not None and hit:
+            self.used += 1
+
+    async def _run(self):
+        # Not part of the tool call that queued the shops
+        PhaseTimings.detach()
+        while True:
+            shop_id = await self._queue.get()
+            self._queued.discard(shop_id)
+            if self.is_cached(shop_id):
+                continue
+            if not self.has_capacity():
+                self.skipped += 1
+                continue
+            try:
+                result = await self.load(shop_id)
+            except Exception as e:
+                result = {"success": False, "error": str(e)}
+            if not result.get("success"):
+                self.failed += 1
+                logger.debug(f"Prefetch of {shop_id} failed: {result.get('error')}")
+                continue
+            self.prefetched += 1
+            self._unused[shop_id] = True
+            self._unused.move_to_end(shop_id)
+            while len(self._unused) > MAX_TRACKED:
+                self._unused.popitem(last=False)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "top_k": self.top_k,
+            "offered": self.offered,
+            "prefetched": self.prefetched,
+            "used": self.used,
+            "hit_ratio": round(self.used / self.prefetched, 3) if self.prefetched else 0.0,
+            "skipped": self.skipped,
+            "failed": self.failed,
+        }
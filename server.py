@@ -1,410 +1,737 @@
 from mcp.server.fastmcp import FastMCP
-from playwright.sync_api import sync_playwright  # Changed to sync API
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
+from contextlib import asynccontextmanager
 from pathlib import Path
+import asyncio
+import functools
 import os
 import logging
+import time
+from datetime import datetime
 from typing import Annotated, Literal
 from pydantic import Field
+from browser_pool import ContextPool, ResourceBlocker, HarArchive, HAR_MODE
+from http_client import HttpFetcher, NeedsBrowser, unusable_page, pushback_sign
+from session import SessionCache, detect_auth_failure, ORIGIN
+from cache import ResultCache, SingleFlight, RANK_TTL, DETAIL_TTL, RANK_MAX_STALE, DETAIL_MAX_STALE
+from metrics import PhaseTimings
+from catalog import get_catalog, load_menu, load_regions
+from throttle import Throttle, CircuitOpen
+from warmer import CacheWarmer, seed_combinations, WARM_ENABLED, WARM_WORKER
+from prefetch import DetailPrefetcher
+from parsers import (
+    star_class_to_rating, shop_id_from_href, build_shop_item, build_shop_detail,
+    parse_list_page, parse_shop_detail_fields
+)
 
-mcp = FastMCP("DianpingMCP")
+@asynccontextmanager
+async def server_lifespan(server):
+    """Start the browser with the MCP server and shut it down with it"""
+    if not await initialize_browser():
+        raise RuntimeError("Failed to initialize browser")
+    if WARM_ENABLED and WARM_WORKER:
+        _warmer.start(warm_seed_urls())
+    try:
+        yield
+    finally:
+        await shutdown_browser()
+
+mcp = FastMCP("DianpingMCP", lifespan=server_lifespan)
 
 # Global instances
+_playwright = None
 _browser = None
-_context = None
+_browser_lock = asyncio.Lock()
+_pool = None
+_session = SessionCache()
+_revalidation_task = None
+_refresh_tasks = {}
+_cache = ResultCache()
+_flights = SingleFlight()
+_timings = PhaseTimings()
+_http = HttpFetcher()
+_throttle = Throttle()
+_warmer = CacheWarmer(
+    refresh=lambda url: refresh_shop_list_page(url),
+    expiry=lambda url: _cache.expiry("rank", url),
+    ttl=RANK_TTL
+)
+_prefetcher = DetailPrefetcher(
+    load=lambda shop_id: refresh_shop_detail(shop_id),
+    is_cached=lambda shop_id: detail_cached(shop_id),
+    has_capacity=lambda: not _page_slots.locked() and _throttle.spare(ORIGIN)
+)
+
+# How pages are turned into results:
+#   "evaluate" - one in-page JS pass (default)
+#   "html"     - grab page.content() once and parse it offline with parsers.py
+EXTRACTION_MODE = os.environ.get("DIANPING_EXTRACTION", "evaluate")
+
+# How list pages are loaded:
+#   "http"    - plain HTTP with the auth.json cookies, falling back to the
+#               browser on captcha or JS-only pages (default; off while a HAR
+#               archive is recording or replaying, which only sees browser traffic)
+#   "browser" - always a Chromium navigation
+LIST_FETCH_MODE = os.environ.get("DIANPING_LIST_FETCH", "http")
+
+# Maximum number of tool calls driving a page at the same time
+MAX_CONCURRENCY = int(os.environ.get("DIANPING_MAX_CONCURRENCY", "4"))
+_page_slots = asyncio.Semaphore(MAX_CONCURRENCY)
+
+# Multi-page rankings: shops per list page, page cap and per-call parallelism
+SHOPS_PER_PAGE = 15
+MAX_RANK_PAGES = int(os.environ.get("DIANPING_MAX_RANK_PAGES", "10"))
+RANK_PAGE_PARALLELISM = int(os.environ.get("DIANPING_RANK_PAGE_PARALLELISM", "3"))
+
+# Batch shop details: ids per call, per-call parallelism and per-item timeout
+MAX_BATCH_SIZE = int(os.environ.get("DIANPING_MAX_BATCH_SIZE", "50"))
+BATCH_PARALLELISM = int(os.environ.get("DIANPING_BATCH_PARALLELISM", "4"))
+BATCH_ITEM_TIMEOUT = float(os.environ.get("DIANPING_BATCH_ITEM_TIMEOUT", "30"))
+
+# Ranking sort orders and their URL suffixes
+SORT_CODES = {
+    "智能排序": "",
+    "好评优先": "o3",
+    "人气优先": "o2",
+    "口味优先": "o4",
+    "评价最多": "o11",
+    "环境最佳": "o5",
+    "服务最佳": "o6",
+    "预订优先": "o13",
+    "人均最高": "o9",
+    "人均最低": "o8"
+}
+
+# Log every call's phase breakdown and add it to results as "timings" (ms)
+DEBUG_TIMINGS = os.environ.get("DIANPING_DEBUG_TIMINGS", "0") == "1"
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def get_browser():
+async def get_browser():
     """Get or create a browser instance with anti-automation features disabled"""
-    global _browser
+    global _playwright, _browser
     
-    if _browser is None:
-        logger.info("Creating new browser instance...")
-        p = sync_playwright().start()
-        _browser = p.chromium.launch(
-            headless=True,
-            args=['--disable-blink-features=AutomationControlled']
-        )
-        logger.info("Browser instance created successfully")
-    else:
-        logger.debug("Using existing browser instance")
+    async with _browser_lock:
+        if _browser is None:
+            logger.info("Creating new browser instance...")
+            _playwright = await async_playwright().start()
+            _browser = await _playwright.chromium.launch(
+                headless=True,
+                args=['--disable-blink-features=AutomationControlled']
+            )
+            logger.info("Browser instance created successfully")
+        else:
+            logger.debug("Using existing browser instance")
         
     return _browser
-# 加载分类菜单（dianping-menu.txt），返回dict: {分类名: url}
-def load_menu(filepath="dianping-menu.txt"):
-    menu = {}
-    
-    with open(filepath, encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line or line.startswith("//") or line.startswith("#"):
-                continue
-                
-            parts = line.split("\t")
-            if len(parts) == 2:
-                name, url = parts
-                menu[name] = url
-    return menu
-
-def load_regions(filepath="dianping-region.txt"):
-    """
-    Load region information from file, organized by city
-    Returns: dict {city: {region_name: region_code}}
-    Format example:
-    beijing 国贸/建外 r2578
-    beijing 三里屯/工体 r2580
-    """
-    regions = {}
-    current_city = None
-    
-    with open(filepath, encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            # Skip empty lines, comments and headers
-            if not line or line.startswith("#") or line.startswith("//"):
-                continue
-                
-            # Parse region line
-            parts = line.split()
-            if len(parts) == 3:
-                city, name, code = parts
-                city = city.lower()
-                if city not in regions:
-                    regions[city] = {}
-                regions[city][name] = code
-    
-    return regions
 
-MENU = load_menu()
-REGIONS = load_regions()
+def get_pool() -> ContextPool:
+    """Get or create the shared pool of authenticated contexts"""
+    global _pool
+    if _pool is None:
+        _pool = ContextPool(get_browser, blocker=ResourceBlocker(), har=HarArchive(url=f"{ORIGIN}/**"))
+    return _pool
 
-def get_context():
-    """Get authenticated context from auth.json or return None if login required"""
-    auth_file = Path("auth.json")
-    if not auth_file.exists():
-        logger.error("Auth file not found")
-        return None
-        
-    try:
-        browser = get_browser()
-        context = browser.new_context(storage_state=str(auth_file))
-        
-        # Create test page with anti-detection headers
-        page = context.new_page()
-        page.set_extra_http_headers({
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-        })
-        
-        return context
-            
-    except Exception as e:
-        logger.error(f"Error loading auth context: {e}")
-        return None
+def not_found(error: str, suggestions: list) -> dict:
+    """Error result for an unresolvable name, with the closest known names"""
+    result = {"success": False, "error": error}
+    if suggestions:
+        result["suggestions"] = suggestions
+    return result
 
-def get_page(url: str = 'https://www.dianping.com/beijing'):
+async def get_page(url: str = None):
     """Get an authenticated page with anti-detection settings
     
+    The page is opened in a pooled context; closing it hands the context
+    back to the pool instead of tearing it down.
+    
     Args:
         url: Page URL to load (default: Beijing homepage)
         
+    The caller holds the origin's rate-limit token (see paced_load); failures
+    are reported to the limiter here, success by the caller once the content
+    is there.
+        
     Returns:
         tuple: (context, page) if authenticated, (None, None) if login required
     """
+    url = url or f"{ORIGIN}/beijing"
     auth_file = Path("auth.json")
     if not auth_file.exists():
         logger.error("Auth file not found")
         return None, None
         
     try:
-        browser = get_browser()
-        context = browser.new_context(storage_state=str(auth_file))
-        page = context.new_page()
+        with _timings.span("acquire"):
+            context, page = await get_pool().new_page(auth_file)
+    except Exception as e:
+        logger.error(f"Page creation failed: {e}")
+        return None, None
         
+    try:
         logger.info(f"Navigating to: {url}")
-        page.goto(url, wait_until='domcontentloaded')
-                    
-        try:
-            username_element = page.wait_for_selector('.userinfo-container .username', state='visible', timeout=10000)
-            username = username_element.text_content()
-            username = username.strip()
-            
-            if not username:
-                raise Exception("Username is empty")
-            logger.info(f"Login verified for user: {username}")
-            return context, page
-        except Exception as e:
-            logger.error(f"Login verification failed: {e}")
-            page.close()
+        with _timings.span("goto"):
+            await page.goto(url, wait_until='domcontentloaded')
+        
+        # Only a real auth failure blocks the request; the username check is cached
+        with _timings.span("auth_check"):
+            reason = detect_auth_failure(page.url, await context.cookies())
+        if reason:
+            _session.invalidate(reason)
+            # A missing or expired cookie is our problem; a login redirect is the site's
+            if pushback_sign(page.url):
+                _throttle.failure(url, "login")
+            logger.error(f"Login verification failed: {reason}")
+            await page.close()
             return None, None
             
+        if _session.due:
+            schedule_session_revalidation()
+        return context, page
+            
     except Exception as e:
         logger.error(f"Page creation failed: {e}")
+        _throttle.failure(url, "timeout" if isinstance(e, PlaywrightTimeoutError) else "error")
+        await page.close()
         return None, None
 
-def star_class_to_rating(star_classes: str) -> str:
-    """Convert star class string to numeric rating
+def schedule_session_revalidation():
+    """Start a background username check unless one is already running"""
+    global _revalidation_task
+    if _revalidation_task is None or _revalidation_task.done():
+        _revalidation_task = asyncio.get_running_loop().create_task(revalidate_session())
+
+async def revalidate_session(url: str = None):
+    """Verify the logged-in username on a separate page, off the request path"""
+    url = url or f"{ORIGIN}/beijing"
+    # Not part of the tool call that scheduled it
+    PhaseTimings.detach()
+    try:
+        async with paced_load(url), page_slot():
+            try:
+                context, page = await get_pool().new_page(Path("auth.json"))
+            except Exception as e:
+                logger.debug(f"Session revalidation skipped: {e}")
+                return
+            
+            try:
+                await page.goto(url, wait_until='domcontentloaded')
+                with _timings.span("login_wait"):
+                    username_element = await page.wait_for_selector('.userinfo-container .username', state='visible', timeout=10000)
+                username = (await username_element.text_content()).strip()
+                if not username:
+                    raise Exception("Username is empty")
+                _session.mark_valid(username)
+                _throttle.success(url)
+            except Exception as e:
+                _session.check_failed(f"username check failed: {e}")
+                kind = await page_pushback(page)
+                if kind:
+                    _throttle.failure(url, kind)
+            finally:
+                await page.close()
+    except CircuitOpen as e:
+        logger.debug(f"Session revalidation skipped: {e}")
+
+@asynccontextmanager
+async def paced_load(url: str):
+    """Hold one rate-limit token of url's origin for a whole load
     
-    Args:
-        star_classes: Class string like 'star star_40 star_sml'
-        
-    Returns:
-        String rating like '4.0' or '4.5'
+    An HTTP attempt and its browser fallback share the token. A load that
+    reports neither success nor pushback (a missing shop, no auth, a pool
+    error) releases a half-open probe on the way out instead of leaving the
+    circuit blocked for a cooldown.
+    
+    Raises:
+        CircuitOpen: the origin is cooling down after repeated failures
     """
-    if not star_classes:
-        return "0"
+    with _timings.span("throttle"):
+        await _throttle.acquire(url)
     try:
-        # Find the class that starts with 'star_' and contains numbers
-        classes = star_classes.split()
-        rating_class = next((c for c in classes if c.startswith('star_') and c[5:].isdigit()), None)
-        if rating_class:
-            num = int(rating_class.replace('star_', ''))
-            rating = num / 10
-            return str(rating)
-        return "0"
-    except:
-        return "0"
+        yield
+    finally:
+        _throttle.release(url)
+
+@asynccontextmanager
+async def page_slot():
+    """Hold one of the MAX_CONCURRENCY page slots, timing the wait as the "queue" phase"""
+    with _timings.span("queue"):
+        await _page_slots.acquire()
+    try:
+        yield
+    finally:
+        _page_slots.release()
+
+def timed(tool):
+    """Scope a tool's phase spans; log them and add "timings" when DEBUG_TIMINGS is set"""
+    @functools.wraps(tool)
+    async def wrapper(*args, **kwargs):
+        with _timings.call(tool.__name__) as timings:
+            result = await tool(*args, **kwargs)
+        timings = PhaseTimings.as_ms(timings)
+        logger.log(logging.INFO if DEBUG_TIMINGS else logging.DEBUG, f"{tool.__name__} timings (ms): {timings}")
+        if DEBUG_TIMINGS:
+            result = dict(result, timings=timings)
+        return result
+    return wrapper
+
+# Extracts every shop of a list page in a single page.evaluate() call
+SHOP_LIST_JS = """
+() => {
+    const text = (root, sel) => {
+        const el = root.querySelector(sel);
+        return el ? el.innerText : "";
+    };
+    const attr = (root, sel, name) => {
+        const el = root.querySelector(sel);
+        return el ? (el.getAttribute(name) || "") : null;
+    };
+    const pageNumbers = Array.from(document.querySelectorAll('.page a'))
+        .map(a => a.innerText.trim()).filter(t => /^[0-9]+$/.test(t)).map(Number);
+    const shops = Array.from(document.querySelectorAll('.shop-all-list ul li')).map(shop => ({
+        name: text(shop, '.tit a h4'),
+        href: attr(shop, '.tit a', 'href'),
+        star_class: attr(shop, '.nebula_star .star_icon span', 'class'),
+        review_count: text(shop, '.review-num b'),
+        address: Array.from(shop.querySelectorAll('.tag-addr a span.tag')).map(s => s.innerText).join(' '),
+        price: text(shop, '.mean-price b'),
+        recommend: Array.from(shop.querySelectorAll('.recommend a.recommend-click')).map(a => a.innerText),
+    }));
+    return {shops: shops, last_page: pageNumbers.length ? Math.max(...pageNumbers) : null};
+}
+"""
+
+# Extracts the fields of a shop detail page in a single page.evaluate() call
+SHOP_DETAIL_JS = """
+() => {
+    const text = sel => {
+        const el = document.querySelector(sel);
+        return el ? el.innerText : "";
+    };
+    const bizTag = document.querySelector('.biz-txt');
+    const bizTime = document.querySelector('.biz-time');
+    return {
+        name: text('.shopName'),
+        rating: text('.star-score'),
+        review_count: text('.reviews'),
+        price: text('.price'),
+        region: text('.region'),
+        category: text('.category'),
+        score_text: text('.scoreText'),
+        address: text('.addressText'),
+        address_desc: text('.desc-addr-txt'),
+        biz_info: bizTag && bizTime ? `${bizTag.innerText} ${bizTime.innerText}` : "",
+        tags: Array.from(document.querySelectorAll('.feature-txt')).map(t => t.innerText),
+        recommend_dishes: Array.from(document.querySelectorAll('.food')).map(d => d.innerText),
+    };
+}
+"""
 
 @mcp.tool()
-def dianping_category_rank(
+@timed
+async def dianping_category_rank(
     city: Annotated[str, Field(
         description="城市拼音，如 'beijing', 'shanghai'"
     )],
-    category: Annotated[Literal[
-        # 美食类
-        '美食', '火锅', '面包甜点', '本帮江浙菜', '日本菜', '咖啡厅', '自助餐', 
-        '小吃快餐', '西餐', '韩国料理', '粤菜', '烧烤', '东南亚菜', '川菜', 
-        '素菜', '东北菜', '湘菜', '云南菜', '新疆菜', '海鲜', '西北菜', 
-        '蟹宴', '台湾菜', '贵州菜', '面馆', '小龙虾', '江西菜', '家常菜', '其他',
-        # 周边游
-        '周边游', '自然景观', '人文古迹', '景区设施', '水上项目', '展览馆', 
-        '动植物园', '滑雪景区', '休闲园区', '公园', '公园售票处', '地标建筑', 
-        '主题乐园', '动物园', '温泉景区', '人文街区', '植物园', '纪念地', 
-        '度假景区', '影视基地', 
-        # 展览场馆
-        '博物馆', '美术馆', '纪念馆', '科技馆', '名人故居', '陈列馆', 
-        '天文馆', '蜡像馆', '宗教景区', '古村古镇',
-        # 休闲娱乐
-        '休闲娱乐', '足疗', 'KTV', '足疗按摩', '洗浴/汗蒸', '酒吧', '密室逃脱',
-        '轰趴馆', '茶馆', '私人影院', '网吧网咖', 'DIY手工坊', '采摘/农家乐',
-        '文化艺术', '游乐游艺', 'VR', '桌游', '团建拓展', '棋牌室', '桌球馆',
-        # 电影演出
-        '电影院', '演出场馆', '剧场/影院', '音乐厅/礼堂', '艺术中心/文化广场',
-        '热门演出', '赛事展览', '其他电影演出赛事',
-        # 酒店住宿
-        '酒店', '五星/豪华', '经济连锁', '四星级/高档型', '三星级/舒适型',
-        '情侣酒店', '青年旅社', '客栈',
-        # 其他服务
-        '亲子', '运动健身', '购物', '家装', '学习培训', 
-        '生活服务', '医疗健康', '爱车', '宠物'
-    ], Field(
-        description="分类榜单包括餐饮美食，游玩，休闲，酒店等"
+    category: Annotated[str, Field(
+        description="分类名称，如'美食'、'火锅'、'日本菜'、'KTV'、'酒店'、'亲子'；"
+                    "也可用别名、拼音或近似名称"
     )],
     region: Annotated[str, Field(
-        description="商圈或地点名称，如'三里屯'、'国贸'等"
+        description="商圈或地点名称，如'三里屯'、'国贸'等；也可用拼音或近似名称"
     )] = "",
     sort: Annotated[Literal[
         "智能排序", "好评优先", "人气优先", "口味优先", "评价最多",
         "环境最佳", "服务最佳", "预订优先", "人均最高", "人均最低"
     ], Field(
         description="排序方式"
-    )] = "智能排序"
+    )] = "智能排序",
+    pages: Annotated[int, Field(
+        description="抓取的列表页数，每页约15家",
+        ge=1, le=MAX_RANK_PAGES
+    )] = 1,
+    max_results: Annotated[int, Field(
+        description="最多返回的商户数，0表示不限；超过pages能覆盖的数量时自动增加页数",
+        ge=0
+    )] = 0
 ) -> dict:
-    """获取大众点评商户排行榜"""
+    """获取大众点评商户排行榜。as_of为数据抓取时间；stale为true表示是过期的缓存结果，已在后台刷新"""
     # Validate inputs and build URL
-    # 验证输入
-    if category not in MENU:
-        return {"success": False, "error": f"分类'{category}'不在榜单中"}
+    # 解析输入（别名、拼音、前缀和近似匹配），无法确定时不访问页面直接返回建议
+    catalog = get_catalog()
+    category_name, suggestions = catalog.categories.resolve(category)
+    if category_name is None:
+        return not_found(f"分类'{category}'不在榜单中", suggestions)
     
-    if city.lower() not in REGIONS:
-        return {"success": False, "error": f"城市'{city}'不在支持列表中"}
+    city_name, suggestions = catalog.cities.resolve(city)
+    if city_name is None:
+        return not_found(f"城市'{city}'不在支持列表中", suggestions)
 
-    # 获取分类代码
-    category_code = MENU[category]
-    
-    # 排序参数映射
-    sort_map = {
-        "智能排序": "",
-        "好评优先": "o3",
-        "人气优先": "o2", 
-        "口味优先": "o4",
-        "评价最多": "o11",
-        "环境最佳": "o5",
-        "服务最佳": "o6",
-        "预订优先": "o13",
-        "人均最高": "o9",
-        "人均最低": "o8"
+    if region:
+        region_name, suggestions = catalog.city_regions[city_name].resolve(region)
+        if region_name is None:
+            return not_found(f"区域'{region}'在{city}中未找到", suggestions)
+        region = region_name
+
+    # 构建第一页URL
+    base_url = rank_url(city_name, category_name, region, sort)
+
+    # 需要的页数
+    if max_results:
+        pages = max(pages, -(-max_results // SHOPS_PER_PAGE))
+    pages = min(pages, MAX_RANK_PAGES)
+
+    # 先取第一页，按分页栏的末页号限制页数；没有分页栏且不满一页说明只有一页
+    first = await get_shop_list_page(base_url)
+    if not first["success"]:
+        return first
+    if first.get("last_page"):
+        pages = min(pages, first["last_page"])
+    elif len(first["result"]) < SHOPS_PER_PAGE:
+        pages = 1
+    page_urls = [f"{base_url}p{n}" for n in range(2, pages + 1)]
+
+    # 并发抓取其余各页（受RANK_PAGE_PARALLELISM限制）
+    parallelism = asyncio.Semaphore(RANK_PAGE_PARALLELISM)
+    async def fetch(url):
+        async with parallelism:
+            return await get_shop_list_page(url)
+    results = [first] + await asyncio.gather(*[fetch(url) for url in page_urls])
+    fetched = [page_result for page_result in results if page_result["success"]]
+
+    # 按排名顺序合并并按shop_id去重
+    items = []
+    seen = set()
+    failed_pages = []
+    for n, page_result in enumerate(results, start=1):
+        if not page_result["success"]:
+            failed_pages.append(n)
+            continue
+        for item in page_result["result"]:
+            if item["shop_id"] and item["shop_id"] in seen:
+                continue
+            seen.add(item["shop_id"])
+            items.append(item)
+    if max_results:
+        items = items[:max_results]
+
+    result = {
+        "success": True, "city": city_name, "category": category_name, "region": region, "result": items,
+        "as_of": format_as_of(min(page_result["as_of"] for page_result in fetched)),
+        "stale": any(page_result["stale"] for page_result in fetched)
     }
+    if failed_pages:
+        result["failed_pages"] = failed_pages
+    if not result["stale"]:
+        _prefetcher.offer([item["shop_id"] for item in items])
+    return result
 
-    # 构建基础URL
-    base_url = f"https://www.dianping.com/{city.lower()}{category_code}"
-    
-    # 添加区域代码
-    if region:
-        if region not in REGIONS[city.lower()]:
-            return {"success": False, "error": f"区域'{region}'在{city}中未找到"}
-        base_url += REGIONS[city.lower()][region]
-    
-    # 添加排序参数
-    base_url += sort_map[sort]
+def rank_url(city_name: str, category_name: str, region_name: str = "", sort: str = "智能排序") -> str:
+    """First list page of a ranking, from canonical catalog names"""
+    catalog = get_catalog()
+    url = f"{ORIGIN}/{city_name}{catalog.categories[category_name]}"
+    if region_name:
+        url += catalog.city_regions[city_name][region_name]
+    return url + SORT_CODES[sort]
 
-    # Get authenticated page
-    context, page = get_page(base_url)
-    if not context:
-        return {"success": False, "error": "需要登录并上传auth.json"}
-    
-    try:
-        page.wait_for_load_state('domcontentloaded')
-        items = []
-        for shop in page.query_selector_all('.shop-all-list ul li'):
-            name = shop.query_selector('.tit a h4').inner_text() if shop.query_selector('.tit a h4') else ""
-            href = shop.query_selector('.tit a').get_attribute('href') if shop.query_selector('.tit a') else ""
-            shop_id = ""
-            if href:
-                parts = href.split("/")
-                if "shop" in parts:
-                    idx = parts.index("shop")
-                    if idx + 1 < len(parts):
-                        shop_id = parts[idx + 1]
-            star = shop.query_selector('.nebula_star .star_icon span')
-            rating = star_class_to_rating(star.get_attribute('class')) if star else ""
-            review_count = shop.query_selector('.review-num b').inner_text() if shop.query_selector('.review-num b') else ""
-            address = ""
-            addr_tag = shop.query_selector('.tag-addr')
-            if addr_tag:
-                addr_spans = addr_tag.query_selector_all('a span.tag')
-                address = " ".join([span.inner_text() for span in addr_spans]) if addr_spans else ""
-            #img = shop.query_selector('.pic img')
-            #img_url = img.get_attribute('src') if img else ""
-            price = shop.query_selector('.mean-price b').inner_text() if shop.query_selector('.mean-price b') else ""
-            recommend = []
-            recommend_tag = shop.query_selector('.recommend')
-            if recommend_tag:
-                recommend_links = recommend_tag.query_selector_all('a.recommend-click')
-                recommend = [a.inner_text() for a in recommend_links] if recommend_links else []
-            items.append({
-                "shop_id": shop_id,
-                "name": name,
-                "rating": rating,  # Now contains numeric rating like "4.5"
-                "review_count": review_count,
-                "address": address,
-                "price": price,
-                "recommend": recommend
-            })
-        return {"success": True, "city": city, "category": category, "region": region, "result": items}
-    finally:
-        page.close()
+def warm_seed_urls() -> list:
+    """Ranking pages of the DIANPING_WARM_* seed subset"""
+    return [rank_url(*combination) for combination in seed_combinations(get_catalog(), list(SORT_CODES))]
+
+async def get_shop_list_page(url: str) -> dict:
+    """Get one list page from the result cache, scraping it on a miss"""
+    with _timings.span("cache"):
+        entry = _cache.lookup("rank", url, max_stale=RANK_MAX_STALE)
+    _warmer.record(url, hit=entry is not None and not entry.stale)
+    if entry is not None:
+        if entry.stale:
+            schedule_refresh(f"rank:{url}", lambda: refresh_shop_list_page(url))
+        return {"success": True, **entry.value, "as_of": entry.stored_at, "stale": entry.stale}
+    return await refresh_shop_list_page(url)
+
+async def refresh_shop_list_page(url: str) -> dict:
+    """Scrape a list page and cache it, whatever is cached already"""
+    scraped = await scrape_shop_list(url)
+    if scraped["success"]:
+        # An empty list usually means a blocked or half-rendered page; don't pin it
+        if scraped["result"]:
+            page = {"result": scraped["result"], "last_page": scraped.get("last_page")}
+            _cache.set("rank", url, page, RANK_TTL)
+        scraped.update(as_of=time.time(), stale=False)
+    return scraped
+
+def schedule_refresh(key: str, refresh):
+    """Refresh a stale cache entry in the background, once per key at a time"""
+    task = _refresh_tasks.get(key)
+    if task is not None and not task.done():
+        return
+
+    async def run():
+        # Not part of the tool call that served the stale entry
+        PhaseTimings.detach()
+        try:
+            result = await refresh()
+            if not result["success"]:
+                logger.info(f"Background refresh of {key} failed: {result['error']}")
+        except Exception as e:
+            logger.warning(f"Background refresh of {key} failed: {e}")
+
+    task = asyncio.get_running_loop().create_task(run())
+    _refresh_tasks[key] = task
+    task.add_done_callback(lambda _: _refresh_tasks.pop(key, None))
+
+def format_as_of(timestamp: float):
+    """When a result was scraped, as local ISO 8601 (None if unknown)"""
+    if not timestamp:
+        return None
+    return datetime.fromtimestamp(timestamp).astimezone().isoformat(timespec="seconds")
 
 @mcp.tool()
+@timed
 async def dianping_shop_detail(shop_id: str) -> dict:
     """
     查询指定shop_id的店铺详情，返回:店铺名称、评分、地址、电话、简介、推荐、团购、评价。
+    as_of为数据抓取时间；stale为true表示是过期的缓存结果，已在后台刷新。
     """
-    context, page = await get_page(f"https://www.dianping.com/shop/{shop_id}")
-    if not context:
-        return {"success": False, "error": "需要登录并上传auth.json"}
-    
-    try:
-        try:
-            page.wait_for_selector('.shopName', timeout=10000)
-        except Exception:
-            await page.close()
-            return {"success": False, "error": "页面加载失败"}
+    return await get_shop_detail(shop_id)
 
-        # 店名
-        name = page.query_selector('.shopName').inner_text() if page.query_selector('.shopName') else ""
+@mcp.tool()
+@timed
+async def dianping_shop_details_batch(
+    shop_ids: Annotated[list[str], Field(
+        description="要查询的shop_id列表",
+        min_length=1, max_length=MAX_BATCH_SIZE
+    )]
+) -> dict:
+    """
+    批量查询多个shop_id的店铺详情，并发抓取；返回成功的结果和每个失败shop_id的错误信息。
+    """
+    # 去重并保持顺序
+    shop_ids = list(dict.fromkeys(shop_ids))[:MAX_BATCH_SIZE]
+    parallelism = asyncio.Semaphore(BATCH_PARALLELISM)
 
-        # 评分和评价数 
-        rating = page.query_selector('.star-score').inner_text() if page.query_selector('.star-score') else ""
-        review_count = page.query_selector('.reviews').inner_text() if page.query_selector('.reviews') else ""
+    async def fetch(shop_id):
+        async with parallelism:
+            try:
+                return await asyncio.wait_for(get_shop_detail(shop_id), BATCH_ITEM_TIMEOUT)
+            except asyncio.TimeoutError:
+                return {"success": False, "error": f"超时({BATCH_ITEM_TIMEOUT:g}秒)"}
+            except Exception as e:
+                logger.error(f"Batch detail failed for {shop_id}: {e}")
+                return {"success": False, "error": str(e)}
 
-        # 人均价格
-        price = page.query_selector('.price').inner_text() if page.query_selector('.price') else ""
+    details = await asyncio.gather(*[fetch(shop_id) for shop_id in shop_ids])
 
-        # 地区和分类
-        region = page.query_selector('.region').inner_text() if page.query_selector('.region') else ""
-        category = page.query_selector('.category').inner_text() if page.query_selector('.category') else ""
+    results = []
+    errors = {}
+    for shop_id, detail in zip(shop_ids, details):
+        if detail["success"]:
+            results.append(detail)
+        else:
+            errors[shop_id] = detail["error"]
+    return {"success": bool(results), "results": results, "errors": errors}
 
-        # 细分评分
-        score_text = page.query_selector('.scoreText').inner_text() if page.query_selector('.scoreText') else ""
+async def get_shop_detail(shop_id: str) -> dict:
+    """Get a shop detail result from the cache, scraping it on a miss"""
+    with _timings.span("cache"):
+        entry = _cache.lookup("detail", shop_id, max_stale=DETAIL_MAX_STALE)
+    _prefetcher.record(shop_id, hit=entry is not None)
+    if entry is None:
+        return await refresh_shop_detail(shop_id)
+    if entry.stale:
+        schedule_refresh(f"detail:{shop_id}", lambda: refresh_shop_detail(shop_id))
+    return {**entry.value, "as_of": format_as_of(entry.stored_at), "stale": entry.stale}
 
-        # 地址 
-        address = page.query_selector('.addressText').inner_text() if page.query_selector('.addressText') else ""
-        address_desc = page.query_selector('.desc-addr-txt').inner_text() if page.query_selector('.desc-addr-txt') else ""
+def detail_cached(shop_id: str) -> bool:
+    """Whether a fresh detail for shop_id is cached"""
+    expires_at = _cache.expiry("detail", shop_id)
+    return expires_at is not None and expires_at > time.time()
 
-        # 营业时间和标签
-        biz_info = ""
-        biz_tag = page.query_selector('.biz-txt')
-        biz_time = page.query_selector('.biz-time')
-        if biz_tag and biz_time:
-            biz_info = f"{biz_tag.inner_text()} {biz_time.inner_text()}"
+async def refresh_shop_detail(shop_id: str) -> dict:
+    """Scrape a shop detail and cache it, whatever is cached already"""
+    result = await scrape_shop_detail(shop_id)
+    if result["success"]:
+        _cache.set("detail", shop_id, result, DETAIL_TTL)
+        result = {**result, "as_of": format_as_of(time.time()), "stale": False}
+    return result
 
-        # 特色标签
-        tags = []
-        for tag in page.query_selector_all('.feature-txt'):
-            tags.append(tag.inner_text())
+async def scrape_shop_list(url: str) -> dict:
+    """Load a category list page and extract its shops
+    
+    Concurrent calls for the same URL share a single page load.
+    
+    Returns:
+        dict: {"success": True, "result": [...]} or an error result
+    """
+    try:
+        return await _flights.do(url, lambda: _load_shop_list(url))
+    except CircuitOpen as e:
+        return circuit_open_error(e)
 
-        # 推荐菜
-        recommend_dishes = []
-        dishes = page.query_selector_all('.food')
-        for dish in dishes:
-            recommend_dishes.append(dish.inner_text())
+async def scrape_shop_detail(shop_id: str) -> dict:
+    """Load a shop detail page and build the dianping_shop_detail result
+    
+    Concurrent calls for the same shop share a single page load.
+    """
+    url = f"{ORIGIN}/shop/{shop_id}"
+    try:
+        return await _flights.do(url, lambda: _load_shop_detail(shop_id, url))
+    except CircuitOpen as e:
+        return circuit_open_error(e)
 
-        # 生成Markdown格式文本
-        md = f"""# {name}
+def circuit_open_error(e: CircuitOpen) -> dict:
+    """Fail fast while the origin's circuit is open"""
+    return {"success": False, "error": f"访问受限，暂停访问大众点评，请{e.retry_after:.0f}秒后重试"}
 
-**评分**: {rating} ({review_count})  
-**人均**: {price}  
-**地区**: {region}  
-**分类**: {category}  
-**评分详情**: {score_text}
+async def _load_shop_list(url: str) -> dict:
+    async with paced_load(url):
+        if LIST_FETCH_MODE == "http" and not HAR_MODE:
+            try:
+                return await _fetch_shop_list_http(url)
+            except NeedsBrowser as e:
+                logger.info(f"Loading {url} in the browser: {e}")
+        return await _load_shop_list_page(url)
 
-**地址**: {address}  
-{address_desc}
+async def _load_shop_list_page(url: str) -> dict:
+    async with page_slot():
+        # Get authenticated page
+        context, page = await get_page(url)
+        if not context:
+            return {"success": False, "error": "需要登录并上传auth.json"}
+        
+        try:
+            with _timings.span("wait"):
+                await page.wait_for_load_state('domcontentloaded')
+            if EXTRACTION_MODE == "html":
+                with _timings.span("extract"):
+                    items, last_page = parse_list_page(await page.content())
+            else:
+                # One in-page pass for the whole list instead of per-field roundtrips
+                with _timings.span("extract"):
+                    extracted = await page.evaluate(SHOP_LIST_JS)
+                with _timings.span("format"):
+                    items = [build_shop_item(raw) for raw in extracted["shops"]]
+                last_page = extracted["last_page"]
+            if items:
+                _throttle.success(url)
+            else:
+                # Empty is usually a real result (no such shops, past the last page);
+                # only a verification page is pushback
+                kind = await page_pushback(page)
+                if kind:
+                    _throttle.failure(url, kind)
+            return {"success": True, "result": items, "last_page": last_page}
+        finally:
+            await page.close()
 
-**营业信息**: {biz_info}  
-**特色**: {' '.join(tags)}
+async def page_pushback(page) -> str:
+    """Login or verification signs on a loaded page ("" if none)"""
+    try:
+        html = await page.content()
+    except Exception:
+        html = ""
+    return pushback_sign(page.url, html)
 
-**推荐菜**:
-{', '.join(recommend_dishes)}
-"""
+async def _fetch_shop_list_http(url: str) -> dict:
+    """Fetch and parse a list page without the browser, or raise NeedsBrowser"""
+    try:
+        with _timings.span("http"):
+            html = await _http.fetch_html(url)
+        with _timings.span("extract"):
+            items, last_page = parse_list_page(html)
+        if not items:
+            error = unusable_page(html)
+            _http.count_fallback(error.kind)
+            raise error
+    except NeedsBrowser as e:
+        # Missing auth.json, a 404 or a JS-only page is no sign of pushback
+        if e.pushback:
+            _throttle.failure(url, e.kind)
+        raise
+    _throttle.success(url)
+    return {"success": True, "result": items, "last_page": last_page}
 
-        return {
-            "success": True, 
-            "shop_id": shop_id,
-            "name": name,
-            "rating": rating,
-            "review_count": review_count,
-            "price": price,
-            "address": address,
-            "md": md
-        }
-    finally:
-        await page.close()
+async def _load_shop_detail(shop_id: str, url: str) -> dict:
+    async with paced_load(url), page_slot():
+        context, page = await get_page(url)
+        if not context:
+            return {"success": False, "error": "需要登录并上传auth.json"}
+        
+        try:
+            try:
+                with _timings.span("wait"):
+                    await page.wait_for_selector('.shopName', timeout=10000)
+            except Exception:
+                # A mistyped or removed shop_id isn't pushback either
+                kind = await page_pushback(page)
+                if kind:
+                    _throttle.failure(url, kind)
+                return {"success": False, "error": "页面加载失败"}
+            _throttle.success(url)
 
-def initialize_browser():
-    """Initialize browser instance on server startup"""
-    global _browser
+            with _timings.span("extract"):
+                if EXTRACTION_MODE == "html":
+                    fields = parse_shop_detail_fields(await page.content())
+                else:
+                    fields = await page.evaluate(SHOP_DETAIL_JS)
+            with _timings.span("format"):
+                return build_shop_detail(shop_id, fields)
+        finally:
+            await page.close()
+
+async def initialize_browser():
+    """Initialize browser instance and warm up the context pool on server startup"""
     try:
         logger.info("Initializing browser on startup...")
-        p = sync_playwright().start()
-        _browser = p.chromium.launch(
-            headless=True,
-            args=['--disable-blink-features=AutomationControlled']
-        )
+        await get_browser()
         logger.info("Browser initialization successful")
-        return True
     except Exception as e:
         logger.error(f"Browser initialization failed: {e}")
         return False
+        
+    auth_file = Path("auth.json")
+    if auth_file.exists():
+        try:
+            await get_pool().warm_up(auth_file)
+        except Exception as e:
+            logger.warning(f"Context pool warm-up failed: {e}")
+    return True
+
+async def shutdown_browser():
+    """Close pooled contexts, the browser and Playwright on server shutdown"""
+    global _playwright, _browser, _pool
+    await _warmer.stop()
+    await _prefetcher.stop()
+    for task in list(_refresh_tasks.values()):
+        task.cancel()
+    if _revalidation_task is not None:
+        _revalidation_task.cancel()
+    await _http.close()
+    if _pool is not None:
+        # Per-context counters go with the contexts
+        logger.info(f"Context pool: {_pool.stats()}")
+        await _pool.close()
+        _pool = None
+    if _browser is not None:
+        try:
+            await _browser.close()
+        except Exception as e:
+            logger.debug(f"Error closing browser: {e}")
+        _browser = None
+    if _playwright is not None:
+        await _playwright.stop()
+        _playwright = None
+    logger.info(f"Browser shut down (cache stats: {_cache.stats()}, single-flight: {_flights.stats()})")
+    logger.info(f"Phase timings: {_timings.summary()}")
+    logger.info(f"HTTP list fetches: {_http.stats()}")
+    logger.info(f"Rate limits: {_throttle.stats()}")
+    logger.info(f"Cache warmer: {_warmer.stats()}")
+    logger.info(f"Detail prefetch: {_prefetcher.stats()}")
+    _cache.close()
 
 if __name__ == "__main__":
     logger.info("Starting DianpingMCP server")
     
-    # Initialize browser on startup
-    if not initialize_browser():
-        logger.error("Failed to initialize browser. Exiting...")
-        exit(1)
-        
-    # Start MCP server
-    mcp.run(transport="stdio")
\ No newline at end of file
+    # Browser startup and shutdown run in server_lifespan, on the server's event loop
+    mcp.run(transport="stdio")
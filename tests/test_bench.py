@@ -0,0 +1,68 @@
+import pytest
+import urllib.request
+from parsers import parse_shop_list, parse_shop_detail_fields
+from bench.fixture_server import start_fixture_server, SHOPS_PER_PAGE
+
+@pytest.fixture
+def fixture_origin():
+    httpd = start_fixture_server()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+def fetch(url):
+    with urllib.request.urlopen(url) as response:
+        return response.read().decode("utf-8")
+
+def test_fixture_list_pages_are_full_and_distinct(fixture_origin):
+    """List pages carry a full page of shops, with ids unique to each URL"""
+    page1 = parse_shop_list(fetch(f"{fixture_origin}/beijing/ch10/g110"))
+    page2 = parse_shop_list(fetch(f"{fixture_origin}/beijing/ch10/g110p2"))
+    assert len(page1) == SHOPS_PER_PAGE
+    ids1 = {shop["shop_id"] for shop in page1}
+    ids2 = {shop["shop_id"] for shop in page2}
+    assert len(ids1) == SHOPS_PER_PAGE and not ids1 & ids2
+
+def test_fixture_pages_are_logged_in(fixture_origin):
+    """Every page has the username revalidation waits for, detail pages parse"""
+    assert 'class="username"' in fetch(f"{fixture_origin}/beijing")
+    fields = parse_shop_detail_fields(fetch(f"{fixture_origin}/shop/k9aBcD1"))
+    assert fields["name"]
+
+class StubContext:
+    async def route(self, url, handler):
+        pass
+
+    async def close(self):
+        pass
+
+class StubBrowser:
+    """Stands in for Chromium: pooled contexts are created, never navigated"""
+    async def new_context(self, storage_state=None):
+        return StubContext()
+
+@pytest.mark.asyncio
+async def test_bench_rank_runs_offline(monkeypatch):
+    """The harness drives --tool rank end to end over the HTTP list path"""
+    import argparse
+    import server
+    from bench import run as bench
+    from http_client import HttpFetcher
+
+    async def stub_browser():
+        return StubBrowser()
+
+    # run() repoints these at the fixture server; put them back afterwards
+    for name in ("ORIGIN", "_pool", "_cache", "_throttle"):
+        monkeypatch.setattr(server, name, getattr(server, name))
+    monkeypatch.setattr(server, "_http", HttpFetcher())
+    monkeypatch.setattr(server, "get_browser", stub_browser)
+    monkeypatch.setattr(server, "LIST_FETCH_MODE", "http")
+    monkeypatch.setattr(server, "HAR_MODE", "")
+
+    args = argparse.Namespace(tool="rank", requests=6, concurrency=2, keys=3, delay_ms=0)
+    report = await bench.run(args)
+
+    assert report["errors"] == 0
+    assert report["requests"] == 6 and report["throughput_rps"] > 0
+    assert set(report["latency_ms"]) == {"p50", "p95", "p99"}
+    assert report["rss_mb"] and "http" in report["phases"]
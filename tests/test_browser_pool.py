@@ -0,0 +1,216 @@
+import pytest
+import json
+import asyncio
+from pathlib import Path
+from browser_pool import ContextPool, ResourceBlocker, HarArchive, ESTIMATED_BYTES, DEFAULT_ESTIMATED_BYTES
+
+class FakePage:
+    def __init__(self):
+        self._handlers = []
+
+    def once(self, event, handler):
+        self._handlers.append(handler)
+
+    async def close(self):
+        for handler in self._handlers:
+            handler(self)
+        self._handlers = []
+
+class FakeContext:
+    def __init__(self):
+        self.closed = False
+
+    async def new_page(self):
+        return FakePage()
+
+    async def close(self):
+        self.closed = True
+
+class FakeBrowser:
+    def __init__(self):
+        self.contexts = []
+
+    async def new_context(self, storage_state=None):
+        context = FakeContext()
+        self.contexts.append(context)
+        return context
+
+def make_pool(browser, **kwargs):
+    async def browser_factory():
+        return browser
+    return ContextPool(browser_factory, **kwargs)
+
+@pytest.fixture
+def auth_file(tmp_path):
+    path = tmp_path / "auth.json"
+    path.write_text(json.dumps({"cookies": [], "origins": []}))
+    return path
+
+@pytest.mark.asyncio
+async def test_context_reused_between_calls(auth_file):
+    """Sequential pages share one live context"""
+    browser = FakeBrowser()
+    pool = make_pool(browser, max_contexts=2)
+
+    context1, page1 = await pool.new_page(auth_file)
+    await page1.close()
+    context2, page2 = await pool.new_page(auth_file)
+    await page2.close()
+
+    assert context1 is context2, "Context was not reused"
+    assert len(browser.contexts) == 1, "Unexpected extra context"
+
+@pytest.mark.asyncio
+async def test_context_cap_shares_least_loaded(auth_file):
+    """Concurrent pages never exceed max_contexts"""
+    browser = FakeBrowser()
+    pool = make_pool(browser, max_contexts=2)
+
+    opened = await asyncio.gather(*[pool.new_page(auth_file) for _ in range(5)])
+    assert len(browser.contexts) == 2, "Pool exceeded its context cap"
+    assert pool.stats()["open_pages"] == 5
+
+    for _, page in opened:
+        await page.close()
+    assert pool.stats()["open_pages"] == 0
+
+@pytest.mark.asyncio
+async def test_context_recycled_after_page_budget(auth_file):
+    """A context is closed after serving max_pages_per_context pages"""
+    browser = FakeBrowser()
+    pool = make_pool(browser, max_contexts=1, max_pages_per_context=2)
+
+    for _ in range(3):
+        _, page = await pool.new_page(auth_file)
+        await page.close()
+    await pool.close()
+
+    assert len(browser.contexts) == 2, "Context was not recycled"
+    assert browser.contexts[0].closed, "Recycled context not closed"
+
+@pytest.mark.asyncio
+async def test_idle_context_evicted(auth_file):
+    """Idle contexts are closed in the background, without another acquire"""
+    browser = FakeBrowser()
+    pool = make_pool(browser, idle_timeout=0.05)
+
+    await pool.warm_up(auth_file)
+    _, page = await pool.new_page(auth_file)
+    await asyncio.sleep(0.1)
+    assert not browser.contexts[0].closed, "Context with an open page evicted"
+
+    await page.close()
+    await asyncio.sleep(0.1)
+    assert browser.contexts[0].closed, "Idle context not evicted"
+    assert pool.stats()["contexts"] == 0
+    await pool.close()
+
+@pytest.mark.asyncio
+async def test_close_shuts_all_contexts(auth_file):
+    """close() tears down every pooled context"""
+    browser = FakeBrowser()
+    pool = make_pool(browser, max_contexts=2)
+    await pool.warm_up(auth_file, count=2)
+    await pool.close()
+
+    assert all(c.closed for c in browser.contexts)
+
+def test_resource_blocker_profile():
+    """Images, fonts, media and tracker hosts are blocked; documents are not"""
+    blocker = ResourceBlocker(resource_types="image,media,font", hosts="hm.baidu.com")
+
+    assert blocker.should_block("image", "https://p0.meituan.net/a.jpg")
+    assert blocker.should_block("font", "https://s3plus.meituan.net/a.woff")
+    assert blocker.should_block("script", "https://hm.baidu.com/hm.js")
+    assert not blocker.should_block("document", "https://www.dianping.com/beijing/ch10")
+    assert not blocker.should_block("script", "https://notbaidu.com/hm.js")
+
+@pytest.mark.asyncio
+async def test_resource_blocker_estimates_bytes_saved():
+    """Blocked requests are counted by type with an estimate of the bytes they would have cost"""
+    class FakeRequest:
+        def __init__(self, resource_type, url):
+            self.resource_type = resource_type
+            self.url = url
+
+    class FakeRoute:
+        def __init__(self, resource_type, url):
+            self.request = FakeRequest(resource_type, url)
+
+        async def abort(self):
+            pass
+
+        async def fallback(self):
+            pass
+
+    blocker = ResourceBlocker(resource_types="image,font", hosts="hm.baidu.com")
+    await blocker.handle(FakeRoute("image", "https://p0.meituan.net/a.jpg"))
+    await blocker.handle(FakeRoute("image", "https://p0.meituan.net/b.jpg"))
+    await blocker.handle(FakeRoute("ping", "https://hm.baidu.com/hm.gif"))
+    await blocker.handle(FakeRoute("document", "https://www.dianping.com/beijing"))
+
+    assert (blocker.blocked, blocker.allowed) == (3, 1)
+    assert blocker.blocked_by_type == {"image": 2, "ping": 1}
+    assert blocker.bytes_saved == 2 * ESTIMATED_BYTES["image"] + DEFAULT_ESTIMATED_BYTES
+
+@pytest.mark.asyncio
+async def test_resource_blocker_installed_on_new_contexts(auth_file):
+    """The pool routes every new context through the blocker"""
+    routed = []
+
+    class RoutedContext(FakeContext):
+        async def route(self, pattern, handler):
+            routed.append(pattern)
+
+    class RoutedBrowser(FakeBrowser):
+        async def new_context(self, storage_state=None):
+            return RoutedContext()
+
+    pool = make_pool(RoutedBrowser(), blocker=ResourceBlocker())
+    await pool.new_page(auth_file)
+    assert routed == ["**/*"], "Blocker was not installed"
+
+    disabled = ResourceBlocker(resource_types="", hosts="")
+    assert not disabled.enabled
+
+class ArchiveContext(FakeContext):
+    def __init__(self, calls):
+        super().__init__()
+        self.calls = calls
+
+    async def route(self, pattern, handler):
+        self.calls.append(("route", pattern))
+
+    async def route_from_har(self, har, url=None, not_found=None, update=None, **kwargs):
+        self.calls.append(("har", Path(har).name, not_found, update))
+
+@pytest.mark.asyncio
+async def test_har_replay_serves_newest_archive_first(tmp_path):
+    """Replay registers the abort fallback first, then archives oldest to newest"""
+    for name in ("1-a.har", "2-b.har"):
+        (tmp_path / name).write_text("{}")
+    calls = []
+    await HarArchive("replay", tmp_path).install(ArchiveContext(calls))
+
+    assert calls == [("route", "**/*"), ("har", "1-a.har", "fallback", None), ("har", "2-b.har", "fallback", None)]
+
+@pytest.mark.asyncio
+async def test_har_installed_before_blocker(auth_file, tmp_path):
+    """The blocker sees requests first and falls back to the recording archive"""
+    calls = []
+
+    class ArchiveBrowser(FakeBrowser):
+        async def new_context(self, storage_state=None):
+            return ArchiveContext(calls)
+
+    pool = make_pool(ArchiveBrowser(), blocker=ResourceBlocker(), har=HarArchive("record", tmp_path / "har"))
+    await pool.new_page(auth_file)
+
+    assert [c[0] for c in calls] == ["har", "route"]
+    assert calls[0][3] is True and calls[0][1].endswith(".har")
+    assert (tmp_path / "har").is_dir()
+
+def test_har_mode_validated():
+    with pytest.raises(ValueError):
+        HarArchive("replay-all")
+    assert not HarArchive("").enabled
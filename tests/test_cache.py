@@ -0,0 +1,128 @@
+import pytest
+import asyncio
+from cache import ResultCache, SingleFlight
+
+def test_hit_and_miss_counters():
+    """get() counts hits and misses per namespace"""
+    cache = ResultCache(max_entries=10, db_path="")
+    assert cache.get("rank", "https://www.dianping.com/beijing/ch10") is None
+    cache.set("rank", "https://www.dianping.com/beijing/ch10", [{"shop_id": "a"}], ttl=60)
+    assert cache.get("rank", "https://www.dianping.com/beijing/ch10") == [{"shop_id": "a"}]
+
+    stats = cache.stats()
+    assert stats["hits"] == {"rank": 1}
+    assert stats["misses"] == {"rank": 1}
+
+def test_expired_entry_is_a_miss():
+    """Entries past their TTL are dropped"""
+    cache = ResultCache(max_entries=10, db_path="")
+    cache.set("detail", "k9aBcD1", {"success": True}, ttl=-1)
+    assert cache.get("detail", "k9aBcD1") is None
+    assert cache.stats()["entries"] == 0
+
+def test_lru_eviction():
+    """The least recently used entry is evicted past max_entries"""
+    cache = ResultCache(max_entries=2, db_path="")
+    cache.set("detail", "a", 1, ttl=60)
+    cache.set("detail", "b", 2, ttl=60)
+    cache.get("detail", "a")
+    cache.set("detail", "c", 3, ttl=60)
+
+    assert cache.get("detail", "b") is None, "LRU entry not evicted"
+    assert cache.get("detail", "a") == 1
+    assert cache.get("detail", "c") == 3
+
+def test_sqlite_backing_survives_restart(tmp_path):
+    """Entries written through to SQLite are visible to a new cache instance"""
+    db_path = str(tmp_path / "cache.db")
+    cache = ResultCache(db_path=db_path)
+    cache.set("detail", "k9aBcD1", {"name": "海底捞"}, ttl=60)
+    cache.set("detail", "old", {"name": "过期"}, ttl=-1)
+    cache.close()
+
+    restarted = ResultCache(db_path=db_path)
+    assert restarted.get("detail", "k9aBcD1") == {"name": "海底捞"}
+    assert restarted.get("detail", "old") is None
+    restarted.close()
+
+def test_sqlite_errors_do_not_fail_calls(tmp_path, monkeypatch):
+    """A locked or broken database is logged; the result is still cached in memory"""
+    import sqlite3
+    import cache as cache_module
+    monkeypatch.setattr(cache_module, "DB_BUSY_TIMEOUT", 0.05)
+    db_path = str(tmp_path / "cache.db")
+    cache = ResultCache(db_path=db_path)
+    assert cache._db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    other = sqlite3.connect(db_path)
+    other.execute("BEGIN IMMEDIATE")
+    cache.set("detail", "k9aBcD1", {"name": "海底捞"}, ttl=60)
+    assert cache.get("detail", "k9aBcD1") == {"name": "海底捞"}
+    other.rollback()
+
+    other.execute("DROP TABLE results")
+    other.commit()
+    assert cache.get("detail", "missing") is None
+    other.close()
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_in_flight_load():
+    """Concurrent identical calls run the loader once and share its result"""
+    flights = SingleFlight()
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"success": True}
+
+    url = "https://www.dianping.com/beijing/ch10/g110"
+    results = await asyncio.gather(*[flights.do(url, load) for _ in range(5)])
+
+    assert len(calls) == 1, "Loader ran more than once"
+    assert all(r is results[0] for r in results)
+    assert flights.stats() == {"in_flight": 0, "leaders": 1, "shared": 4}
+
+    # Once finished, the next call loads again
+    await flights.do(url, load)
+    assert len(calls) == 2
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_exceptions():
+    """Followers see the leader's exception"""
+    flights = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("timeout")
+
+    results = await asyncio.gather(flights.do("k", fail), flights.do("k", fail), return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+def test_stale_entries_served_within_max_stale():
+    """lookup() returns an expired entry flagged stale until retention runs out"""
+    cache = ResultCache(max_entries=10, db_path="", retention=60)
+    cache.set("rank", "u", [{"shop_id": "a"}], ttl=-1)
+    assert cache.get("rank", "u") is None
+    entry = cache.lookup("rank", "u", max_stale=60)
+    assert entry.value == [{"shop_id": "a"}]
+    assert entry.stale
+    assert entry.stored_at <= entry.expires_at + 1
+    cache.set("rank", "u", [{"shop_id": "b"}], ttl=60)
+    assert not cache.lookup("rank", "u", max_stale=60).stale
+
+    cache.set("rank", "old", [], ttl=-120)
+    assert cache.lookup("rank", "old", max_stale=600) is None
+    assert cache.stats()["stale_hits"] == {"rank": 1}
+
+def test_sqlite_keeps_stale_entries(tmp_path):
+    """Expired entries within retention survive a restart with their store time"""
+    db_path = str(tmp_path / "cache.db")
+    cache = ResultCache(db_path=db_path, retention=60)
+    cache.set("detail", "k9aBcD1", {"name": "海底捞"}, ttl=-1)
+    cache.close()
+
+    restarted = ResultCache(db_path=db_path, retention=60)
+    entry = restarted.lookup("detail", "k9aBcD1", max_stale=60)
+    assert entry.value == {"name": "海底捞"} and entry.stale and entry.stored_at > 0
+    restarted.close()
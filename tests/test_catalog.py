@@ -0,0 +1,44 @@
+import os
+import catalog
+from catalog import load_catalog
+
+def write_sources(tmp_path):
+    menu = tmp_path / "menu.txt"
+    regions = tmp_path / "regions.txt"
+    menu.write_text("火锅\t/ch10/g110\n刺身\t/search/keyword/2/0_x\n", encoding="utf-8")
+    regions.write_text("# header\nbeijing 三里屯/工体 r2580\n", encoding="utf-8")
+    return menu, regions
+
+def count_builds(monkeypatch):
+    builds = []
+    original = catalog.Catalog.__init__
+    def counting_init(self, *args):
+        builds.append(1)
+        original(self, *args)
+    monkeypatch.setattr(catalog.Catalog, "__init__", counting_init)
+    return builds
+
+def test_snapshot_reused_until_source_changes(tmp_path, monkeypatch):
+    """The tables are parsed once; a changed source file triggers one rebuild"""
+    menu, regions = write_sources(tmp_path)
+    builds = count_builds(monkeypatch)
+
+    first = load_catalog(menu, regions, tmp_path / "snap")
+    second = load_catalog(menu, regions, tmp_path / "snap")
+    assert len(builds) == 1, "Snapshot was not reused"
+    assert second.city_regions["beijing"].resolve("三里屯")[0] == "三里屯/工体"
+    assert list(first.categories.names) == ["火锅"], "Keyword search entry became a category"
+
+    regions.write_text("beijing 望京 r1471\n", encoding="utf-8")
+    os.utime(regions, ns=(0, os.stat(regions).st_mtime_ns + 10**9))
+    third = load_catalog(menu, regions, tmp_path / "snap")
+    assert len(builds) == 2
+    assert "望京" in third.city_regions["beijing"]
+
+def test_corrupt_snapshot_rebuilt(tmp_path):
+    menu, regions = write_sources(tmp_path)
+    snapshot_dir = tmp_path / "snap"
+    snapshot_dir.mkdir()
+    (snapshot_dir / f"catalog.v{catalog.SNAPSHOT_VERSION}.pickle").write_bytes(b"not a pickle")
+
+    assert "火锅" in load_catalog(menu, regions, snapshot_dir).categories
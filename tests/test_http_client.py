@@ -0,0 +1,71 @@
+import pytest
+import json
+import time
+import httpx
+from http_client import HttpFetcher, NeedsBrowser, storage_state_cookies, unusable_page, pushback_sign
+
+@pytest.fixture
+def auth_file(tmp_path):
+    path = tmp_path / "auth.json"
+    path.write_text(json.dumps({"cookies": [
+        {"name": "dper", "value": "abc", "domain": ".dianping.com", "path": "/", "expires": -1},
+        {"name": "old", "value": "x", "domain": ".dianping.com", "path": "/", "expires": time.time() - 60},
+    ], "origins": []}))
+    return path
+
+def test_storage_state_cookies_skip_expired(auth_file):
+    cookies = storage_state_cookies(auth_file)
+    assert cookies.get("dper", domain=".dianping.com") == "abc"
+    assert cookies.get("old") is None
+
+@pytest.mark.asyncio
+async def test_fetch_sends_cookies_and_reuses_client(auth_file):
+    """Requests carry the auth.json session cookie over one shared client"""
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers.get("cookie"))
+        return httpx.Response(200, text="<html>ok</html>")
+
+    fetcher = HttpFetcher(auth_file, transport=httpx.MockTransport(handler))
+    assert await fetcher.fetch_html("https://www.dianping.com/beijing/ch10") == "<html>ok</html>"
+    client = await fetcher.get_client()
+    await fetcher.fetch_html("https://www.dianping.com/beijing/ch10p2")
+
+    assert seen == ["dper=abc", "dper=abc"]
+    assert await fetcher.get_client() is client
+    await fetcher.close()
+
+@pytest.mark.asyncio
+async def test_login_redirect_and_errors_need_browser(auth_file):
+    def handler(request):
+        if request.url.path == "/login-me":
+            return httpx.Response(302, headers={"Location": "https://account.dianping.com/login"})
+        if request.url.host == "account.dianping.com":
+            return httpx.Response(200, text="login")
+        return httpx.Response(403, text="forbidden")
+
+    fetcher = HttpFetcher(auth_file, transport=httpx.MockTransport(handler))
+    with pytest.raises(NeedsBrowser) as e:
+        await fetcher.fetch_html("https://www.dianping.com/login-me")
+    assert e.value.kind == "login"
+    with pytest.raises(NeedsBrowser) as e:
+        await fetcher.fetch_html("https://www.dianping.com/beijing/ch10")
+    assert e.value.kind == "status"
+    assert fetcher.stats() == {"fetched": 0, "fallbacks": {"login": 1, "status": 1}}
+    await fetcher.close()
+
+def test_unusable_page_kinds():
+    assert unusable_page('<script src="https://verify.meituan.com/v2/x.js"></script>').kind == "captcha"
+    assert unusable_page("<div id='app'></div>").kind == "empty"
+
+def test_pushback_kinds():
+    """Only the site refusing us counts as pushback, not local or benign failures"""
+    assert NeedsBrowser("captcha", "x").pushback
+    assert NeedsBrowser("status", "HTTP 429", 429).pushback
+    assert not NeedsBrowser("status", "HTTP 404", 404).pushback
+    assert not NeedsBrowser("auth", "auth.json not found").pushback
+    assert not NeedsBrowser("empty", "JS-only").pushback
+    assert pushback_sign("https://account.dianping.com/login?redir=x") == "login"
+    assert pushback_sign("https://www.dianping.com/shop/x", "<div class='yoda-verify'>") == "captcha"
+    assert pushback_sign("https://www.dianping.com/shop/x", "<html>没有找到</html>") == ""
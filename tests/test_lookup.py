@@ -0,0 +1,39 @@
+import pytest
+from lookup import NameIndex, normalize
+
+REGIONS = {"三里屯/工体": "r2580", "国贸/建外": "r2578", "望京": "r1471", "王府井/东单": "r1475"}
+
+def test_exact_and_slash_aliases():
+    """Each part of a slash-separated name resolves to the full name"""
+    index = NameIndex(REGIONS)
+    assert index.resolve("三里屯/工体") == ("三里屯/工体", [])
+    assert index.resolve("三里屯") == ("三里屯/工体", [])
+    assert index.resolve("工体") == ("三里屯/工体", [])
+    assert index.resolve("三里屯 工体") == ("三里屯/工体", [])
+
+def test_full_width_and_case_normalized():
+    assert normalize("美容／SPA") == normalize("美容/spa") == "美容spa"
+    index = NameIndex({"美容／SPA": "/ch50/g158", "KTV": "/ch15/g135"})
+    assert index.resolve("美容spa")[0] == "美容／SPA"
+    assert index.resolve("ktv")[0] == "KTV"
+
+def test_prefix_and_fuzzy_matching():
+    """Unique prefixes and one-character typos resolve; ambiguous input only suggests"""
+    index = NameIndex(REGIONS)
+    assert index.resolve("王府")[0] == "王府井/东单"
+    assert index.resolve("三理屯")[0] == "三里屯/工体"
+
+    name, suggestions = NameIndex({"shanghai": 1, "shenzhen": 2}).resolve("s")
+    assert name is None and suggestions == ["shanghai", "shenzhen"]
+    assert NameIndex({"shanghai": 1, "shenzhen": 2}).resolve("shanghia")[0] == "shanghai"
+
+def test_unrelated_input_is_not_resolved():
+    name, suggestions = NameIndex(REGIONS).resolve("xyz")
+    assert name is None and suggestions == []
+
+def test_pinyin_aliases():
+    pytest.importorskip("pypinyin")
+    index = NameIndex(REGIONS)
+    assert index.resolve("sanlitun")[0] == "三里屯/工体"
+    assert index.resolve("wangjing")[0] == "望京"
+    assert index.resolve("gm")[0] == "国贸/建外"
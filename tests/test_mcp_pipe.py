@@ -0,0 +1,266 @@
+import pytest
+import json
+import asyncio
+import mcp_pipe
+from mcp_pipe import Router, ServerProcess, INIT_REPLAY_ID, read_frame
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(json.loads(message))
+
+@pytest.fixture
+def make_router(monkeypatch):
+    monkeypatch.setattr(ServerProcess, "alive", property(lambda w: True))
+
+    def make(workers=2, routing='least_outstanding'):
+        router = Router('server.py', workers=workers, routing=routing)
+        for worker in router.workers:
+            worker.inbox = []
+            worker.send = lambda message, inbox=worker.inbox: inbox.append(message) or True
+        router.attach(FakeWebSocket())
+        return router
+    return make
+
+def request(msg_id, method='tools/call'):
+    return json.dumps({"jsonrpc": "2.0", "id": msg_id, "method": method, "params": {}})
+
+def response(msg_id):
+    return json.dumps({"jsonrpc": "2.0", "id": msg_id, "result": {}}) + '\n'
+
+def received_id(worker, n=-1):
+    """The id a worker saw on the n-th message it received"""
+    return json.loads(worker.inbox[n])["id"]
+
+@pytest.mark.asyncio
+async def test_requests_spread_and_responses_routed_back(make_router):
+    """Requests go to the least loaded worker and responses reach the client once"""
+    router = make_router()
+    router.handle_client_message(request(1))
+    router.handle_client_message(request(2))
+    w0, w1 = router.workers
+    assert len(w0.inbox) == 1 and len(w1.inbox) == 1, "Requests not spread over workers"
+
+    await router.handle_worker_message(w1, response(received_id(w1)))
+    await router.handle_worker_message(w1, response(received_id(w1)))  # duplicate is dropped
+    assert [m["id"] for m in router.websocket.sent] == [2]
+    assert w1.outstanding == 0 and w0.outstanding == 1
+
+@pytest.mark.asyncio
+async def test_initialize_broadcast_first_reply_forwarded(make_router):
+    """initialize reaches every worker; the client sees one reply"""
+    router = make_router(workers=3)
+    router.handle_client_message(request(0, 'initialize'))
+    router.handle_client_message(json.dumps({"jsonrpc": "2.0", "method": "notifications/initialized"}))
+    assert all(len(w.inbox) == 2 for w in router.workers)
+
+    for worker in router.workers:
+        await router.handle_worker_message(worker, response(received_id(worker, 0)))
+    assert [m["id"] for m in router.websocket.sent] == [0]
+
+@pytest.mark.asyncio
+async def test_worker_request_ids_are_prefixed(make_router):
+    """A worker-initiated request is answered back to that worker with its own id"""
+    router = make_router()
+    w0, w1 = router.workers
+    await router.handle_worker_message(w1, json.dumps({"jsonrpc": "2.0", "id": 7, "method": "ping"}))
+    forwarded = router.websocket.sent[-1]
+    assert forwarded["id"] == "1:7"
+
+    router.handle_client_message(json.dumps({"jsonrpc": "2.0", "id": "1:7", "result": {}}))
+    assert json.loads(w1.inbox[-1])["id"] == 7
+
+@pytest.mark.asyncio
+async def test_client_reply_to_unknown_request_is_dropped(make_router):
+    """A reply to a request of a crashed worker is not routed as a new request"""
+    router = make_router()
+    router.handle_client_message(json.dumps({"jsonrpc": "2.0", "id": "1:7", "result": {}}))
+    assert all(w.inbox == [] and w.outstanding == 0 for w in router.workers)
+    assert router.metrics.in_flight() == {}
+
+@pytest.mark.asyncio
+async def test_late_reply_after_reconnect_is_dropped(make_router):
+    """A reply to the previous connection never answers the new client's request with the same id"""
+    router = make_router(workers=1)
+    worker = router.workers[0]
+    call = lambda shop: json.dumps({"jsonrpc": "2.0", "id": 1, "method": "tools/call",
+                                    "params": {"name": "dianping_shop_detail", "arguments": {"shop_id": shop}}})
+    router.handle_client_message(call("OLD"))
+    old_id = received_id(worker)
+
+    router.detach()
+    router.attach(FakeWebSocket())
+    router.handle_client_message(call("NEW"))
+    new_id = received_id(worker)
+    assert new_id != old_id
+
+    reply = lambda msg_id, shop: json.dumps({"jsonrpc": "2.0", "id": msg_id, "result": {"shop": shop}}) + '\n'
+    await router.handle_worker_message(worker, reply(old_id, "OLD"))
+    assert router.websocket.sent == []
+    await router.handle_worker_message(worker, reply(new_id, "NEW"))
+    assert router.websocket.sent == [{"jsonrpc": "2.0", "id": 1, "result": {"shop": "NEW"}}]
+
+@pytest.mark.asyncio
+async def test_cancel_reaches_the_worker_with_its_id(make_router):
+    """notifications/cancelled goes to the worker running the request, with the id it knows"""
+    router = make_router()
+    router.handle_client_message(request(5))
+    w0, w1 = router.workers
+    router.handle_client_message(json.dumps({"jsonrpc": "2.0", "method": "notifications/cancelled",
+                                             "params": {"requestId": 5, "reason": "timeout"}}))
+    assert json.loads(w0.inbox[-1])["params"]["requestId"] == received_id(w0, 0)
+    assert w1.inbox == []
+
+@pytest.mark.asyncio
+async def test_request_to_stuck_worker_fails(make_router, monkeypatch):
+    """Once a worker's input queue is full its requests get an error instead of queueing"""
+    monkeypatch.setattr(mcp_pipe, "OUTBOX_LIMIT", 1)
+    router = make_router(workers=1)
+    worker = router.workers[0]
+    worker._outbox = asyncio.Queue(mcp_pipe.OUTBOX_LIMIT)
+    del worker.send  # the real ServerProcess.send
+    router.handle_client_message(request(1))
+    router.handle_client_message(request(2))
+    await asyncio.sleep(0)
+
+    assert worker._outbox.qsize() == 1
+    assert router.websocket.sent == [{"jsonrpc": "2.0", "id": 2, "error": {"code": -32603, "message": "MCP worker unavailable"}}]
+    assert worker.outstanding == 1
+
+@pytest.mark.asyncio
+async def test_respawn_cancels_previous_pipe_tasks(monkeypatch):
+    """Restarting a worker cancels the old process's pipe tasks"""
+    worker = Router('server.py', workers=1).workers[0]
+    old = asyncio.get_running_loop().create_task(asyncio.sleep(60))
+    worker._tasks = [old]
+
+    async def no_process(*args, **kwargs):
+        raise RuntimeError("not started")
+
+    monkeypatch.setattr(asyncio, "create_subprocess_exec", no_process)
+    with pytest.raises(RuntimeError):
+        await worker.start()
+    await asyncio.sleep(0)
+    assert old.cancelled()
+
+@pytest.mark.asyncio
+async def test_workers_learn_their_index_and_count(monkeypatch):
+    """Each worker is told how many workers share budgets, and which one it is"""
+    envs = []
+
+    async def no_process(*args, env=None, **kwargs):
+        envs.append(env)
+        raise RuntimeError("not started")
+
+    monkeypatch.setattr(asyncio, "create_subprocess_exec", no_process)
+    for worker in Router('server.py', workers=2).workers:
+        with pytest.raises(RuntimeError):
+            await worker.start()
+    assert [(env["MCP_PIPE_WORKERS"], env["MCP_PIPE_WORKER"]) for env in envs] == [("2", "0"), ("2", "1")]
+
+@pytest.mark.asyncio
+async def test_round_robin_routing(make_router):
+    """round_robin cycles through workers regardless of load"""
+    router = make_router(workers=2, routing='round_robin')
+    for msg_id in range(4):
+        router.handle_client_message(request(msg_id))
+    assert [len(w.inbox) for w in router.workers] == [2, 2]
+
+@pytest.mark.asyncio
+async def test_replay_replies_are_swallowed(make_router):
+    """Replies to the pipe's own re-initialize are not forwarded"""
+    router = make_router()
+    await router.handle_worker_message(router.workers[0], response(INIT_REPLAY_ID))
+    assert router.websocket.sent == []
+
+@pytest.mark.asyncio
+async def test_read_frame_longer_than_buffer():
+    """Frames longer than the StreamReader limit are read whole"""
+    reader = asyncio.StreamReader(limit=16)
+    big = json.dumps({"md": "推荐菜" * 100}).encode('utf-8') + b'\n'
+    reader.feed_data(big + b'{"id": 2}\n' + b'partial')
+    reader.feed_eof()
+
+    assert await read_frame(reader) == big
+    assert await read_frame(reader) == b'{"id": 2}\n'
+    assert await read_frame(reader) == b'partial'
+    assert await read_frame(reader) == b''
+
+@pytest.mark.asyncio
+async def test_batching_coalesces_responses(make_router, monkeypatch):
+    """With a batch window, responses produced together go out as one frame"""
+    monkeypatch.setattr(mcp_pipe, "BATCH_WINDOW", 0.01)
+    router = make_router()
+    for msg_id in range(3):
+        router.handle_client_message(request(msg_id))
+    for msg_id in range(3):
+        worker = router.workers[msg_id % 2]
+        await router.handle_worker_message(worker, response(received_id(worker, msg_id // 2)))
+    await asyncio.sleep(0.05)
+
+    assert len(router.websocket.sent) == 1, "Responses were not coalesced"
+    assert [m["id"] for m in router.websocket.sent[0]] == [0, 1, 2]
+    stats = router.link_stats
+    assert (stats.messages_out, stats.frames_out) == (3, 1)
+    assert (stats.messages_in, stats.frames_in) == (3, 3)
+
+@pytest.mark.asyncio
+async def test_wire_bytes_show_compression(make_router):
+    """Compressed socket bytes are counted next to the JSON payload bytes"""
+    import websockets
+    received = []
+
+    async def handler(websocket, path=None):
+        received.append(await websocket.recv())
+        await websocket.send(request(1))
+        await websocket.wait_closed()
+
+    router = make_router()
+    async with websockets.serve(handler, "127.0.0.1", 0) as server:
+        port = server.sockets[0].getsockname()[1]
+        async with websockets.connect(f"ws://127.0.0.1:{port}", compression="deflate") as websocket:
+            router.attach(websocket)
+            frame = json.dumps({"jsonrpc": "2.0", "id": 1, "result": {"shops": ["火锅店"] * 500}}) + '\n'
+            await router._send_frame(frame, 1)
+            router.handle_client_message(await websocket.recv())
+
+    stats = router.link_stats
+    assert received and stats.bytes_out == len(frame.encode('utf-8'))
+    assert 0 < stats.wire_bytes_out < stats.bytes_out / 10
+    assert stats.wire_bytes_in > 0
+    assert f"{stats.wire_bytes_out} on the wire" in stats.summary()
+
+@pytest.mark.asyncio
+async def test_metrics_match_requests_to_responses(make_router):
+    """Tool calls are timed per tool name; errors and in-flight requests are counted"""
+    router = make_router()
+    call = lambda msg_id, name: json.dumps({"jsonrpc": "2.0", "id": msg_id, "method": "tools/call",
+                                            "params": {"name": name, "arguments": {}}})
+    router.handle_client_message(call(1, "dianping_shop_detail"))
+    router.handle_client_message(call(2, "dianping_shop_detail"))
+    router.handle_client_message(call(3, "dianping_category_rank"))
+    router.handle_client_message(call(4, "dianping_shop_detail"))
+    router.handle_client_message(call(5, "dianping_shop_detail"))
+    router.handle_client_message(call(6, "dianping_shop_detail"))
+    w0, w1 = router.workers
+    await router.handle_worker_message(w0, response(received_id(w0, 0)))
+    error = json.dumps({"jsonrpc": "2.0", "id": received_id(w1, 0), "error": {"code": -1, "message": "x"}}) + '\n'
+    await router.handle_worker_message(w1, error)
+    # Tool failures come back as results
+    tool_result = lambda msg_id, result: json.dumps({"jsonrpc": "2.0", "id": msg_id, "result": result}) + '\n'
+    await router.handle_worker_message(w1, tool_result(received_id(w1, 1), {"content": [], "isError": True}))
+    await router.handle_worker_message(w0, tool_result(received_id(w0, 2), {"content": [
+        {"type": "text", "text": json.dumps({"success": False, "error": "页面加载失败"}, indent=2)}], "isError": False}))
+    await router.handle_worker_message(w1, tool_result(received_id(w1, 2), {"content": [
+        {"type": "text", "text": json.dumps({"success": True, "name": "店"})}], "isError": False}))
+
+    metrics = router.metrics
+    key = ('client', 'tools/call:dianping_shop_detail')
+    assert metrics.requests[key] == 5
+    assert metrics.errors[key] == 3
+    assert metrics.latency[key].count == 5
+    assert metrics.in_flight() == {('client', 'tools/call:dianping_category_rank'): 1}
+    assert 'mcp_pipe_errors_total{direction="client",method="tools/call:dianping_shop_detail"} 3' \
+        in metrics.render_prometheus()
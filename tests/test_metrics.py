@@ -0,0 +1,70 @@
+import pytest
+import asyncio
+from metrics import Histogram, PipeMetrics, PhaseTimings, serve_metrics
+
+def test_histogram_buckets_and_quantiles():
+    """Observations land in cumulative buckets; quantiles report the bucket bound"""
+    histogram = Histogram(buckets=(0.1, 1, 10))
+    for value in (0.05, 0.05, 0.5, 5, 50):
+        histogram.observe(value)
+
+    assert histogram.count == 5
+    assert histogram.quantile(0.4) == 0.1
+    assert histogram.quantile(0.6) == 1
+    assert histogram.quantile(1.0) == 10
+    lines = histogram.render("latency", 'method="x"')
+    assert 'latency_bucket{method="x",le="1"} 3' in lines
+    assert 'latency_bucket{method="x",le="+Inf"} 5' in lines
+
+def test_tool_calls_labelled_by_name():
+    """tools/call requests are labelled with the tool they call"""
+    msg = {"method": "tools/call", "params": {"name": "dianping_shop_detail"}}
+    assert PipeMetrics.method_label(msg) == "tools/call:dianping_shop_detail"
+    assert PipeMetrics.method_label({"method": "tools/list"}) == "tools/list"
+
+def test_failed_responses():
+    """JSON-RPC errors, isError results and success: false tool results all count as failures"""
+    assert PipeMetrics.failed({"id": 1, "error": {"code": -1}})
+    assert PipeMetrics.failed({"id": 1, "result": {"isError": True}})
+    assert PipeMetrics.failed({"id": 1, "result": {"structuredContent": {"success": False, "error": "x"}}})
+    assert not PipeMetrics.failed({"id": 1, "result": {"structuredContent": {"success": True, "result": []}}})
+    assert not PipeMetrics.failed({"id": 1, "result": {"content": [{"type": "text", "text": "{\"success\": true}"}]}})
+    assert not PipeMetrics.failed({"id": 1, "result": {"tools": []}})
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_serves_prometheus_text():
+    """The local endpoint answers GET /metrics with the rendered text"""
+    server = await serve_metrics(lambda: "mcp_pipe_requests_total 1\n", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        await writer.drain()
+        reply = await reader.read()
+        writer.close()
+    finally:
+        server.close()
+        await server.wait_closed()
+
+    assert reply.startswith(b"HTTP/1.1 200 OK")
+    assert reply.endswith(b"mcp_pipe_requests_total 1\n")
+
+@pytest.mark.asyncio
+async def test_phase_spans_scoped_to_their_call():
+    """Spans in gathered tasks add up in their own call; concurrent calls stay separate"""
+    timings = PhaseTimings()
+
+    async def load(delay):
+        with timings.span("goto"):
+            await asyncio.sleep(delay)
+
+    async def tool(delay):
+        with timings.call("tool") as call:
+            await asyncio.gather(load(delay), load(delay))
+        return call
+
+    fast, slow = await asyncio.gather(tool(0.01), tool(0.05))
+    assert set(fast) == {"goto", "total"}
+    assert fast["goto"] < 0.05 <= slow["goto"]
+    assert timings.histograms["tool.goto"].count == 4
+    assert timings.histograms["tool.total"].count == 2
@@ -0,0 +1,63 @@
+import pytest
+from pathlib import Path
+from parsers import parse_shop_list, parse_list_page, parse_shop_detail_fields, build_shop_detail
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+@pytest.fixture(scope="module")
+def list_html():
+    return (FIXTURES / "shop_list.html").read_text(encoding="utf-8")
+
+@pytest.fixture(scope="module")
+def detail_html():
+    return (FIXTURES / "shop_detail.html").read_text(encoding="utf-8")
+
+def test_parse_shop_list(list_html):
+    """Test offline parsing of a category list page"""
+    items = parse_shop_list(list_html)
+    assert len(items) == 3, "Unexpected number of shops"
+
+    shop = items[0]
+    assert shop["shop_id"] == "k9aBcD1"
+    assert shop["name"] == "海底捞火锅(三里屯店)"
+    assert shop["rating"] == "4.5"
+    assert shop["review_count"] == "12873"
+    assert shop["address"] == "火锅 三里屯/工体"
+    assert shop["price"] == "￥142"
+    assert shop["recommend"] == ["虾滑", "毛肚", "捞派肥牛"]
+
+def test_parse_shop_list_missing_fields(list_html):
+    """Shops without rating, reviews or tags fall back to empty values"""
+    shop = parse_shop_list(list_html)[2]
+    assert shop["shop_id"] == "G7pqR3"
+    assert shop["rating"] == ""
+    assert shop["review_count"] == ""
+    assert shop["address"] == ""
+    assert shop["recommend"] == []
+
+def test_parse_empty_page():
+    """A page without the shop list yields no items"""
+    assert parse_shop_list("<html><body></body></html>") == []
+    assert parse_shop_detail_fields("<html><body></body></html>") == {}
+
+def test_parse_shop_detail(detail_html):
+    """Test offline parsing of a shop detail page"""
+    fields = parse_shop_detail_fields(detail_html)
+    assert fields["name"] == "海底捞火锅(三里屯店)"
+    assert fields["rating"] == "4.8"
+    assert fields["biz_info"] == "营业中 10:00-次日07:00"
+    assert fields["tags"] == ["可停车", "有包厢"]
+    assert fields["recommend_dishes"] == ["虾滑", "毛肚"]
+
+    result = build_shop_detail("k9aBcD1", fields)
+    assert result["success"]
+    assert result["md"].startswith("# 海底捞火锅(三里屯店)")
+    assert "**推荐菜**:\n虾滑, 毛肚" in result["md"]
+
+def test_parse_list_page_reads_pager(list_html):
+    """The last page number comes from the pager; no pager gives None"""
+    pager = '<div class="page"><a class="cur">1</a><a class="PageLink" title="2">2</a>' \
+            '<a class="PageLink" title="3">3</a><a class="next">下一页</a></div>'
+    items, last_page = parse_list_page(list_html.replace("</body>", pager + "</body>"))
+    assert len(items) == 3 and last_page == 3
+    assert parse_list_page(list_html)[1] is None
@@ -0,0 +1,58 @@
+import pytest
+import asyncio
+from prefetch import DetailPrefetcher
+
+class FakeDetails:
+    def __init__(self):
+        self.cached = set()
+        self.loaded = []
+
+    async def load(self, shop_id):
+        self.loaded.append(shop_id)
+        self.cached.add(shop_id)
+        return {"success": True, "shop_id": shop_id}
+
+async def drain(prefetcher):
+    while not prefetcher._queue.empty():
+        await asyncio.sleep(0.001)
+    await asyncio.sleep(0.001)
+
+@pytest.mark.asyncio
+async def test_prefetches_top_k_uncached():
+    details = FakeDetails()
+    details.cached.add("b")
+    prefetcher = DetailPrefetcher(details.load, details.cached.__contains__, lambda: True, top_k=3)
+    prefetcher.offer(["a", "b", "c", "d", ""])
+    await drain(prefetcher)
+    assert details.loaded == ["a", "c"]
+    await prefetcher.stop()
+
+@pytest.mark.asyncio
+async def test_dropped_without_spare_capacity():
+    details = FakeDetails()
+    prefetcher = DetailPrefetcher(details.load, details.cached.__contains__, lambda: False, top_k=2)
+    prefetcher.offer(["a", "b"])
+    await drain(prefetcher)
+    assert details.loaded == []
+    assert prefetcher.stats()["skipped"] == 2
+    await prefetcher.stop()
+
+@pytest.mark.asyncio
+async def test_hit_ratio_counts_used_prefetches():
+    details = FakeDetails()
+    prefetcher = DetailPrefetcher(details.load, details.cached.__contains__, lambda: True, top_k=2)
+    prefetcher.offer(["a", "b"])
+    await drain(prefetcher)
+    prefetcher.record("a", hit=True)
+    prefetcher.record("a", hit=True)  # counted once
+    prefetcher.record("z", hit=False)
+    stats = prefetcher.stats()
+    assert stats["prefetched"] == 2
+    assert stats["used"] == 1
+    assert stats["hit_ratio"] == 0.5
+    await prefetcher.stop()
+
+def test_disabled_by_default():
+    prefetcher = DetailPrefetcher(None, None, None, top_k=0)
+    prefetcher.offer(["a"])
+    assert prefetcher.stats()["offered"] == 0
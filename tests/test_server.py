@@ -2,8 +2,12 @@ import pytest
 from pathlib import Path
 import json
 import asyncio
+import server
+from cache import ResultCache
+from http_client import HttpFetcher
+import httpx
 from playwright.async_api import async_playwright
-from server import get_page, load_menu, load_regions, dianping_category_rank
+from server import get_page, load_menu, load_regions, dianping_category_rank, build_shop_item, shop_id_from_href
 
 @pytest.fixture(scope="session")
 def event_loop():
@@ -88,6 +92,155 @@ async def test_category_rank_with_sort():
     assert 'rating' in shop, "Missing rating"
     assert 'address' in shop, "Missing address"
 
+@pytest.mark.asyncio
+async def test_category_rank_multi_page_merge(monkeypatch):
+    """Pages are fetched by URL, merged in rank order and deduplicated by shop_id"""
+    requested = []
+
+    async def fake_scrape(url):
+        requested.append(url)
+        page = 1 if url.endswith("g110") else int(url.rsplit("p", 1)[1])
+        # Page 2 repeats the last shop of page 1, as Dianping does when ranks shift
+        ids = [f"p{page}s{i}" for i in range(15)]
+        if page == 2:
+            ids[0] = "p1s14"
+        return {"success": True, "result": [{"shop_id": shop_id} for shop_id in ids]}
+
+    monkeypatch.setattr(server, "scrape_shop_list", fake_scrape)
+    monkeypatch.setattr(server, "_cache", ResultCache(db_path=""))
+
+    result = await dianping_category_rank('beijing', '火锅', max_results=40)
+    assert result['success']
+    assert sorted(requested) == sorted([
+        "https://www.dianping.com/beijing/ch10/g110",
+        "https://www.dianping.com/beijing/ch10/g110p2",
+        "https://www.dianping.com/beijing/ch10/g110p3",
+    ])
+    ids = [shop['shop_id'] for shop in result['result']]
+    assert len(ids) == 40
+    assert len(set(ids)) == 40, "Duplicate shop_id in merged ranking"
+    assert ids[:2] == ["p1s0", "p1s1"] and ids[15] == "p2s1"
+
+@pytest.mark.asyncio
+async def test_category_rank_resolves_names_before_scraping(monkeypatch):
+    """Aliases resolve to the canonical names; unknown names fail without a page load"""
+    requested = []
+
+    async def fake_scrape(url):
+        requested.append(url)
+        return {"success": True, "result": [{"shop_id": "a"}]}
+
+    monkeypatch.setattr(server, "scrape_shop_list", fake_scrape)
+    monkeypatch.setattr(server, "_cache", ResultCache(db_path=""))
+
+    result = await dianping_category_rank('Beijing', '日本采', region='三里屯')
+    assert (result['category'], result['region']) == ('日本菜', '三里屯/工体')
+    assert requested == ["https://www.dianping.com/beijing/ch10/g113r2580"]
+
+    result = await dianping_category_rank('beijing', '火锅', region='不存在的地方')
+    assert not result['success']
+    assert len(requested) == 1, "Unresolved region still loaded a page"
+
+@pytest.mark.asyncio
+async def test_list_page_http_fast_path(monkeypatch, tmp_path):
+    """List pages are parsed from plain HTTP; a captcha page falls back to the browser"""
+    list_html = (Path(__file__).parent / "fixtures" / "shop_list.html").read_text(encoding="utf-8")
+
+    def handler(request):
+        if request.url.path.endswith("p2"):
+            return httpx.Response(200, text='<div class="yoda-verify">captcha</div>')
+        return httpx.Response(200, text=list_html)
+
+    auth_file = tmp_path / "auth.json"
+    auth_file.write_text(json.dumps({"cookies": [], "origins": []}))
+    browser_loads = []
+
+    async def fake_get_page(url):
+        browser_loads.append(url)
+        return None, None
+
+    monkeypatch.setattr(server, "_http", HttpFetcher(auth_file, transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(server, "get_page", fake_get_page)
+    monkeypatch.setattr(server, "LIST_FETCH_MODE", "http")
+    monkeypatch.setattr(server, "HAR_MODE", "")
+
+    result = await server._load_shop_list("https://www.dianping.com/beijing/ch10/g110")
+    assert result['success'] and len(result['result']) == 3
+    assert browser_loads == []
+
+    await server._load_shop_list("https://www.dianping.com/beijing/ch10/g110p2")
+    assert browser_loads == ["https://www.dianping.com/beijing/ch10/g110p2"]
+    assert server._http.stats()["fallbacks"] == {"captcha": 1}
+
+@pytest.mark.asyncio
+async def test_half_open_probe_covers_the_browser_fallback(monkeypatch, tmp_path):
+    """A probe's JS-only HTTP page falls back to the browser on the same token, then frees the probe"""
+    from throttle import Throttle
+    auth_file = tmp_path / "auth.json"
+    auth_file.write_text(json.dumps({"cookies": [], "origins": []}))
+    browser_loads = []
+
+    async def fake_get_page(url):
+        browser_loads.append(url)
+        return None, None
+
+    throttle = Throttle(rate=0, breaker_failures=1, breaker_cooldown=0.05)
+    monkeypatch.setattr(server, "_throttle", throttle)
+    monkeypatch.setattr(server, "_http", HttpFetcher(auth_file, transport=httpx.MockTransport(
+        lambda request: httpx.Response(200, text="<div id='app'></div>"))))
+    monkeypatch.setattr(server, "get_page", fake_get_page)
+    monkeypatch.setattr(server, "LIST_FETCH_MODE", "http")
+    monkeypatch.setattr(server, "HAR_MODE", "")
+    url = f"{server.ORIGIN}/beijing/ch10/g110"
+
+    throttle.failure(url, "captcha")
+    await asyncio.sleep(0.06)
+    result = await server._load_shop_list(url)
+    assert result["error"] == "需要登录并上传auth.json"
+    assert browser_loads == [url]
+    limiter = throttle.limiter(url)
+    assert limiter.state == "half_open" and not limiter._probing
+
+@pytest.mark.asyncio
+async def test_shop_details_batch_partial_results(monkeypatch):
+    """Batch returns successful details plus per-id errors and timeouts"""
+    async def fake_scrape(shop_id):
+        if shop_id == "slow":
+            await asyncio.sleep(1)
+        if shop_id == "missing":
+            return {"success": False, "error": "页面加载失败"}
+        return {"success": True, "shop_id": shop_id}
+
+    monkeypatch.setattr(server, "scrape_shop_detail", fake_scrape)
+    monkeypatch.setattr(server, "_cache", ResultCache(db_path=""))
+    monkeypatch.setattr(server, "BATCH_ITEM_TIMEOUT", 0.1)
+
+    result = await server.dianping_shop_details_batch(["a", "missing", "slow", "b", "a"])
+    assert result['success']
+    assert [r['shop_id'] for r in result['results']] == ["a", "b"]
+    assert result['errors']['missing'] == "页面加载失败"
+    assert "超时" in result['errors']['slow']
+
+@pytest.mark.asyncio
+async def test_shop_detail_debug_timings(monkeypatch):
+    """With DEBUG_TIMINGS, results carry a per-phase breakdown that is not cached"""
+    async def fake_scrape(shop_id):
+        with server._timings.span("goto"):
+            await asyncio.sleep(0.01)
+        return {"success": True, "shop_id": shop_id}
+
+    monkeypatch.setattr(server, "scrape_shop_detail", fake_scrape)
+    monkeypatch.setattr(server, "_cache", ResultCache(db_path=""))
+    monkeypatch.setattr(server, "DEBUG_TIMINGS", True)
+
+    result = await server.dianping_shop_detail("a")
+    assert set(result['timings']) == {"cache", "goto", "total"}
+    assert result['timings']['goto'] >= 10
+    assert "timings" not in server._cache.get("detail", "a")
+
+    monkeypatch.setattr(server, "DEBUG_TIMINGS", False)
+    assert "timings" not in await server.dianping_shop_detail("a")
+
 # Sync tests can remain unchanged
 def test_auth_file_exists():
     """Test if auth.json exists and is valid JSON"""
@@ -131,5 +284,252 @@ def test_load_regions():
         assert beijing[region].startswith('r'), \
             f"Invalid region code format for '{region}': {beijing[region]}"
 
+def test_shop_id_from_href():
+    """Test shop id extraction from list links"""
+    assert shop_id_from_href("https://www.dianping.com/shop/H1a2b3c") == "H1a2b3c"
+    assert shop_id_from_href("https://www.dianping.com/beijing/ch10") == ""
+    assert shop_id_from_href("") == ""
+
+def test_build_shop_item():
+    """Test conversion of raw in-page extraction output to result items"""
+    item = build_shop_item({
+        "name": "海底捞",
+        "href": "https://www.dianping.com/shop/k9abc",
+        "star_class": "star star_45 star_sml",
+        "review_count": "1234",
+        "address": "朝阳区 三里屯",
+        "price": "￥120",
+        "recommend": ["毛肚", "虾滑"],
+    })
+    assert item["shop_id"] == "k9abc"
+    assert item["rating"] == "4.5"
+    assert item["recommend"] == ["毛肚", "虾滑"]
+
+    # Missing star element yields an empty rating, missing class yields "0"
+    assert build_shop_item({"star_class": None})["rating"] == ""
+    assert build_shop_item({"star_class": ""})["rating"] == "0"
+
+@pytest.mark.asyncio
+async def test_open_circuit_fails_fast(monkeypatch, tmp_path):
+    """While the circuit is open no page is opened and nothing is cached"""
+    from throttle import Throttle
+
+    def no_pool():
+        raise AssertionError("page opened while the circuit is open")
+
+    (tmp_path / "auth.json").write_text(json.dumps({"cookies": [], "origins": []}))
+    monkeypatch.chdir(tmp_path)
+    throttle = Throttle(rate=0, breaker_failures=1, breaker_cooldown=60)
+    throttle.failure(server.ORIGIN, "captcha")
+    monkeypatch.setattr(server, "_throttle", throttle)
+    monkeypatch.setattr(server, "get_pool", no_pool)
+    monkeypatch.setattr(server, "LIST_FETCH_MODE", "browser")
+    monkeypatch.setattr(server, "_cache", ResultCache(db_path=""))
+
+    result = await server.get_shop_detail("abc123")
+    assert not result["success"]
+    assert "秒后重试" in result["error"]
+    assert server._cache.get("detail", "abc123") is None
+    result = await server.scrape_shop_list(f"{server.ORIGIN}/beijing/ch10/g110")
+    assert not result["success"]
+
+@pytest.mark.asyncio
+async def test_missing_auth_does_not_trip_the_breaker(monkeypatch, tmp_path):
+    """A local config error is reported as such, never as pushback"""
+    from throttle import Throttle
+    monkeypatch.chdir(tmp_path)
+    throttle = Throttle(rate=0, breaker_failures=2)
+    monkeypatch.setattr(server, "_throttle", throttle)
+    monkeypatch.setattr(server, "_http", HttpFetcher(tmp_path / "auth.json"))
+    monkeypatch.setattr(server, "LIST_FETCH_MODE", "http")
+    monkeypatch.setattr(server, "HAR_MODE", "")
+
+    for _ in range(3):
+        result = await server.scrape_shop_list(f"{server.ORIGIN}/beijing/ch10/g110")
+        assert result["error"] == "需要登录并上传auth.json"
+    assert throttle.stats()[server.ORIGIN]["failures"] == {}
+
+class FakePage:
+    def __init__(self, html, url="https://www.dianping.com/beijing/ch10/g110p8"):
+        self.html = html
+        self.url = url
+
+    async def wait_for_load_state(self, state):
+        pass
+
+    async def wait_for_selector(self, selector, timeout=None):
+        raise TimeoutError(selector)
+
+    async def evaluate(self, script):
+        return {"shops": [], "last_page": None}
+
+    async def content(self):
+        return self.html
+
+    async def close(self):
+        pass
+
+@pytest.mark.asyncio
+async def test_only_verification_pages_count_as_pushback(monkeypatch):
+    """Empty lists and missing shops are real results; a captcha page is pushback"""
+    from throttle import Throttle
+    pages = []
+
+    async def fake_get_page(url):
+        return object(), pages.pop(0)
+
+    throttle = Throttle(rate=0, breaker_failures=2)
+    monkeypatch.setattr(server, "_throttle", throttle)
+    monkeypatch.setattr(server, "get_page", fake_get_page)
+    monkeypatch.setattr(server, "LIST_FETCH_MODE", "browser")
+    url = f"{server.ORIGIN}/beijing/ch10/g110p8"
+
+    pages += [FakePage("<html>没有找到商户</html>"), FakePage("<html>页面不存在</html>")]
+    assert (await server._load_shop_list(url))["result"] == []
+    assert not (await server._load_shop_detail("gone", f"{server.ORIGIN}/shop/gone"))["success"]
+    assert throttle.limiter(server.ORIGIN).stats()["failures"] == {}
+
+    pages += [FakePage('<div class="yoda-verify"></div>'),
+              FakePage("", url="https://verify.meituan.com/v2/web/general_page")]
+    await server._load_shop_list(url)
+    await server._load_shop_detail("abc", f"{server.ORIGIN}/shop/abc")
+    assert throttle.limiter(server.ORIGIN).stats()["failures"] == {"captcha": 1, "login": 1}
+
+@pytest.mark.asyncio
+async def test_rank_requests_feed_the_warmer(monkeypatch):
+    """Ranking pages agents ask for become warm targets, refreshed into the rank cache"""
+    from warmer import CacheWarmer
+    scraped = []
+
+    async def fake_scrape(url):
+        scraped.append(url)
+        return {"success": True, "result": [{"shop_id": url}]}
+
+    monkeypatch.setattr(server, "scrape_shop_list", fake_scrape)
+    monkeypatch.setattr(server, "_cache", ResultCache(db_path=""))
+    warmer = CacheWarmer(
+        refresh=server.refresh_shop_list_page,
+        expiry=lambda url: server._cache.expiry("rank", url),
+        ttl=server.RANK_TTL, rate=0
+    )
+    monkeypatch.setattr(server, "_warmer", warmer)
+
+    await dianping_category_rank(city='beijing', category='火锅', sort='好评优先')
+    url = server.rank_url('beijing', '火锅', '', '好评优先')
+    assert scraped == [url]
+    assert warmer.targets() == [url]
+    assert await warmer.warm_once() == 0  # still fresh
+
+    server._cache.set("rank", url, {"result": [], "last_page": None}, 1)  # about to expire
+    assert await warmer.warm_once() == 1
+    assert scraped == [url, url]
+    assert server._cache.get("rank", url)["result"] == [{"shop_id": url}]
+
+@pytest.mark.asyncio
+async def test_stale_ranking_served_then_refreshed(monkeypatch):
+    """Within max-stale a ranking is returned at once, flagged stale, and refreshed behind it"""
+    scraped = []
+    refreshed = asyncio.Event()
+
+    async def fake_scrape(url):
+        scraped.append(url)
+        refreshed.set()
+        return {"success": True, "result": [{"shop_id": "new"}]}
+
+    monkeypatch.setattr(server, "scrape_shop_list", fake_scrape)
+    monkeypatch.setattr(server, "_cache", ResultCache(db_path="", retention=3600))
+    monkeypatch.setattr(server, "RANK_MAX_STALE", 3600)
+    url = server.rank_url('beijing', '火锅')
+    server._cache.set("rank", url, {"result": [{"shop_id": "old"}], "last_page": None}, -10)
+
+    result = await dianping_category_rank(city='beijing', category='火锅')
+    assert result["stale"] is True
+    assert [item["shop_id"] for item in result["result"]] == ["old"]
+    assert result["as_of"]
+
+    await asyncio.wait_for(refreshed.wait(), 1)
+    await asyncio.sleep(0)
+    result = await dianping_category_rank(city='beijing', category='火锅')
+    assert result["stale"] is False
+    assert [item["shop_id"] for item in result["result"]] == ["new"]
+    assert scraped == [url]
+
+@pytest.mark.asyncio
+async def test_shop_detail_past_max_stale_is_scraped(monkeypatch):
+    """Beyond max-stale the call waits for a live scrape"""
+    async def fake_scrape(shop_id):
+        return {"success": True, "shop_id": shop_id, "name": "新"}
+
+    monkeypatch.setattr(server, "scrape_shop_detail", fake_scrape)
+    monkeypatch.setattr(server, "_cache", ResultCache(db_path="", retention=3600))
+    monkeypatch.setattr(server, "DETAIL_MAX_STALE", 60)
+    server._cache.set("detail", "abc", {"success": True, "shop_id": "abc", "name": "旧"}, -120)
+
+    result = await server.get_shop_detail("abc")
+    assert result["name"] == "新"
+    assert result["stale"] is False
+
+@pytest.mark.asyncio
+async def test_ranking_prefetches_top_details(monkeypatch):
+    """The top K shops of a fresh ranking are loaded into the detail cache"""
+    from prefetch import DetailPrefetcher
+    scraped = []
+
+    async def fake_scrape_list(url):
+        return {"success": True, "result": [{"shop_id": f"s{n}"} for n in range(5)]}
+
+    async def fake_scrape_detail(shop_id):
+        scraped.append(shop_id)
+        return {"success": True, "shop_id": shop_id}
+
+    monkeypatch.setattr(server, "scrape_shop_list", fake_scrape_list)
+    monkeypatch.setattr(server, "scrape_shop_detail", fake_scrape_detail)
+    monkeypatch.setattr(server, "_cache", ResultCache(db_path=""))
+    prefetcher = DetailPrefetcher(server.refresh_shop_detail, server.detail_cached, lambda: True, top_k=2)
+    monkeypatch.setattr(server, "_prefetcher", prefetcher)
+
+    await dianping_category_rank(city='beijing', category='火锅')
+    for _ in range(100):
+        if len(scraped) == 2:
+            break
+        await asyncio.sleep(0.001)
+    assert scraped == ["s0", "s1"]
+
+    result = await server.get_shop_detail("s0")
+    assert result["success"]
+    assert scraped == ["s0", "s1"]
+    assert prefetcher.stats()["hit_ratio"] == 0.5
+    await prefetcher.stop()
+
+@pytest.mark.asyncio
+async def test_category_rank_stops_at_the_last_page(monkeypatch):
+    """Pages past the pager's last page, or past a short unpaged list, are never fetched"""
+    requested = []
+    last_page = 2
+
+    async def fake_scrape(url):
+        requested.append(url)
+        return {"success": True, "result": [{"shop_id": f"{url}#{i}"} for i in range(15)], "last_page": last_page}
+
+    monkeypatch.setattr(server, "scrape_shop_list", fake_scrape)
+    monkeypatch.setattr(server, "_cache", ResultCache(db_path=""))
+
+    result = await dianping_category_rank('beijing', '火锅', pages=8)
+    assert len(result['result']) == 30
+    assert requested == ["https://www.dianping.com/beijing/ch10/g110", "https://www.dianping.com/beijing/ch10/g110p2"]
+
+    # The cached first page keeps its pager
+    requested.clear()
+    await dianping_category_rank('beijing', '火锅', pages=8)
+    assert requested == []
+
+    async def short_scrape(url):
+        requested.append(url)
+        return {"success": True, "result": [{"shop_id": "only"}], "last_page": None}
+
+    monkeypatch.setattr(server, "scrape_shop_list", short_scrape)
+    await dianping_category_rank('beijing', '日本菜', pages=8)
+    assert requested == ["https://www.dianping.com/beijing/ch10/g113"]
+
 if __name__ == "__main__":
-    pytest.main(['-v', '-s', __file__])
\ No newline at end of file
+    pytest.main(['-v', '-s', __file__])
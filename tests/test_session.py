@@ -0,0 +1,55 @@
+import time
+from session import SessionCache, detect_auth_failure, SESSION_COOKIE
+
+def test_valid_session_cookie():
+    """A present, unexpired session cookie passes the cheap checks"""
+    cookies = [{"name": SESSION_COOKIE, "value": "abc", "expires": time.time() + 3600}]
+    assert detect_auth_failure("https://www.dianping.com/beijing", cookies) == ""
+
+def test_session_cookie_without_expiry():
+    """Session cookies (expires=-1) are treated as valid"""
+    cookies = [{"name": SESSION_COOKIE, "value": "abc", "expires": -1}]
+    assert detect_auth_failure("https://www.dianping.com/beijing", cookies) == ""
+
+def test_login_redirect_detected():
+    """A redirect to the account site is an auth failure"""
+    cookies = [{"name": SESSION_COOKIE, "value": "abc", "expires": -1}]
+    reason = detect_auth_failure("https://account.dianping.com/login?redir=x", cookies)
+    assert "redirected" in reason
+
+def test_missing_and_expired_cookie():
+    """Missing or expired session cookies are auth failures"""
+    assert "missing" in detect_auth_failure("https://www.dianping.com/beijing", [])
+    expired = [{"name": SESSION_COOKIE, "value": "abc", "expires": time.time() - 10}]
+    assert "expired" in detect_auth_failure("https://www.dianping.com/beijing", expired)
+
+def test_session_cache_ttl():
+    """mark_valid makes the cache fresh until the TTL lapses or it is invalidated"""
+    cache = SessionCache(ttl=60)
+    assert not cache.fresh
+    cache.mark_valid("tester")
+    assert cache.fresh and cache.username == "tester"
+    cache.invalidate("test")
+    assert not cache.fresh and cache.username is None
+
+    expired = SessionCache(ttl=0)
+    expired.mark_valid("tester")
+    assert not expired.fresh
+
+def test_failed_check_backs_off():
+    """A failed username check isn't retried until its backoff lapses, which doubles per failure"""
+    cache = SessionCache(ttl=60, retry=0.05)
+    assert cache.due
+    cache.check_failed("username check failed")
+    assert not cache.due
+    time.sleep(0.06)
+    assert cache.due
+    cache.check_failed("username check failed")
+    time.sleep(0.06)
+    assert not cache.due
+    time.sleep(0.05)
+    assert cache.due
+    cache.mark_valid("tester")
+    assert not cache.due
+    cache.invalidate("cookie expired")
+    assert cache.due
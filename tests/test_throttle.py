@@ -0,0 +1,113 @@
+import pytest
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from throttle import AdaptiveLimiter, Throttle, CircuitOpen
+
+@pytest.mark.asyncio
+async def test_bucket_paces_after_burst():
+    limiter = AdaptiveLimiter(rate=20, burst=2)
+    start = time.monotonic()
+    for _ in range(4):
+        await limiter.acquire()
+    # Two tokens up front, then one every 50ms
+    assert time.monotonic() - start >= 0.09
+
+def test_rate_is_aimd():
+    limiter = AdaptiveLimiter(rate=2, min_rate=0.5, max_rate=2.1, breaker_failures=100)
+    limiter.success()
+    limiter.success()
+    limiter.success()
+    assert limiter.rate == pytest.approx(2.1)
+    limiter.failure("captcha")
+    assert limiter.rate == pytest.approx(1.05)
+    # A burst of failures within a second halves the rate once
+    limiter.failure("captcha")
+    assert limiter.rate == pytest.approx(1.05)
+    assert limiter.stats()["failures"] == {"captcha": 2}
+
+def test_unpaced_rate_is_not_adapted():
+    limiter = AdaptiveLimiter(rate=0)
+    limiter.failure("timeout")
+    limiter.success()
+    assert limiter.rate == 0
+
+@pytest.mark.asyncio
+async def test_circuit_opens_then_probes():
+    limiter = AdaptiveLimiter(rate=0, breaker_failures=3, breaker_cooldown=0.05)
+    for _ in range(3):
+        await limiter.acquire()
+        limiter.failure("login")
+    with pytest.raises(CircuitOpen) as e:
+        await limiter.acquire()
+    assert 0 < e.value.retry_after <= 0.05
+    assert limiter.stats()["rejected"] == 1
+
+    time.sleep(0.06)
+    await limiter.acquire()  # the probe
+    assert limiter.state == "half_open"
+    with pytest.raises(CircuitOpen):
+        await limiter.acquire()  # only one probe at a time
+    limiter.failure("login")
+    assert limiter.state == "open"
+
+    time.sleep(0.06)
+    await limiter.acquire()
+    limiter.success()
+    assert limiter.state == "closed"
+    await limiter.acquire()
+
+@pytest.mark.asyncio
+async def test_release_frees_the_probe():
+    limiter = AdaptiveLimiter(rate=0, breaker_failures=1, breaker_cooldown=0.05)
+    limiter.failure("captcha")
+    time.sleep(0.06)
+    await limiter.acquire()  # the probe
+    with pytest.raises(CircuitOpen) as e:
+        await limiter.acquire()
+    assert 0 < e.value.retry_after <= 0.05
+    limiter.release()
+    await limiter.acquire()  # the next probe
+    assert limiter.state == "half_open"
+    limiter.success()
+    limiter.release()
+    assert limiter.state == "closed"
+
+def test_success_resets_failure_count():
+    limiter = AdaptiveLimiter(rate=0, breaker_failures=2)
+    limiter.failure("timeout")
+    limiter.success()
+    limiter.failure("timeout")
+    assert limiter.state == "closed"
+
+@pytest.mark.asyncio
+async def test_throttle_is_per_origin():
+    throttle = Throttle(rate=0, breaker_failures=1, breaker_cooldown=60)
+    throttle.failure("https://www.dianping.com/beijing", "captcha")
+    with pytest.raises(CircuitOpen):
+        await throttle.acquire("https://www.dianping.com/shop/abc")
+    await throttle.acquire("http://127.0.0.1:8800/beijing")
+    assert throttle.stats()["https://www.dianping.com"]["state"] == "open"
+
+@pytest.mark.asyncio
+async def test_spare_leaves_a_token_for_callers():
+    limiter = AdaptiveLimiter(rate=0.01, burst=3)
+    assert limiter.spare()
+    await limiter.acquire()
+    assert limiter.spare()
+    await limiter.acquire()
+    assert not limiter.spare()
+    unpaced = AdaptiveLimiter(rate=0, breaker_failures=1)
+    assert unpaced.spare()
+    unpaced.failure("captcha")
+    assert not unpaced.spare()
+
+def test_budget_split_between_pipe_workers():
+    """With MCP_PIPE_WORKERS=N each worker paces at 1/N of DIANPING_RATE"""
+    env = dict(os.environ, MCP_PIPE_WORKERS="4", DIANPING_RATE="2", DIANPING_RATE_BURST="3")
+    out = subprocess.run([sys.executable, "-c", "import throttle; print(throttle.RATE, throttle.BURST)"],
+                         env=env, cwd=Path(__file__).resolve().parent.parent,
+                         capture_output=True, text=True, check=True).stdout
+    assert out.split() == ["0.5", "1.0"]
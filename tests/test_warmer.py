@@ -0,0 +1,82 @@
+import pytest
+import time
+from catalog import get_catalog
+from warmer import CacheWarmer, seed_combinations
+
+SORTS = ["智能排序", "好评优先"]
+
+class FakeCache:
+    """url -> expiry, filled by the warmer's refresh"""
+
+    def __init__(self):
+        self.expiries = {}
+        self.refreshed = []
+
+    async def refresh(self, url):
+        self.refreshed.append(url)
+        self.expiries[url] = time.time() + 600
+        return {"success": True, "result": [{"shop_id": "x"}]}
+
+def make_warmer(cache, **settings):
+    return CacheWarmer(refresh=cache.refresh, expiry=cache.expiries.get, ttl=600, rate=0, **settings)
+
+def test_seed_combinations_resolve_names():
+    combinations = seed_combinations(get_catalog(), SORTS, cities=["Beijing"], categories=["火锅", "不存在的分类"],
+                                     regions=["三里屯"], warm_sorts=["*"])
+    assert combinations == [("beijing", "火锅", "三里屯/工体", "智能排序"), ("beijing", "火锅", "三里屯/工体", "好评优先")]
+    # No regions: one city-wide ranking per category and sort
+    assert seed_combinations(get_catalog(), SORTS, cities=["beijing"], categories=["火锅"], regions=[],
+                             warm_sorts=["智能排序"]) == [("beijing", "火锅", "", "智能排序")]
+
+def test_demand_outranks_seeds_and_decays():
+    warmer = make_warmer(FakeCache(), half_life=60)
+    warmer.set_seeds(["seed-a", "seed-b"])
+    warmer.record("wanted", hit=False)
+    warmer.record("wanted", hit=False)
+    warmer.record("seed-b", hit=False)
+    assert warmer.targets() == ["wanted", "seed-b", "seed-a"]
+    # Two half-lives later 'wanted' weighs 0.5, a tie with a bare seed
+    assert warmer.priority("wanted", now=time.time() + 120) == pytest.approx(0.5, rel=0.01)
+
+@pytest.mark.asyncio
+async def test_warm_once_refreshes_due_targets_by_priority():
+    cache = FakeCache()
+    warmer = make_warmer(cache, max_targets=2, margin=0.2)
+    warmer.set_seeds(["a", "b"])
+    warmer.record("c", hit=False)
+    cache.expiries["a"] = time.time() + 500  # fresh enough
+    # 'b' is outside the top 2
+    assert await warmer.warm_once() == 1
+    assert cache.refreshed == ["c"]
+    # 'a' is due once close to expiry
+    cache.expiries["a"] = time.time() + 60
+    assert await warmer.warm_once() == 1
+    assert cache.refreshed == ["c", "a"]
+
+@pytest.mark.asyncio
+async def test_failure_ends_the_pass():
+    cache = FakeCache()
+
+    async def blocked(url):
+        cache.refreshed.append(url)
+        return {"success": False, "error": "访问受限"}
+
+    warmer = CacheWarmer(refresh=blocked, expiry=cache.expiries.get, ttl=600, rate=0)
+    warmer.set_seeds(["a", "b"])
+    assert await warmer.warm_once() == 0
+    assert cache.refreshed == ["a"]
+    assert warmer.stats()["failed"] == 1
+
+def test_stats_report_coverage():
+    cache = FakeCache()
+    warmer = make_warmer(cache)
+    warmer.set_seeds(["a", "b"])
+    warmer.record("a", hit=True)
+    warmer.record("c", hit=False)
+    cache.expiries["a"] = time.time() + 600
+    stats = warmer.stats()
+    assert stats["targets"] == 3
+    assert stats["warm"] == 1
+    assert stats["coverage"] == pytest.approx(0.333)
+    assert stats["demand_coverage"] == pytest.approx(0.5)
+    assert stats["warm_hit_ratio"] == 0.5
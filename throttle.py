@@ -0,0 +1,197 @@
+"""
+Per-origin request pacing for Dianping page loads.
+
+Every navigation and HTTP fetch takes a token from its origin's bucket. The
+bucket's rate adapts AIMD-style: each clean load raises it by RATE_STEP, and
+a sign of anti-bot pushback (login redirect, captcha, 403/429, timeout) halves
+it, at most once per second so one burst of failures counts once.
+
+After BREAKER_FAILURES consecutive failures the origin's circuit opens and
+calls fail fast with CircuitOpen for BREAKER_COOLDOWN seconds. Then a single
+probe is let through: success closes the circuit, failure re-opens it, and a
+load that says nothing about pushback (a missing page, no auth) releases it
+for the next caller.
+
+Limiters live in one process. Under mcp_pipe.py with MCP_WORKERS=N, the pipe
+tells each worker N (MCP_PIPE_WORKERS) and the rates and burst are split N
+ways, so the site still sees DIANPING_RATE in total. Breakers are not shared:
+each worker trips and probes on its own.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Processes sharing the budget (set by mcp_pipe.py for its workers)
+WORKER_SHARE = max(1, int(os.environ.get("MCP_PIPE_WORKERS", "1")))
+# Requests per second per origin across all workers: starting rate, bounds and
+# additive step (RATE=0 disables pacing)
+RATE = float(os.environ.get("DIANPING_RATE", "2")) / WORKER_SHARE
+MIN_RATE = float(os.environ.get("DIANPING_RATE_MIN", "0.2")) / WORKER_SHARE
+MAX_RATE = float(os.environ.get("DIANPING_RATE_MAX", "5")) / WORKER_SHARE
+RATE_STEP = 0.05 / WORKER_SHARE
+DECREASE_FACTOR = 0.5
+BURST = max(1.0, float(os.environ.get("DIANPING_RATE_BURST", "3")) / WORKER_SHARE)
+# Circuit breaker
+BREAKER_FAILURES = int(os.environ.get("DIANPING_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.environ.get("DIANPING_BREAKER_COOLDOWN", "30"))
+
+
+class CircuitOpen(Exception):
+    """The origin is cooling down after repeated failures"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"circuit open, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class AdaptiveLimiter:
+    """AIMD token bucket plus circuit breaker for one origin"""
+
+    def __init__(self, rate=None, min_rate=None, max_rate=None, burst=None,
+                 breaker_failures=None, breaker_cooldown=None):
+        self.rate = RATE if rate is None else rate
+        self.min_rate = MIN_RATE if min_rate is None else min_rate
+        self.max_rate = MAX_RATE if max_rate is None else max_rate
+        self.burst = BURST if burst is None else burst
+        self.breaker_failures = breaker_failures or BREAKER_FAILURES
+        self.breaker_cooldown = BREAKER_COOLDOWN if breaker_cooldown is None else breaker_cooldown
+        self._tokens = self.burst
+        self._refilled = time.monotonic()
+        self._lock = asyncio.Lock()
+        self._last_decrease = 0.0
+        self.consecutive_failures = 0
+        self.state = "closed"  # closed, open or half_open
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self.successes = 0
+        self.failures = {}
+        self.rejected = 0
+
+    @property
+    def paced(self) -> bool:
+        return self.rate > 0
+
+    def _check_circuit(self):
+        if self.state == "open":
+            remaining = self._opened_at + self.breaker_cooldown - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpen(remaining)
+            self.state = "half_open"
+            logger.info("Circuit half-open, probing")
+        if self.state == "half_open":
+            # A probe whose outcome was never reported stops blocking after a cooldown
+            remaining = self._probe_started + self.breaker_cooldown - time.monotonic()
+            if self._probing and remaining > 0:
+                self.rejected += 1
+                raise CircuitOpen(remaining)
+            self._probing = True
+            self._probe_started = time.monotonic()
+
+    async def acquire(self):
+        """Wait for a token; raises CircuitOpen while the circuit is open"""
+        self._check_circuit()
+        if not self.paced:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+                self._refilled = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def spare(self) -> bool:
+        """Whether a load could start now and still leave a token for the next caller"""
+        if self.state != "closed":
+            return False
+        if not self.paced:
+            return True
+        tokens = min(self.burst, self._tokens + (time.monotonic() - self._refilled) * self.rate)
+        return tokens >= 2 and not self._lock.locked()
+
+    def success(self):
+        self.successes += 1
+        self.consecutive_failures = 0
+        if self.state != "closed":
+            logger.info("Circuit closed")
+        self.state = "closed"
+        self._probing = False
+        if self.paced:
+            self.rate = min(self.max_rate, self.rate + RATE_STEP)
+
+    def release(self):
+        """End a load that was neither a clean load nor pushback
+
+        A half-open probe that ends this way lets the next call probe instead.
+        Does nothing after success() or failure().
+        """
+        if self.state == "half_open":
+            self._probing = False
+
+    def failure(self, kind: str):
+        """Record a load that failed in a way that suggests pushback"""
+        now = time.monotonic()
+        self.failures[kind] = self.failures.get(kind, 0) + 1
+        self.consecutive_failures += 1
+        if self.paced and now - self._last_decrease >= 1:
+            self.rate = max(self.min_rate, self.rate * DECREASE_FACTOR)
+            self._last_decrease = now
+        if self.state == "half_open" or self.consecutive_failures >= self.breaker_failures:
+            if self.state != "open":
+                logger.warning(f"Circuit open for {self.breaker_cooldown:g}s after {kind} "
+                               f"({self.consecutive_failures} consecutive failures)")
+            self.state = "open"
+            self._opened_at = now
+            self._probing = False
+
+    def stats(self) -> dict:
+        return {
+            "rate": round(self.rate, 3),
+            "state": self.state,
+            "successes": self.successes,
+            "failures": dict(self.failures),
+            "rejected": self.rejected,
+        }
+
+
+class Throttle:
+    """One AdaptiveLimiter per origin (scheme and host)"""
+
+    def __init__(self, **limiter_settings):
+        self._settings = limiter_settings
+        self._limiters = {}
+
+    def limiter(self, url: str) -> AdaptiveLimiter:
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        limiter = self._limiters.get(origin)
+        if limiter is None:
+            limiter = self._limiters[origin] = AdaptiveLimiter(**self._settings)
+        return limiter
+
+    async def acquire(self, url: str):
+        await self.limiter(url).acquire()
+
+    def spare(self, url: str) -> bool:
+        return self.limiter(url).spare()
+
+    def success(self, url: str):
+        self.limiter(url).success()
+
+    def release(self, url: str):
+        self.limiter(url).release()
+
+    def failure(self, url: str, kind: str):
+        self.limiter(url).failure(kind)
+
+    def stats(self) -> dict:
+        return {origin: limiter.stats() for origin, limiter in self._limiters.items()}
@@ -0,0 +1,243 @@
+"""
+Background cache warmer for category rankings.
+
+The menu and region tables make the dianping_category_rank query space
+finite: city × category × region × sort. The warmer keeps the list pages of a
+priority subset of it in the result cache, refreshing each page before its
+entry expires, so the rankings agents ask for are served warm.
+
+Targets come from two sources:
+
+- seeds: the DIANPING_WARM_* lists ("*" for every value), resolved against
+  the catalog
+- demand: every list page requested through the tool, weighted by a request
+  count that decays with a half-life of DIANPING_WARM_HALF_LIFE seconds
+
+A seed weighs less than a single recent request, so observed demand always
+ranks first. Each pass refreshes, in priority order, the top
+DIANPING_WARM_MAX_TARGETS pages that are missing or within DIANPING_WARM_MARGIN
+(a fraction of the TTL) of expiring. Passes are paced to DIANPING_WARM_RATE
+pages per second, on top of the origin's own rate limiter, and a pass stops at
+its first failure.
+
+Under mcp_pipe.py with MCP_WORKERS=N only worker 0 (MCP_PIPE_WORKER) warms, so
+the seeds aren't fetched N times over the shared rate budget. Its demand is
+what worker 0 itself serves, and the other workers only see the pages it warms
+through a shared DIANPING_CACHE_DB; set one when warming with several workers.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+WARM_ENABLED = os.environ.get("DIANPING_WARM", "0") == "1"
+# Only one mcp_pipe.py worker warms
+WARM_WORKER = os.environ.get("MCP_PIPE_WORKER", "0") == "0"
+# Refresh budget in pages per second, and how close to expiry a page is refreshed
+WARM_RATE = float(os.environ.get("DIANPING_WARM_RATE", "0.2"))
+WARM_MARGIN = float(os.environ.get("DIANPING_WARM_MARGIN", "0.2"))
+WARM_MAX_TARGETS = int(os.environ.get("DIANPING_WARM_MAX_TARGETS", "200"))
+WARM_HALF_LIFE = float(os.environ.get("DIANPING_WARM_HALF_LIFE", "21600"))
+# Seed subset: comma-separated names, "*" for all (no regions by default)
+WARM_CITIES = os.environ.get("DIANPING_WARM_CITIES", "beijing,shanghai")
+WARM_CATEGORIES = os.environ.get("DIANPING_WARM_CATEGORIES", "美食")
+WARM_REGIONS = os.environ.get("DIANPING_WARM_REGIONS", "")
+WARM_SORTS = os.environ.get("DIANPING_WARM_SORTS", "智能排序")
+
+SEED_WEIGHT = 0.5
+MAX_TRACKED = 1000
+# Pause between passes
+PASS_INTERVAL = 30
+
+
+def parse_list(value: str) -> list:
+    return [part.strip() for part in value.split(",") if part.strip()]
+
+
+def _pick(index, wanted: list) -> list:
+    """Resolve wanted names against a NameIndex ("*" means all of them)"""
+    if "*" in wanted:
+        return list(index.names)
+    names = []
+    for query in wanted:
+        name, _ = index.resolve(query)
+        if name is None:
+            logger.warning(f"Cache warmer: '{query}' not found, skipped")
+        elif name not in names:
+            names.append(name)
+    return names
+
+
+def seed_combinations(catalog, sorts: list, cities=None, categories=None, regions=None, warm_sorts=None) -> list:
+    """(city, category, region, sort) tuples of the configured seed subset
+
+    Args:
+        catalog: the Catalog to resolve names against
+        sorts: every valid sort name
+        cities, categories, regions, warm_sorts: name lists; default to the DIANPING_WARM_* settings
+    """
+    cities = parse_list(WARM_CITIES) if cities is None else cities
+    categories = parse_list(WARM_CATEGORIES) if categories is None else categories
+    regions = parse_list(WARM_REGIONS) if regions is None else regions
+    warm_sorts = parse_list(WARM_SORTS) if warm_sorts is None else warm_sorts
+
+    if "*" in warm_sorts:
+        warm_sorts = list(sorts)
+    unknown = [sort for sort in warm_sorts if sort not in sorts]
+    for sort in unknown:
+        logger.warning(f"Cache warmer: sort '{sort}' not found, skipped")
+    warm_sorts = [sort for sort in warm_sorts if sort not in unknown]
+
+    combinations = []
+    for city in _pick(catalog.cities, cities):
+        city_regions = [""]
+        if regions:
+            if "*" in regions:
+                city_regions = list(catalog.city_regions[city].names)
+            else:
+                # Region lists usually name places in one city; skip the others quietly
+                city_regions = [name for name in (catalog.city_regions[city].resolve(region)[0] for region in regions) if name]
+        for category in _pick(catalog.categories, categories):
+            for region in city_regions:
+                for sort in warm_sorts:
+                    combinations.append((city, category, region, sort))
+    return combinations
+
+
+class CacheWarmer:
+    """Keep the most-wanted list pages cached ahead of demand"""
+
+    def __init__(self, refresh, expiry, ttl: float, rate=None, margin=None, max_targets=None, half_life=None):
+        """
+        Args:
+            refresh: async function(url) scraping a page into the cache; returns a result dict
+            expiry: function(url) returning the cached entry's expiry (epoch seconds) or None
+            ttl: how long a refreshed page stays cached
+        """
+        self.refresh = refresh
+        self.expiry = expiry
+        self.ttl = ttl
+        self.rate = WARM_RATE if rate is None else rate
+        self.margin = WARM_MARGIN if margin is None else margin
+        self.max_targets = max_targets or WARM_MAX_TARGETS
+        self.half_life = half_life or WARM_HALF_LIFE
+        self.seeds = []
+        self._seed_set = set()
+        # url -> (decayed request count, when it was last updated)
+        self._demand = {}
+        self._task = None
+        self.requests = 0
+        self.warm_hits = 0
+        self.refreshed = 0
+        self.failed = 0
+        self.passes = 0
+
+    def _decayed(self, url: str, now: float) -> float:
+        score, updated = self._demand.get(url, (0.0, now))
+        return score * math.exp(-math.log(2) * (now - updated) / self.half_life)
+
+    def record(self, url: str, hit: bool):
+        """Count a request for url, and whether the cache already had it"""
+        now = time.time()
+        self._demand[url] = (self._decayed(url, now) + 1, now)
+        self.requests += 1
+        if hit:
+            self.warm_hits += 1
+        if len(self._demand) > MAX_TRACKED:
+            coldest = min(self._demand, key=lambda u: self._decayed(u, now))
+            del self._demand[coldest]
+
+    def priority(self, url: str, now=None) -> float:
+        now = time.time() if now is None else now
+        seed = SEED_WEIGHT if url in self._seed_set else 0.0
+        return self._decayed(url, now) + seed
+
+    def targets(self, now=None) -> list:
+        """The top max_targets pages by priority"""
+        now = time.time() if now is None else now
+        candidates = list(dict.fromkeys(list(self._demand) + self.seeds))
+        candidates.sort(key=lambda url: -self.priority(url, now))
+        return candidates[:self.max_targets]
+
+    def is_due(self, url: str, now=None) -> bool:
+        now = time.time() if now is None else now
+        expires_at = self.expiry(url)
+        return expires_at is None or expires_at - now < self.margin * self.ttl
+
+    def set_seeds(self, seeds: list):
+        self.seeds = list(dict.fromkeys(seeds))
+        self._seed_set = set(self.seeds)
+
+    async def warm_once(self) -> int:
+        """Refresh every due target in priority order; returns how many were refreshed"""
+        self.passes += 1
+        refreshed = 0
+        for url in self.targets():
+            if not self.is_due(url):
+                continue
+            if refreshed and self.rate > 0:
+                await asyncio.sleep(1 / self.rate)
+            try:
+                result = await self.refresh(url)
+            except Exception as e:
+                result = {"success": False, "error": str(e)}
+            if not result.get("success"):
+                self.failed += 1
+                logger.info(f"Cache warmer paused until the next pass: {url}: {result.get('error')}")
+                break
+            refreshed += 1
+            self.refreshed += 1
+        return refreshed
+
+    async def run(self):
+        while True:
+            try:
+                if await self.warm_once():
+                    logger.info(f"Cache warmer: {self.stats()}")
+            except Exception as e:
+                logger.warning(f"Cache warm pass failed: {e}")
+            await asyncio.sleep(PASS_INTERVAL)
+
+    def start(self, seeds: list):
+        """Start warming in the background (in the running event loop)"""
+        self.set_seeds(seeds)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+            logger.info(f"Cache warmer started with {len(self.seeds)} seed pages")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        """Progress and coverage: how many targets are cached, and how much of the demand they cover"""
+        now = time.time()
+        targets = self.targets(now)
+        warm = [url for url in targets if not self._expired(url, now)]
+        demand = {url: self._decayed(url, now) for url in self._demand}
+        total_demand = sum(demand.values())
+        warm_demand = sum(weight for url, weight in demand.items() if not self._expired(url, now))
+        return {
+            "targets": len(targets),
+            "warm": len(warm),
+            "coverage": round(len(warm) / len(targets), 3) if targets else 0.0,
+            "demand_coverage": round(warm_demand / total_demand, 3) if total_demand else 0.0,
+            "requests": self.requests,
+            "warm_hit_ratio": round(self.warm_hits / self.requests, 3) if self.requests else 0.0,
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+            "passes": self.passes,
+        }
+
+    def _expired(self, url: str, now: float) -> bool:
+        expires_at = self.expiry(url)
+        return expires_at is None or expires_at <= now